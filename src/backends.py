@@ -0,0 +1,184 @@
+################################################################################
+# Model backends
+#
+# Where the completions come from, picked with MODEL_BACKEND:
+# - "hub" (the default): the hosted inference API (or INFERENCE_ENDPOINT), through the
+#   shared client - the only one which needs an API token;
+# - "standin": a local stand-in endpoint (see standin_server), started in-process unless
+#   STANDIN_URL points at one already running, with STANDIN_LATENCY & co. for its latency and
+#   canned replies - or, with STANDIN_REPLIES=<recording>, the replies recorded there;
+# - "replay": no endpoint at all, the replies recorded in RESPONSES_FILE by an earlier run
+#   are served back, looked up by prompt and parameters (seed included, so run with the
+#   same RUN_SEED as the recording), or by prompt alone if REPLAY_STRICT=0.
+# RECORD_RESPONSES=1 appends every completion (whatever the backend) to RESPONSES_FILE.
+#
+# With either of the last two, the whole pipeline can be run - and its compilation and
+# testing throughput profiled - offline and deterministically.
+
+import json
+import os
+import threading
+
+from inference import HUB_ENDPOINT, INFERENCE_ENDPOINT, generate, generate_batch, stream_generation
+from inference_client import InferenceError
+from llm_cache import hash_parts
+
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "hub")
+RESPONSES_FILE = os.environ.get(
+  "RESPONSES_FILE", os.path.expanduser("~/.cache/llm-exercise/responses.jsonl")
+)
+RECORD_RESPONSES = os.environ.get("RECORD_RESPONSES") == "1"
+REPLAY_STRICT = os.environ.get("REPLAY_STRICT", "1") == "1"
+STANDIN_URL = os.environ.get("STANDIN_URL")
+STANDIN_REPLIES = os.environ.get("STANDIN_REPLIES")
+
+################################################################################
+
+class ReplayMiss(InferenceError):
+  pass
+
+class Model:
+  # What create_model used to get from langchain's HuggingFaceHub (which needed a token
+  # even just to be built): which model, with which parameters, and where to ask for it
+  def __init__(self, backend, repo_id, huggingfacehub_api_token = None, task = "text-generation", model_kwargs = None):
+    self.backend = backend
+    self.repo_id = repo_id
+    self.huggingfacehub_api_token = huggingfacehub_api_token
+    self.task = task
+    self.model_kwargs = model_kwargs or {}
+
+class Recorder:
+  def __init__(self, path = RESPONSES_FILE, enabled = RECORD_RESPONSES):
+    self.path = path
+    self.enabled = enabled
+    self.lock = threading.Lock()
+
+  def record(self, request, reply):
+    if not self.enabled:
+      return
+    line = json.dumps({ "prompt": request.prompt, "parameters": request.parameters, "reply": reply })
+    with self.lock:
+      os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+      with open(self.path, "a") as recording:
+        recording.write(line + "\n")
+
+recorder = Recorder()
+
+def load_recording(path):
+  # -> [ (prompt, parameters, reply) ], in the order they were recorded
+  entries = []
+  with open(path, "r") as recording:
+    for line in recording:
+      try:
+        entry = json.loads(line)
+        entries.append((entry["prompt"], entry["parameters"], entry["reply"]))
+      except (ValueError, KeyError):
+        continue # e.g. a line cut short by a crash
+  return entries
+
+class HubBackend:
+  name = "hub"
+  needs_token = True
+  # Part of the response cache's key (see llm_cache), None keeping the keys from before
+  cache_namespace = None
+
+  def create_model(self, **kwargs):
+    return Model(self, **kwargs)
+
+  def summary(self):
+    return self.name
+
+  def endpoint(self, repo_id):
+    return INFERENCE_ENDPOINT or HUB_ENDPOINT + repo_id
+
+  def generate(self, request):
+    reply = generate(request)
+    recorder.record(request, reply)
+    return reply
+
+  def generate_batch(self, requests):
+    replies = generate_batch(requests)
+    for request, reply in zip(requests, replies):
+      recorder.record(request, reply)
+    return replies
+
+  def stream(self, request):
+    # closing it early (see inference.stream_until_code_closes) means only what was
+    # actually received gets recorded
+    text = ""
+    try:
+      for token in stream_generation(request):
+        text += token
+        yield token
+    finally:
+      recorder.record(request, text)
+
+class StandinBackend(HubBackend):
+  name = "standin"
+  needs_token = False
+  cache_namespace = "standin"
+
+  def __init__(self, url = STANDIN_URL, replies = STANDIN_REPLIES):
+    self.url = url
+    self.replies = replies
+    self.lock = threading.Lock()
+
+  def endpoint(self, repo_id):
+    with self.lock:
+      if self.url is None:
+        from standin_server import start_standin_server
+        recorded = { prompt: reply for prompt, _, reply in load_recording(self.replies) } if self.replies else {}
+        self.url = start_standin_server(replies=recorded).url
+    return self.url
+
+class ReplayBackend(HubBackend):
+  name = "replay"
+  needs_token = False
+  cache_namespace = "replay"
+
+  def __init__(self, path = RESPONSES_FILE, strict = REPLAY_STRICT):
+    self.path = path
+    self.strict = strict
+    self.replies = None
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def endpoint(self, repo_id):
+    return "replay:" + self.path
+
+  def lookup(self, request):
+    with self.lock:
+      if self.replies is None:
+        # the latest recording of a prompt wins
+        self.replies = {}
+        for prompt, parameters, reply in load_recording(self.path):
+          self.replies[hash_parts(prompt, parameters)] = reply
+          self.replies[hash_parts(prompt)] = reply
+      reply = self.replies.get(hash_parts(request.prompt, request.parameters))
+      if reply is None and not self.strict:
+        reply = self.replies.get(hash_parts(request.prompt))
+      if reply is None:
+        self.misses += 1
+        raise ReplayMiss(f"No recorded reply for this prompt (and parameters) in {self.path}")
+      self.hits += 1
+      return reply
+
+  def summary(self):
+    with self.lock:
+      return f"{self.name} from {self.path}, {self.hits} replies served, {self.misses} missing"
+
+  def generate(self, request):
+    return self.lookup(request)
+
+  def generate_batch(self, requests):
+    return [ self.lookup(request) for request in requests ]
+
+  def stream(self, request):
+    yield self.lookup(request)
+
+BACKENDS = { "hub": HubBackend, "standin": StandinBackend, "replay": ReplayBackend }
+
+if MODEL_BACKEND not in BACKENDS:
+  raise ValueError(f"Unknown MODEL_BACKEND {MODEL_BACKEND}, expected one of {', '.join(BACKENDS)}")
+model_backend = BACKENDS[MODEL_BACKEND]()
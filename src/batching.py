@@ -0,0 +1,70 @@
+################################################################################
+# Micro-batching - requests coming from concurrent workers are grouped up and handed
+# over together to whatever handles them, with each worker getting its own result back
+#
+# A batch is sent as soon as it's full, or once its oldest request has waited max_wait
+# seconds, whichever comes first.
+
+import threading
+import time
+from concurrent.futures import Future
+
+print_error = lambda arg: print("[ERROR] " + str(arg))
+
+################################################################################
+
+class MicroBatcher:
+  def __init__(self, process_batch, max_batch_size, max_wait):
+    # process_batch takes a list of requests, and returns a list with one result per request
+    # (in the same order); an exception it raises goes to every request in the batch
+    self.process_batch = process_batch
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait
+    self.condition = threading.Condition()
+    self.pending = [] # (request, future, time it was submitted)
+    self.thread = None
+    self.batches = 0
+    self.requests = 0
+
+  def submit(self, request):
+    future = Future()
+    with self.condition:
+      self.pending.append((request, future, time.monotonic()))
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+      self.condition.notify()
+    return future
+
+  def run(self, request):
+    # blocking version of submit
+    return self.submit(request).result()
+
+  def next_batch(self):
+    with self.condition:
+      while not self.pending:
+        self.condition.wait()
+      deadline = self.pending[0][2] + self.max_wait
+      while len(self.pending) < self.max_batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          break
+        self.condition.wait(remaining)
+      batch = self.pending[:self.max_batch_size]
+      self.pending = self.pending[self.max_batch_size:]
+      return batch
+
+  def loop(self):
+    while True:
+      batch = self.next_batch()
+      self.batches += 1
+      self.requests += len(batch)
+      try:
+        results = self.process_batch([ request for request, _, _ in batch ])
+        for (_, future, _), result in zip(batch, results):
+          future.set_result(result)
+      except Exception as e:
+        print_error(f"Batch of {len(batch)} failed: {e}")
+        for _, future, _ in batch:
+          if not future.done():
+            future.set_exception(e)
@@ -0,0 +1,136 @@
+################################################################################
+# Best-of-N first translations, raced
+#
+# A translation that fails only ever got better one repair round after another, each one
+# waiting for the previous generation, compilation and tests. With BEST_OF_N set (above 1),
+# a submission's first translation is N of them instead, asked for all at once with seeds
+# of their own, each written to its own candidate directory and compiled and tested as
+# soon as it comes back. The first one to pass is the one kept; everything else is
+# cancelled, and the round goes on without waiting for them: the candidates still queued
+# never start, the tests being run are killed (see test_runner.cancellable), and the
+# generations in flight, streamed or not, are hung up on (see inference_client). If none
+# passes, the closest one (see repair.closeness) is kept, and the repair rounds go on
+# from it as they would have.
+#
+# For each submission, which of its candidates passed - in the order they were judged in -
+# and how long the first success took (wall-clock, from the moment they were all asked
+# for) is recorded as a "best of n" event (see tracing, and results_store's pass-at-k),
+# and summed up at the end of a sweep as pass@k: the share of submissions with a passing
+# candidate among the first k judged. BEST_OF_N_WORKERS caps how many candidates are in
+# flight at once (0 for all N).
+
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from repair import closeness
+from test_runner import Cancellation, Cancelled, cancellable
+from tracing import tracer
+
+BEST_OF_N = int(os.environ.get("BEST_OF_N", 1))
+BEST_OF_N_WORKERS = int(os.environ.get("BEST_OF_N_WORKERS", 0))
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+
+################################################################################
+
+class BestOfNStats:
+  def __init__(self, n = BEST_OF_N):
+    self.n = n
+    self.lock = threading.Lock()
+    self.submissions = 0
+    self.judged = 0
+    self.cancelled = 0
+    # k -> submissions with a passing candidate among the first k judged
+    self.passed_within = [ 0 ] * (n + 1)
+    self.first_successes = [] # in seconds
+
+  def record(self, verdicts, cancelled, first_success):
+    # verdicts are the judged candidates' results, in the order they were judged
+    with self.lock:
+      self.submissions += 1
+      self.judged += len(verdicts)
+      self.cancelled += cancelled
+      if "TEST_SUCCESS" in verdicts:
+        for k in range(verdicts.index("TEST_SUCCESS") + 1, self.n + 1):
+          self.passed_within[k] += 1
+      if first_success is not None:
+        self.first_successes.append(first_success)
+
+  def summary(self):
+    with self.lock:
+      if not self.submissions:
+        return "no submission raced"
+      pass_at_k = ", ".join([
+        f"pass@{k} {self.passed_within[k] / self.submissions:.2f}" for k in range(1, self.n + 1)
+      ])
+      first_success = (
+        f"time to first success: median {statistics.median(self.first_successes):.2f}s, max {max(self.first_successes):.2f}s"
+        if self.first_successes else "no success"
+      )
+      return (
+        f"{self.submissions} submissions, {self.judged} of {self.submissions * self.n} candidates judged "
+        f"({self.cancelled} cancelled); {pass_at_k}; {first_success}"
+      )
+
+best_of_n_stats = BestOfNStats()
+
+def race(n, run_candidate, workers = BEST_OF_N_WORKERS):
+  # run_candidate(index) -> (QueryResult, whatever else the caller needs of it), for
+  # candidates 0 to n - 1, each in a thread of its own -> [ (index, QueryResult, anything
+  # else) ] in the order they were judged, the one that's kept - the first to pass, or the
+  # closest - and how many seconds the first success took (None if there's none)
+  group = Cancellation()
+  tags = tracer.tags()
+  judged = []
+  errors = []
+  first_success = None
+  started = time.perf_counter()
+
+  def run(index):
+    # within the round's own tracing context, and stopped along with the others
+    with tracer.context(**tags, candidate=index), cancellable(group):
+      if group.cancelled():
+        raise Cancelled()
+      return run_candidate(index)
+
+  executor = ThreadPoolExecutor(max_workers=workers or n)
+  try:
+    futures = { executor.submit(run, index): index for index in range(n) }
+    for future in as_completed(futures):
+      try:
+        result, extra = future.result()
+      except Cancelled:
+        continue
+      except Exception as e:
+        errors.append(e)
+        continue
+      judged.append((futures[future], result, extra))
+      if result.result == "TEST_SUCCESS":
+        first_success = time.perf_counter() - started
+        print_debug(f"Candidate {futures[future]} passed after {first_success:.2f}s, cancelling the others")
+        group.cancel()
+        break
+  finally:
+    # the round doesn't wait for the candidates still in flight: the queued ones never
+    # start, and the others give up as soon as they're cancelled (their tests killed, their
+    # generations hung up on)
+    executor.shutdown(wait=False, cancel_futures=True)
+  cancelled = n - len(judged) - len(errors)
+
+  if not judged:
+    # not a single candidate to show for it: up to the scheduler (e.g. inference unavailable)
+    raise errors[0] if errors else Cancelled()
+  verdicts = [ result.result for _, result, _ in judged ]
+  best_of_n_stats.record(verdicts, cancelled, first_success)
+  tracer.event(
+    "best of n", candidates=n, judged=len(judged), cancelled=cancelled, passed=verdicts.count("TEST_SUCCESS"),
+    first_success=first_success, first_success_rank=verdicts.index("TEST_SUCCESS") + 1 if first_success is not None else None
+  )
+  if first_success is not None:
+    kept = next(candidate for candidate in judged if candidate[1].result == "TEST_SUCCESS")
+  else:
+    kept = max(judged, key=lambda candidate: closeness(candidate[1]))
+  return judged, kept, first_success
@@ -0,0 +1,109 @@
+################################################################################
+# Checkpointed and incremental sweeps
+#
+# An interrupted (or crashed) sweep used to start over from the first benchmark, redoing
+# every query and compilation. With CHECKPOINT set, every submission that's done is
+# appended (and fsync'ed) to a checkpoint file as soon as it is, along with a fingerprint
+# of everything its translation depends on - its C source, the prompt templates, the model
+# and its parameters, the tests - and the next run can skip it:
+# - CHECKPOINT=resume skips whatever the interrupted run got done, fingerprints aside;
+#   once a run gets to the end, the next one starts over;
+# - CHECKPOINT=incremental only skips the submissions whose fingerprint is the same as the
+#   last time they were done, whenever that was, so only what changed is redone.
+# Submissions which didn't get a proper chance (the inference API being unavailable, an
+# error in the harness, the sweep's deadline) are never considered done.
+
+import json
+import os
+import threading
+import time
+
+CHECKPOINT = os.environ.get("CHECKPOINT", "")
+CHECKPOINT_DIR = os.environ.get(
+  "CHECKPOINT_DIR", os.path.expanduser("~/.cache/llm-exercise/checkpoints")
+)
+
+MODES = ( "", "resume", "incremental" )
+# outcomes (see repair.Repair) which say more about the run than about the submission
+UNSETTLED = { "inference unavailable", "error", "sweep deadline" }
+
+################################################################################
+
+class Checkpoint:
+  def __init__(self, name, mode = CHECKPOINT, directory = CHECKPOINT_DIR):
+    if mode not in MODES:
+      raise ValueError(f"Unknown CHECKPOINT {mode}, expected resume or incremental")
+    self.path = os.path.join(directory, name + ".jsonl")
+    self.mode = mode
+    self.lock = threading.Lock()
+    self.file = None
+    self.done = {} # submission -> fingerprint, the latest one it was done with
+    self.skipped = 0
+    self.recorded = 0
+    if mode:
+      self.load()
+
+  def load(self):
+    if not os.path.exists(self.path):
+      return
+    with open(self.path, "r") as checkpoint:
+      for line in checkpoint:
+        try:
+          entry = json.loads(line)
+        except ValueError:
+          continue # the line being written when the run was killed
+        if entry.get("complete"):
+          # what a complete run did is no reason to skip anything when resuming
+          if self.mode == "resume":
+            self.done = {}
+        else:
+          self.done[entry["submission"]] = entry["fingerprint"]
+
+  def is_done(self, fingerprints):
+    # fingerprints is submission -> fingerprint, for submissions which are done with the
+    # same translation (see dedup), and so are only skipped together
+    if not self.mode:
+      return False
+    with self.lock:
+      done = all(
+        submission in self.done and (self.mode == "resume" or self.done[submission] == fingerprint)
+        for submission, fingerprint in fingerprints.items()
+      )
+      self.skipped += len(fingerprints) if done else 0
+    return done
+
+  def append(self, entry):
+    # must be called with the lock held
+    if self.file is None:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self.file = open(self.path, "a")
+      if self.file.tell() and not self.ends_with_newline():
+        # a line cut short by a crash: what comes next mustn't end up on it too
+        self.file.write("\n")
+    self.file.write(json.dumps(entry) + "\n")
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+  def ends_with_newline(self):
+    with open(self.path, "rb") as checkpoint:
+      checkpoint.seek(-1, os.SEEK_END)
+      return checkpoint.read(1) == b"\n"
+
+  def record(self, submission, fingerprint, outcome):
+    if not self.mode or outcome in UNSETTLED:
+      return
+    with self.lock:
+      self.append({ "submission": submission, "fingerprint": fingerprint, "outcome": outcome, "time": time.time() })
+      self.done[submission] = fingerprint
+      self.recorded += 1
+
+  def complete(self):
+    # the whole sweep got done
+    if not self.mode:
+      return
+    with self.lock:
+      self.append({ "complete": True, "time": time.time() })
+
+  def summary(self):
+    with self.lock:
+      return f"{self.mode}, {self.skipped} submissions skipped, {self.recorded} recorded in {self.path}"
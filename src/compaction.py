@@ -0,0 +1,192 @@
+################################################################################
+# Compact repair prompts
+#
+# A repair prompt used to get the whole of rustc's stderr, or the whole of the expected and
+# actual outputs: a cascade of the same error, or a translation printing without end, made
+# for enormous prompts (slower inference, more tokens) or even ones past the context window.
+# Now, what goes in the prompt is:
+# - for a compilation error, only the errors (no warnings), each once - the same code and
+#   message on another line is counted, not repeated - with its primary span: where it is,
+#   the source line there, its label and first notes (see rust_build.summarize_diagnostic);
+# - for a test failure, the first line where the outputs diverge (and the one before it),
+#   cut down around the first differing character if it's a long one, and how much more
+#   there was;
+# and all of it is held to PROMPT_TOKEN_BUDGET, counting the template and the C code (which
+# are never cut) - with MIN_FEEDBACK_TOKENS left for the feedback, whatever the code's size.
+# How many tokens that saved is recorded as a "compaction" event (see tracing), and in the
+# summary at the end of a sweep. COMPACT_PROMPTS=0 to send everything, as it was.
+
+import os
+import re
+import threading
+
+from repair import estimate_tokens
+from tracing import tracer
+
+COMPACT_PROMPTS = os.environ.get("COMPACT_PROMPTS", "1") == "1"
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 2048))
+MIN_FEEDBACK_TOKENS = int(os.environ.get("MIN_FEEDBACK_TOKENS", 256))
+# how much of a long line is kept, around where it diverges
+LINE_WIDTH = 200
+
+# what test_runner.CaseResult.feedback_output appends to the output of a timeout or a crash
+EXIT_NOTE = re.compile(r"\n\((?:timed out|crashed): .*\Z", re.DOTALL)
+
+################################################################################
+
+class CompactionStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.prompts = 0
+    self.raw_tokens = 0
+    self.tokens = 0
+
+  def record(self, raw_tokens, tokens):
+    with self.lock:
+      self.prompts += 1
+      self.raw_tokens += raw_tokens
+      self.tokens += tokens
+
+  def summary(self):
+    with self.lock:
+      return (
+        f"{self.prompts} repair prompts, {self.raw_tokens} feedback tokens down to {self.tokens} "
+        f"({self.raw_tokens - self.tokens} saved)"
+      )
+
+compaction_stats = CompactionStats()
+
+def feedback_budget(template, code):
+  # -> how many tokens the feedback gets, once the template and the code are in
+  return max(MIN_FEEDBACK_TOKENS, PROMPT_TOKEN_BUDGET - estimate_tokens(template, code))
+
+def truncate(text, tokens):
+  if estimate_tokens(text) <= tokens:
+    return text
+  return text[:tokens * 4] + "\n(truncated)"
+
+def record(kind, raw, compacted):
+  raw_tokens, tokens = estimate_tokens(*raw), estimate_tokens(*compacted)
+  compaction_stats.record(raw_tokens, tokens)
+  tracer.event("compaction", kind=kind, raw_tokens=raw_tokens, tokens=tokens)
+
+################################################################################
+# Compilation errors
+
+def format_diagnostic(diagnostic, repeats = 0):
+  code = f"[{diagnostic['code']}]" if diagnostic["code"] else ""
+  lines = [ f"{diagnostic['level']}{code}: {diagnostic['message']}" ]
+  if diagnostic["file"]:
+    lines.append(f"  --> {diagnostic['file']}:{diagnostic['line']}:{diagnostic['column']}")
+  if diagnostic["text"] is not None:
+    lines.append(f"   | {diagnostic['text'].strip()}")
+  if diagnostic["label"]:
+    lines.append(f"   = {diagnostic['label']}")
+  lines += [ f"   = {note}" for note in diagnostic["notes"] ]
+  if repeats:
+    lines.append(f"   (and {repeats} more time{'s' if repeats > 1 else ''}, elsewhere)")
+  return "\n".join(lines)
+
+def compact_diagnostics(diagnostics):
+  # -> the errors, deduplicated, as text blocks
+  errors = {} # (code, message) -> [ the first one, how many more ]
+  for diagnostic in diagnostics:
+    if not (diagnostic["level"] or "").startswith("error"):
+      continue
+    if diagnostic["file"] is None and diagnostic["message"].startswith("aborting due to"):
+      continue # rustc's own count, nothing to fix there
+    key = (diagnostic["code"], diagnostic["message"])
+    if key in errors:
+      errors[key][1] += 1
+    else:
+      errors[key] = [ diagnostic, 0 ]
+  return [ format_diagnostic(diagnostic, repeats) for diagnostic, repeats in errors.values() ]
+
+def compact_rendered(stderr):
+  # The same, for rustc's human-readable output (e.g. a verdict cached before there were
+  # diagnostics): its error blocks, each once
+  blocks = []
+  for block in re.split(r"\n\s*\n", stderr):
+    block = block.strip("\n")
+    if block.startswith("error") and not block.startswith("error: aborting due to") and block not in blocks:
+      blocks.append(block)
+  return blocks
+
+def compact_compilation_error(result, template, code):
+  # result is the QueryResult of the failed compilation -> what the repair prompt gets told
+  if not COMPACT_PROMPTS:
+    return result.error
+  diagnostics = getattr(result, "diagnostics", None)
+  blocks = compact_diagnostics(diagnostics) if diagnostics else compact_rendered(result.error or "")
+  if not blocks:
+    # nothing that looks like rustc's errors, e.g. cargo failing on its own
+    compacted = truncate(result.error or "", feedback_budget(template, code))
+    record("compilation error", [ result.error ], [ compacted ])
+    return compacted
+  budget = feedback_budget(template, code)
+  kept = []
+  for block in blocks:
+    if kept and estimate_tokens(*kept, block) > budget:
+      break
+    kept.append(block)
+  if len(kept) < len(blocks):
+    kept.append(f"(and {len(blocks) - len(kept)} more errors)")
+  compacted = truncate("\n\n".join(kept), budget)
+  record("compilation error", [ result.error ], [ compacted ])
+  return compacted
+
+################################################################################
+# Test failures
+
+def cut_line(line, column, width = LINE_WIDTH):
+  # a long line, down to width characters around column
+  if len(line) <= width:
+    return line
+  start = max(0, min(column - width // 2, len(line) - width))
+  return ("..." if start > 0 else "") + line[start:start + width] + ("..." if start + width < len(line) else "")
+
+def first_divergence(expected, actual):
+  # -> (the expected and actual lines, from the one before the first that differs to that
+  # one, and that one's number), or None if they're the same but for their line endings
+  expected_lines = expected.splitlines()
+  actual_lines = actual.splitlines()
+  for number in range(max(len(expected_lines), len(actual_lines))):
+    expected_line = expected_lines[number] if number < len(expected_lines) else None
+    actual_line = actual_lines[number] if number < len(actual_lines) else None
+    if expected_line != actual_line:
+      break
+  else:
+    return None
+  column = 0
+  while (
+    expected_line is not None and actual_line is not None and column < min(len(expected_line), len(actual_line))
+    and expected_line[column] == actual_line[column]
+  ):
+    column += 1
+  window = lambda lines: [ cut_line(line, column) for line in lines[max(0, number - 1):number + 1] ]
+  return window(expected_lines), window(actual_lines), number, len(expected_lines), len(actual_lines)
+
+def compact_test_failure(outputs, template, code):
+  # outputs are the failing case's (expected output, actual output) -> the same, as the
+  # repair prompt gets them
+  expected, actual = outputs
+  if not COMPACT_PROMPTS:
+    return outputs
+  expected, actual = expected or "", actual or ""
+  match = EXIT_NOTE.search(actual)
+  note = match.group() if match else ""
+  output = actual[:match.start()] if match else actual
+  divergence = first_divergence(expected, output)
+  if divergence is None:
+    compacted_expected, compacted_actual = expected, output
+  else:
+    expected_window, actual_window, number, expected_count, actual_count = divergence
+    compacted_expected = "\n".join(expected_window)
+    compacted_actual = "\n".join(actual_window)
+    if max(expected_count, actual_count) > 1:
+      where = f"(the first difference is on line {number + 1}; expected {expected_count} lines, got {actual_count})"
+      compacted_actual += "\n" + where
+  budget = feedback_budget(template, code) // 2
+  compacted = (truncate(compacted_expected, budget), truncate(compacted_actual + note, budget))
+  record("test failure", outputs, compacted)
+  return compacted
@@ -0,0 +1,51 @@
+################################################################################
+# Deduplication of equivalent student submissions
+#
+# Lots of IntroClass submissions are the same program, give or take some whitespace and
+# comments. Each submission is reduced to its token stream (comments and whitespace
+# gone, string/char literals and preprocessor lines kept as they are), and submissions
+# with the same token stream end up in the same equivalence class: only one of them
+# is translated and tested, with the result being copied over to the rest.
+
+import hashlib
+import os
+import re
+
+# DEDUP=0 to translate every single submission, equivalent or not
+DEDUP = os.environ.get("DEDUP", "1") == "1"
+
+C_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<directive>^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<literal>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<word>[A-Za-z0-9_.]+)
+  | (?P<operator><<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^]=)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+################################################################################
+
+def c_tokens(source):
+  for match in C_TOKEN.finditer(source):
+    match match.lastgroup:
+      case "comment" | "space":
+        continue
+      case "directive":
+        # whitespace inside a directive doesn't matter either, but its end of line does
+        yield " ".join(match.group().split())
+      case _:
+        yield match.group()
+
+def source_key(source):
+  return hashlib.sha256("\0".join(c_tokens(source)).encode("utf-8")).hexdigest()
+
+def equivalence_classes(members, source_of, dedup = DEDUP):
+  # members are whatever the caller wants grouped, source_of(member) being its C source;
+  # returns lists of members, the first of each one being the class's representative
+  if not dedup:
+    return [ [ member ] for member in members ]
+  classes = {}
+  for member in members:
+    classes.setdefault(source_key(source_of(member)), []).append(member)
+  return list(classes.values())
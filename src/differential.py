@@ -0,0 +1,335 @@
+################################################################################
+# Differential testing against the reference programs
+#
+# A benchmark's blackbox/whitebox suites are a handful of cases each, so a translation can
+# pass them all and still disagree with the C program on the next input. With DIFFERENTIAL=1,
+# every translation which passes its tests is also run on DIFFERENTIAL_INPUTS more:
+# - generated from the benchmark's input grammar (see GRAMMARS - three integers for median,
+#   a line of text for syllables, and so on), and
+# - mutated from its existing .in files (numbers nudged, characters inserted or dropped),
+# deterministically, from DIFFERENTIAL_SEED. The reference program (see reference) is run on
+# them once per benchmark - its outputs are kept next to its binary - and is what each
+# translation is held to, DIFFERENTIAL_BATCH inputs at a time (in parallel, like a test
+# suite); the first batch with a divergence is the last, and its first DIFFERENTIAL_REPORT
+# divergent inputs are reported. Inputs the reference program itself doesn't exit cleanly
+# on are left out: there's no right answer to hold a translation to. What a translation
+# came to is kept in the verdict cache (see verdict_cache), under its verdict's key and the
+# suite's, so the very same code isn't held to the very same inputs twice. The throughput in
+# the summary is over the wall-clock time spent with any translation being run on them.
+#
+# It also works on its own, e.g. to hold the reference program to itself:
+#
+#   python differential.py <benchmark directory> -- <command to run> [arguments]
+
+import hashlib
+import json
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from reference import compile_reference, reference_source, timeout_for
+from test_index import get_test_index
+from test_runner import CANCELLED, CRASH, PASS, TIMEOUT, CaseResult, TestCase, run_test_matrix
+from tracing import tracer
+from verdict_cache import as_text, verdict_cache
+
+DIFFERENTIAL = os.environ.get("DIFFERENTIAL") == "1"
+DIFFERENTIAL_INPUTS = int(os.environ.get("DIFFERENTIAL_INPUTS", 2000))
+DIFFERENTIAL_BATCH = int(os.environ.get("DIFFERENTIAL_BATCH", 500))
+DIFFERENTIAL_REPORT = int(os.environ.get("DIFFERENTIAL_REPORT", 3))
+DIFFERENTIAL_SEED = int(os.environ.get("DIFFERENTIAL_SEED", 0))
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+print_info = lambda arg: print("[INFO] " + str(arg))
+
+################################################################################
+# Inputs
+
+# numbers worth trying on their own, besides random ones
+BOUNDARIES = [ 0, 1, -1, 2, 9, 10, -10, 99, 100, 101, 1000, -1000, 32767, -32768 ]
+# what the text benchmarks get fed: vowels (and y) twice as likely, for syllables' sake
+ALPHABET = string.ascii_letters + string.digits + string.punctuation + " " + "aeiouyAEIOUY"
+
+def integer(rng, low = -1000, high = 1000):
+  return rng.choice(BOUNDARIES) if rng.random() < 0.2 else rng.randint(low, high)
+
+def integers(count):
+  return lambda rng: " ".join([ str(integer(rng)) for _ in range(count) ]) + "\n"
+
+def text(rng):
+  return "".join([ rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)) ]) + "\n"
+
+def digits(rng):
+  # up to ten digits, either sign - but never past what a C int holds
+  return f"{integer(rng, -2**31 + 1, 2**31 - 1) if rng.random() < 0.5 else integer(rng)}\n"
+
+def grade(rng):
+  # four decreasing thresholds (A, B, C, D), then the student's score - often right on one
+  thresholds = sorted(rng.sample(range(1, 100), 4), reverse=True)
+  score = rng.choice(thresholds) if rng.random() < 0.3 else round(rng.uniform(0, 100), rng.choice([ 0, 1, 2 ]))
+  return " ".join([ str(threshold) for threshold in thresholds ] + [ str(score) ]) + "\n"
+
+GRAMMARS = {
+  "checksum": text,
+  "digits": digits,
+  "grade": grade,
+  "median": integers(3),
+  "smallest": integers(4),
+  "syllables": text,
+}
+
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+def mutate_number(rng, token):
+  value = float(token) if "." in token else int(token)
+  mutated = rng.choice([ value + 1, value - 1, -value, 0, value * 10, integer(rng) ])
+  return str(round(mutated, 2) if isinstance(mutated, float) else mutated)
+
+def mutate(rng, input_data):
+  # a seed input with its numbers nudged, or - if it has none - with a few characters
+  # inserted, replaced or dropped (never a newline, which would end the input early)
+  if NUMBER.search(input_data):
+    return NUMBER.sub(lambda match: mutate_number(rng, match.group()) if rng.random() < 0.5 else match.group(), input_data)
+  line = input_data.rstrip("\n")
+  for _ in range(rng.randint(1, 3)):
+    position = rng.randint(0, len(line))
+    operation = rng.choice([ "insert", "replace", "drop" ])
+    if operation == "insert" or not line:
+      line = line[:position] + rng.choice(ALPHABET) + line[position:]
+    elif operation == "replace":
+      position = min(position, len(line) - 1)
+      line = line[:position] + rng.choice(ALPHABET) + line[position + 1:]
+    else:
+      position = min(position, len(line) - 1)
+      line = line[:position] + line[position + 1:]
+  return line + "\n"
+
+def generate_inputs(benchmark_name, seeds, count = DIFFERENTIAL_INPUTS, seed = DIFFERENTIAL_SEED):
+  # -> up to count distinct inputs, none of them one of the seeds (which are tested already)
+  rng = random.Random(f"{benchmark_name}:{seed}")
+  grammar = GRAMMARS.get(benchmark_name)
+  known = set(seeds)
+  inputs = []
+  # the same input twice is a waste of a run, and some grammars only have so many
+  for _ in range(count * 4):
+    if len(inputs) >= count:
+      break
+    if grammar is not None and (not seeds or rng.random() < 0.5):
+      input_data = grammar(rng)
+    elif seeds:
+      input_data = mutate(rng, rng.choice(seeds))
+    else:
+      break
+    if input_data not in known:
+      known.add(input_data)
+      inputs.append(input_data)
+  return inputs
+
+################################################################################
+# The suite: generated inputs, with the reference program's outputs as the expected ones
+
+class DifferentialSuite:
+  # Same shape as test_index.TestIndex, so it can be run like any test suite
+  def __init__(self, cases):
+    self.cases = cases
+    digest = hashlib.sha256()
+    for case in cases:
+      digest.update(json.dumps([ case.input_data, case.expected_output ]).encode("utf-8"))
+    self.hash = digest.hexdigest()
+
+def reference_outputs(binary_path, inputs):
+  # -> input -> (output, runtime) for the inputs the reference program exits cleanly on,
+  # kept next to its binary (it's deterministic, so once per binary and inputs is enough)
+  digest = hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+  outputs_path = f"{binary_path}.{digest[:16]}.outputs.json"
+  try:
+    with open(outputs_path, "r") as outputs_file:
+      return json.load(outputs_file)
+  except (FileNotFoundError, ValueError):
+    pass
+  cases = [ TestCase(f"differential/{number}", input_data, None) for number, input_data in enumerate(inputs) ]
+  report = run_test_matrix([ binary_path ], cases, cwd=os.path.dirname(binary_path), fail_fast=False, trace=False)
+  outputs = {
+    case.input_data: (result.actual_output, result.runtime)
+    for case, result in zip(cases, report.results) if result.returncode == 0 and result.status not in (TIMEOUT, CRASH)
+  }
+  temporary_path = f"{outputs_path}.{os.getpid()}.tmp"
+  with open(temporary_path, "w") as outputs_file:
+    json.dump(outputs, outputs_file)
+  os.replace(temporary_path, outputs_path)
+  return outputs
+
+suites = {} # tests dir -> Future of its DifferentialSuite
+suites_lock = threading.Lock()
+
+def build_differential_suite(index):
+  benchmark = os.path.dirname(index.tests_dir) + "/"
+  benchmark_name = os.path.basename(os.path.dirname(index.tests_dir))
+  binary_path = compile_reference(reference_source(benchmark))
+  if binary_path is None:
+    return None
+  inputs = generate_inputs(benchmark_name, [ case.input_data for case in index.cases ])
+  outputs = reference_outputs(binary_path, inputs)
+  cases = []
+  for input_data in inputs:
+    if input_data not in outputs:
+      continue
+    expected_output, runtime = outputs[input_data]
+    cases.append(TestCase(f"differential/{len(cases)}", input_data, expected_output))
+    cases[-1].timeout = timeout_for(runtime)
+  print_debug(f"Differential suite for {benchmark}: {len(cases)} inputs ({len(inputs) - len(cases)} left out)")
+  return DifferentialSuite(cases)
+
+def get_differential_suite(index):
+  # index is the benchmark's test index (see test_index) -> its DifferentialSuite, built
+  # once per benchmark; None if there's no reference program to build it from. Only the
+  # lookup is under the lock: the first thread to ask builds it, any other thread asking
+  # for the same benchmark meanwhile waits for that, and other benchmarks' go on
+  with suites_lock:
+    future = suites.get(index.tests_dir)
+    building = future is None
+    if building:
+      future = suites[index.tests_dir] = Future()
+  if building:
+    try:
+      future.set_result(build_differential_suite(index))
+    except BaseException as e:
+      future.set_exception(e)
+  return future.result()
+
+################################################################################
+
+class DifferentialStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.translations = 0
+    self.divergent = 0
+    self.cached = 0
+    self.inputs = 0
+    # wall-clock time with at least one translation being run on the inputs: summing each
+    # one's time instead would count the same seconds once per concurrent translation
+    self.seconds = 0.0
+    self.running = 0
+    self.busy_since = None
+
+  @contextmanager
+  def timing(self):
+    with self.lock:
+      if not self.running:
+        self.busy_since = time.perf_counter()
+      self.running += 1
+    try:
+      yield
+    finally:
+      with self.lock:
+        self.running -= 1
+        if not self.running:
+          self.seconds += time.perf_counter() - self.busy_since
+
+  def record(self, inputs, divergent, cached = False):
+    with self.lock:
+      self.translations += 1
+      self.divergent += divergent
+      self.cached += cached
+      self.inputs += 0 if cached else inputs
+
+  def summary(self):
+    with self.lock:
+      throughput = self.inputs / self.seconds if self.seconds else 0.0
+      return (
+        f"{self.translations} translations ({self.cached} from the cache), {self.divergent} of which diverge "
+        f"from the reference; {self.inputs} inputs in {self.seconds:.2f}s ({throughput:.0f} per second)"
+      )
+
+differential_stats = DifferentialStats()
+
+def run_differential(suite, run_matrix, batch = DIFFERENTIAL_BATCH, report = DIFFERENTIAL_REPORT):
+  # run_matrix(cases) -> a TestReport (see test_runner) -> (the first divergences, as
+  # CaseResults, and how many inputs were run)
+  divergences = []
+  inputs = 0
+  for start in range(0, len(suite.cases), batch):
+    results = run_matrix(suite.cases[start:start + batch]).results
+    inputs += sum([ result.status != CANCELLED for result in results ])
+    divergences = [ result for result in results if result.status not in (PASS, CANCELLED) ]
+    if divergences:
+      break
+  return divergences[:report], inputs
+
+def cached_differential(key, suite, run_matrix):
+  # run_differential, through the verdict cache -> (divergences, inputs run, whether it
+  # came from the cache)
+  if key is None or not verdict_cache.enabled:
+    return (*run_differential(suite, run_matrix), False)
+  key = hashlib.sha256(f"differential:{key}:{suite.hash}".encode("utf-8")).hexdigest()
+  entry = verdict_cache.lookup(key)
+  if entry is not None:
+    divergences = [ CaseResult(**divergence) for divergence in entry["divergences"] ]
+    return divergences, entry["inputs"], True
+  divergences, tested = run_differential(suite, run_matrix)
+  verdict_cache.store(key, { "inputs": tested, "divergences": [
+    {
+      "name": divergence.name, "status": divergence.status, "expected_output": as_text(divergence.expected_output),
+      "actual_output": as_text(divergence.actual_output), "returncode": divergence.returncode
+    }
+    for divergence in divergences
+  ] })
+  return divergences, tested, False
+
+def check_differential(name, index, run_matrix, key = None):
+  # For a translation which passed every test -> its first divergences from the reference
+  # program (None if there's nothing to compare it to), also recorded as a "differential"
+  # event. key is its verdict's (see verdict_cache), if it's to be cached
+  if not DIFFERENTIAL:
+    return None
+  suite = get_differential_suite(index)
+  if suite is None or not suite.cases:
+    return None
+  inputs = { case.name: case.input_data for case in suite.cases }
+  start = time.perf_counter()
+  with differential_stats.timing():
+    divergences, tested, cached = cached_differential(key, suite, run_matrix)
+  seconds = time.perf_counter() - start
+  differential_stats.record(tested, bool(divergences), cached)
+  for divergence in divergences:
+    print_debug(
+      f"{name} diverges from the reference on {inputs[divergence.name]!r} ({divergence.status}): "
+      f"expected {divergence.expected_output!r}, got {divergence.actual_output!r}"
+    )
+  tracer.event(
+    "differential", inputs=tested, seconds=seconds, cached=cached, divergences=len(divergences),
+    first_divergence=inputs[divergences[0].name] if divergences else None
+  )
+  return divergences
+
+################################################################################
+
+if __name__ == "__main__":
+  if len(sys.argv) < 4 or sys.argv[2] != "--":
+    print("Usage: python differential.py <benchmark directory> -- <command to run> [arguments]")
+    sys.exit(1)
+  benchmark = os.path.join(sys.argv[1], "")
+  command = sys.argv[3:]
+  suite = get_differential_suite(get_test_index(benchmark, [ "blackbox", "whitebox" ]))
+  if suite is None:
+    print(f"No reference program for {benchmark}")
+    sys.exit(1)
+  start = time.perf_counter()
+  divergences, tested = run_differential(
+    suite, lambda cases: run_test_matrix(command, cases, cwd=os.getcwd(), fail_fast=False, trace=False)
+  )
+  seconds = time.perf_counter() - start
+  print_info(f"{tested} inputs in {seconds:.2f}s ({tested / seconds:.0f} per second)")
+  inputs = { case.name: case.input_data for case in suite.cases }
+  for divergence in divergences:
+    print_info(
+      f"Diverges on {inputs[divergence.name]!r} ({divergence.status}): "
+      f"expected {divergence.expected_output!r}, got {divergence.actual_output!r}"
+    )
+  sys.exit(1 if divergences else 0)
@@ -0,0 +1,630 @@
+################################################################################
+# The translation engine, shared by every c-to-* script
+#
+# The four scripts used to be four copies of the same sweep - walking IntroClass, creating
+# the tests, running them, setting the model up - which only differed in their prompts,
+# how a translation gets built and run, and where it's written. They're now frontends for
+# this engine, with what does differ as a target (see RustTarget and PythonTarget), and it
+# can do several targets in a single pass:
+#
+#   python engine.py rust python             # every student submission, both ways
+#   python engine.py --correct rust python   # the reference programs
+#
+# Each C source is read (and deduplicated, see dedup) once, whatever the number of targets;
+# every target's translation of it then goes to the same repair scheduler (see repair),
+# which spreads them across WORKERS per target, along with the test index, the model
+# client, the LLM and verdict caches, the reference programs and their measurements - so a
+# sweep of both targets takes about as long as its slowest one, rather than the two of
+# them back to back. Each target keeps its own totals, checkpoint and results-store run.
+
+import os
+import shutil
+import subprocess
+import sys
+from backends import model_backend
+from best_of_n import BEST_OF_N, best_of_n_stats, race
+from checkpoint import CHECKPOINT, Checkpoint
+from compaction import COMPACT_PROMPTS, compact_compilation_error, compact_test_failure, compaction_stats
+from dedup import equivalence_classes
+from differential import DIFFERENTIAL, check_differential, differential_stats
+from inference import BATCH_INFERENCE, STREAM_INFERENCE, inference_batcher, make_chain, stream_stats
+from inference_client import client_stats
+from langchain.prompts import PromptTemplate
+from llm_cache import RUN_SEED, hash_parts, pick_seed, response_cache
+from reference import check_performance, performance_stats
+from repair import Repair, RepairBudget, RepairScheduler, estimate_tokens
+from results_store import RUN_ID, ResultsStore, results_store
+from rust_build import compile_rust, compile_stats, rust_toolchain, scaffold_rust
+from sweep import WORKERS, Totals
+from test_index import LINK_TESTS, get_test_index, link_tests
+from test_runner import check_cancelled, run_test_matrix
+from tracing import span, submission_tags, tracer
+from verdict_cache import toolchain_version, verdict_cache, verdict_key
+from warm_runner import WARM_INTERPRETER, run_warm_test_matrix
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+print_info = lambda arg: print("[INFO] " + str(arg))
+print_error = lambda arg: print("[ERROR] " + str(arg))
+
+################################################################################
+
+# Pass False as an argument if you don't use agenix (slash if you aren't me)
+def get_api_token(agenix = True):
+  if agenix:
+    pwd = os.getcwd()
+    os.chdir(os.environ.get("HOME") + "/gaspafiles/secrets")
+    key = subprocess.check_output(
+      ["agenix", "-d", "hugging-face.age"]
+    ).decode("utf-8").replace("\n", "")
+    os.chdir(pwd)
+    return key
+  # Otherwise just have a .env file and have your API key there, read it and so on
+  return os.environ.get("HUGGING_FACE_API_KEY")
+
+MODEL = "HuggingFaceH4/starchat-beta"
+# only the hosted API needs one (see backends)
+API_TOKEN = get_api_token() if model_backend.needs_token else None
+
+def create_model(seed):
+  return model_backend.create_model(
+    repo_id=MODEL,
+    huggingfacehub_api_token=API_TOKEN,
+    task = "text-generation",
+    model_kwargs = {
+      "max_new_tokens": 512,
+      "repetition_penalty": 1.05,
+      "temperature": 0.15,
+      "top_p": 0.975,
+      "return_full_text": True,
+      "seed": seed,
+    }
+)
+
+################################################################################
+
+SRC_DIR = os.getcwd()
+BENCHMARK_LOCATION = SRC_DIR + "/../data/IntroClass/"
+BENCHMARKS = [
+  BENCHMARK_LOCATION + b for b in [ "checksum/", "digits/", "grade/", "median/", "smallest/", "syllables/" ]
+]
+TO_AVOID = [ "tests" ]
+TEST_TYPES = [ "blackbox", "whitebox" ]
+
+# what gets translated: every student submission, or each benchmark's reference program
+SUBMISSIONS = "submissions"
+REFERENCE = "reference"
+
+# I want objects which have both _what happened_ and also, if there was an error, its error code
+# This is useful to re-ask the model to fix the code, considering the error code
+# Moreover, for test failures, we can also give back the expected output and the actual output
+class QueryResult:
+  def __init__(self, result, error = None, outputs = None, matrix = None, diagnostics = None):
+    # Note that result is a string, which may be "COMPILER_FAILURE", "TEST_FAILURE" or "TEST_SUCCESS"
+    self.result = result
+    self.error = error
+    self.outputs = outputs # a tuple with two strings, the expected output and the actual output
+    self.matrix = matrix # the status/runtime of every single test case, see test_runner.TestReport.matrix
+    self.diagnostics = diagnostics # rustc's, summarized (see rust_build.summarize_diagnostic)
+
+def create_tests(output_dir, tests):
+  # The tests are read once per benchmark and shared by every submission (see test_index),
+  # so there's nothing to copy anymore; LINK_TESTS=1 still gives each output directory
+  # its own tests/ folder, made of hardlinks
+  if LINK_TESTS:
+    link_tests(tests, output_dir)
+
+def run_tests(target, output_dir, tests):
+  # Every case is run (in parallel), so we know exactly which ones pass; the first one that
+  # doesn't is what gets fed back to the model
+  with span("tests"):
+    report = target.run_matrix(output_dir, tests.cases)
+  # a cancelled run (see best_of_n) isn't a verdict, and mustn't be cached as one
+  check_cancelled()
+  print_debug(f"Test results for {output_dir}: {report.counts()}")
+  failure = report.first_failure()
+  if failure is not None:
+    print_debug(f"Test failure for {failure.name}.in ({failure.status})")
+    print_debug(f"Expected output: {failure.expected_output}")
+    print_debug(f"Actual output: {failure.actual_output}")
+    # a timeout or a crash is spelled out, so that the repair can go after it
+    return QueryResult("TEST_FAILURE", outputs = (failure.expected_output, failure.feedback_output()), matrix = report.matrix())
+  return QueryResult("TEST_SUCCESS", matrix = report.matrix())
+
+################################################################################
+# Targets
+
+class Target:
+  # What a language needs of the engine: its prompts, per corpus - the translation, then
+  # the repair of a compilation error and of a test failure (None for those it never
+  # gets) - and how a translation is laid out, evaluated and run
+  name = None
+  fence = None # what the model's reply opens the code with
+  source_file = None # where the translation goes, within its output directory
+  copy_ignore = () # what isn't copied to the other members of an equivalence class
+  report_failures = False # whether a submission which ends up failing its tests is reported
+  echo_replies = False # whether the model's replies are printed whole
+  PROMPTS = {}
+
+  def __init__(self, corpus):
+    self.corpus = corpus
+    suffix = "-correct" if corpus == REFERENCE else ""
+    # the results store still tells runs apart by the scripts' names
+    self.script = f"c-to-{self.name}" + ("-with-correct" if corpus == REFERENCE else "")
+    self.location = SRC_DIR + f"/../data/c-to-{self.name}{suffix}/"
+    self.prompt, self.prompt_with_previous_compilation_error, self.prompt_with_previous_test_failure = self.PROMPTS[corpus]
+    self.checkpoint = Checkpoint(f"c-to-{self.name}{suffix}")
+    # one final verdict per submission translated (see finish_class)
+    self.totals = Totals()
+    self.store = results_store
+
+  def budget(self):
+    return RepairBudget()
+
+  def output_dir(self, benchmark_name, submission_path):
+    if self.corpus == REFERENCE:
+      return self.location + benchmark_name
+    student, submission = os.path.normpath(submission_path).split(os.sep)[-2:]
+    return self.location + benchmark_name + "/" + student + "/" + submission
+
+  def prepare(self, output_dir, tests):
+    raise NotImplementedError
+
+  def cache_key(self, output_dir, tests):
+    # -> the translation's key in the verdict cache (see verdict_cache)
+    raise NotImplementedError
+
+  def evaluate(self, output_dir, tests):
+    # -> the translation's QueryResult (see verdict_cache)
+    raise NotImplementedError
+
+  def run_matrix(self, output_dir, cases, trace = True):
+    raise NotImplementedError
+
+  def describe_totals(self):
+    _, test_failures, test_successes = self.totals.snapshot()
+    return f"Test failures: {test_failures}, Test successes: {test_successes}"
+
+  def templates(self):
+    return [ template.template for template in self.PROMPTS[self.corpus] if template is not None ]
+
+  def perform_query(self, code, model, previous_compilation_error = None, previous_test_failure = None):
+    if previous_compilation_error:
+      print_debug(f"Previous compilation error: {previous_compilation_error}")
+      chain = make_chain(self.prompt_with_previous_compilation_error, model, self.fence)
+      reply = response_cache.run(chain, {"code": code, "previous_compilation_error": previous_compilation_error})
+    elif previous_test_failure:
+      expected_output, actual_output = previous_test_failure
+      print_debug(f"Previous test failure: {previous_test_failure}")
+      chain = make_chain(self.prompt_with_previous_test_failure, model, self.fence)
+      reply = response_cache.run(chain, {
+        "code": code,
+        "expected_output": expected_output,
+        "actual_output": actual_output
+      })
+    else:
+      print_debug("No previous error")
+      chain = make_chain(self.prompt, model, self.fence)
+      reply = response_cache.run(chain, {"code": code})
+    if self.echo_replies:
+      print_info(reply)
+    reply = reply.partition(self.fence)[2] # get everything after the code starts being written
+    reply = reply.partition("```")[0] # we can discard everything after the code ends
+    # there's also some cases where the final ``` doesn't seem to be put (?)
+    reply = reply.partition("<|end|>")[0]
+    # this assumes that no-one used ``` along the code itself, which is a bit of a hack
+    return reply
+
+class RustTarget(Target):
+  name = "rust"
+  fence = "```rust"
+  source_file = "src/main.rs"
+  copy_ignore = ( "target", "tests" )
+  PROMPTS = {
+    SUBMISSIONS: (
+      PromptTemplate(
+        input_variables=[ "code" ],
+        template="Translate the following C code to Rust:\n{code}"
+      ),
+      PromptTemplate(
+        input_variables=[ "code", "previous_compilation_error" ],
+        template="Translate the following C code to Rust (don't forget to fix the error):\n{code}\nError: {previous_compilation_error}"
+      ),
+      PromptTemplate(
+        input_variables=[ "code", "expected_output", "actual_output" ],
+        template="Translate the following C code to Rust (don't forget to fix the test output-errors):\n{code}\nExpected output: {expected_output}\nActual output: {actual_output}"
+      ),
+    ),
+    REFERENCE: (
+      PromptTemplate(
+        input_variables=[ "code" ],
+        template="""
+    Translate the following C code to Rust.
+    The code must be a direct translation, do not change the logic nor add anything else:
+    \n{code}
+  """
+      ),
+      PromptTemplate(
+        input_variables=[ "code", "previous_compilation_error" ],
+        template="""
+    Directly translate the following C code to Rust
+    (don't forget to fix the compilation errors displayed below; common examples
+    are type mismatches and forgetting to use `use std::io` and the likes):
+    \n{code}
+    \nError: {previous_compilation_error}.
+  """
+      ),
+      PromptTemplate(
+        input_variables=[ "code", "expected_output", "actual_output" ],
+        template="""
+    Directly translate the following C code to Rust
+    (don't forget to fix the test's output-errors displayed below):
+    \n{code}
+    \nExpected output: {expected_output}
+    \nActual output: {actual_output}.
+  """
+      ),
+    ),
+  }
+
+  def prepare(self, output_dir, tests):
+    # see rust_build for why there's no `cargo init` anymore
+    scaffold_rust(output_dir)
+    create_tests(output_dir, tests)
+
+  def cache_key(self, output_dir, tests):
+    return verdict_key(output_dir + "/" + self.source_file, rust_toolchain(), tests)
+
+  def evaluate(self, output_dir, tests):
+    # The same code (under the same rustc and tests) always ends up with the same verdict, so
+    # both the compilation and the tests are skipped whenever we've already seen it
+    key = self.cache_key(output_dir, tests)
+    query_result, _ = verdict_cache.run(
+      key, lambda: self.compile_and_test(output_dir, tests), QueryResult, output_dir + "/main"
+    )
+    return query_result
+
+  def compile_and_test(self, rust_dir, tests):
+    # We'll try 3 runs to try and compile, and 3 others to run the tests
+    for attempt in range(1, 4):
+      check_cancelled()
+      with span("compile", retry=attempt - 1):
+        compilation_result = compile_rust(rust_dir)
+      print_debug(f"Compilation phases for {rust_dir}: {compilation_result.phases}")
+
+      if compilation_result.returncode != 0:
+        print_debug(f"Compilation failure: {compilation_result.stderr}")
+        if attempt == 3:
+          return QueryResult("COMPILER_FAILURE", compilation_result.stderr, diagnostics = compilation_result.diagnostics)
+      else:
+        break
+
+    for attempt in range(1, 4):
+      check_cancelled()
+      test_result = run_tests(self, rust_dir, tests)
+      if test_result.result == "TEST_FAILURE":
+        print_debug(f"Test failure: {test_result.outputs}")
+        if attempt == 3:
+          return test_result
+      else:
+        break
+
+    return test_result
+
+  def run_matrix(self, output_dir, cases, trace = True):
+    # Once again, we won't be using `cargo test`, but rather just running the program itself
+    return run_test_matrix(["./main"], cases, cwd=output_dir, trace=trace)
+
+  def describe_totals(self):
+    compilation_failures, test_failures, test_successes = self.totals.snapshot()
+    return f"Compilation failures: {compilation_failures}, Test failures: {test_failures}, Test successes: {test_successes}"
+
+class PythonTarget(Target):
+  name = "python"
+  fence = "```python"
+  source_file = "src/main.py"
+  copy_ignore = ( "__pycache__", "tests" )
+  report_failures = True
+  PROMPTS = {
+    SUBMISSIONS: (
+      PromptTemplate(
+        input_variables=[ "code" ],
+        # The __main__ part seems to be important for it not to just do the function itself
+        template="Translate the following C code to Python (don't forget to add a __main__, and don't forget the output must be exactly the same):\n{code}"
+      ),
+      None,
+      None,
+    ),
+    REFERENCE: (
+      PromptTemplate(
+        input_variables=[ "code" ],
+        template="""
+    Directly translate the following C code to Python
+    (don't forget to add a __main__, and don't forget the input and output strings displayed must be EXACTLY the same (including spaces and newlines)):
+    \n{code}
+  """
+      ),
+      None,
+      PromptTemplate(
+        input_variables=[ "code", "expected_output", "actual_output" ],
+        template="""
+    Directly translate the following C code to Python
+    (don't forget to fix the test errors, that the input and output strings displayed must be EXACTLY the same (including spaces and newlines), and to have a __main__):
+    \n{code}\nExpected output: {expected_output}\nActual output: {actual_output}.
+  """
+      ),
+    ),
+  }
+
+  def __init__(self, corpus):
+    super().__init__(corpus)
+    # as c-to-python-with-correct always did
+    self.echo_replies = corpus == REFERENCE
+
+  def budget(self):
+    # no repairs for the submissions, the first translation is the only attempt; one
+    # repair round (for a test failure) for the reference programs
+    return RepairBudget(max_rounds=1 if self.corpus == REFERENCE else 0)
+
+  def prepare(self, output_dir, tests):
+    os.makedirs(output_dir + "/src", exist_ok=True)
+    create_tests(output_dir, tests)
+
+  def cache_key(self, output_dir, tests):
+    return verdict_key(output_dir + "/" + self.source_file, toolchain_version(["python", "--version"]), tests)
+
+  def evaluate(self, output_dir, tests):
+    # The same code (under the same interpreter and tests) always ends up with the same verdict,
+    # so the tests are skipped whenever we've already seen it
+    key = self.cache_key(output_dir, tests)
+    query_result, _ = verdict_cache.run(key, lambda: run_tests(self, output_dir, tests), QueryResult)
+    return query_result
+
+  def run_matrix(self, output_dir, cases, trace = True):
+    if WARM_INTERPRETER:
+      # main.py is only compiled once, and each case runs in a fork of that warm interpreter
+      return run_warm_test_matrix(self.source_file, cases, cwd=output_dir, trace=trace)
+    return run_test_matrix(["python", self.source_file], cases, cwd=output_dir, text=True, trace=trace)
+
+TARGETS = { "rust": RustTarget, "python": PythonTarget }
+
+################################################################################
+# The sweep
+
+def walk_corpus(corpus):
+  # -> [ (benchmark_name, tests, [ (submission_path, code) ], how many had no C source) ],
+  # every C source read once, and the tests indexed once, whatever the number of targets
+  corpus_benchmarks = []
+  for benchmark in BENCHMARKS:
+    benchmark_name = benchmark.split("/")[-2]
+    tests = get_test_index(benchmark, TEST_TYPES)
+    if corpus == REFERENCE:
+      submission_paths = [ benchmark + "tests/" ]
+    else:
+      submission_paths = []
+      for student_directory_name in os.listdir(benchmark):
+        student_directory_path = benchmark + student_directory_name + "/"
+        if not os.path.isdir(student_directory_path) and student_directory_name not in TO_AVOID:
+          continue
+        # we're within a student's submissions folder
+        for submission_name in os.listdir(student_directory_path):
+          submission_path = student_directory_path + submission_name + "/"
+          if os.path.isdir(submission_path):
+            submission_paths.append(submission_path)
+    submissions = []
+    missing = 0
+    for submission_path in submission_paths:
+      try:
+        with open(submission_path + benchmark_name + ".c", "r") as s:
+          submissions.append((submission_path, s.read()))
+      except FileNotFoundError:
+        print(f"The submission {submission_path + benchmark_name + '.c'} was not found.")
+        missing += 1
+    corpus_benchmarks.append((benchmark_name, tests, submissions, missing))
+  return corpus_benchmarks
+
+def fingerprint(target, code, tests):
+  # Everything a translation depends on (see checkpoint), besides the seed each query gets
+  # - which is derived from RUN_SEED, if it's set
+  return hash_parts(
+    code, target.templates(), MODEL, create_model(seed=None).model_kwargs, RUN_SEED, model_backend.cache_namespace, tests.hash
+  )
+
+def tags_for(target, benchmark_name, submission_path):
+  tags = { "benchmark": benchmark_name, "submission": "reference" } if target.corpus == REFERENCE else submission_tags(benchmark_name, submission_path)
+  return dict(tags, target=target.name)
+
+def prepare_class(target, tests, benchmark_name, members, name):
+  # Everything needed before the first round, for one target's translation of a whole
+  # equivalence class (see dedup); returns its Repair (see repair), or None if it's done
+  # already (see checkpoint)
+  fingerprints = {}
+  outputs = []
+  # each member by its own source, which may differ from the first one's in comments or spacing
+  for submission_path, code in members:
+    output_dir = target.output_dir(benchmark_name, submission_path)
+    outputs.append((submission_path, output_dir))
+    fingerprints[os.path.relpath(output_dir, target.location)] = fingerprint(target, code, tests)
+  if target.checkpoint.is_done(fingerprints):
+    print_debug(f"{name} is done already (see checkpoint), skipping it")
+    return None
+
+  submission_path, output_dir = outputs[0]
+  target.prepare(output_dir, tests)
+  llm = create_model(seed=pick_seed(submission_path, None, None))
+  return Repair(
+    name, members[0][1], (target, tests, benchmark_name, outputs, llm, fingerprints),
+    budget=target.budget(), tags=tags_for(target, benchmark_name, submission_path)
+  )
+
+def translate(repair, target, tests, output_dir, llm, previous_error = None, previous_test_failure = None):
+  # One query and its verdict, for the translation in output_dir -> (its QueryResult, and
+  # (roughly) how many tokens it took)
+  feedback = repair.feedback()
+  with span("query", feedback=feedback) as query_span:
+    reply = target.perform_query(repair.code, llm, previous_error, previous_test_failure)
+  check_cancelled()
+  with open(output_dir + "/" + target.source_file, "w") as output_file:
+    output_file.write(reply)
+  with span("verdict") as verdict_span:
+    query_result = target.evaluate(output_dir, tests)
+  tokens = estimate_tokens(repair.code, previous_error, previous_test_failure, reply)
+  target.store.record_attempt(
+    repair.tags, repair.attempt(), feedback, llm.model_kwargs, query_result,
+    query_span["duration"], verdict_span["duration"], tokens
+  )
+  return query_result, tokens
+
+def translate_best_of_n(repair, target, tests, submission_path, output_dir):
+  # The first translation as BEST_OF_N candidates, raced (see best_of_n); the one that's
+  # kept ends up in output_dir, as if it had been the only one
+  candidates_dir = output_dir + ".candidates"
+
+  def run_candidate(index):
+    candidate_dir = f"{candidates_dir}/{index}"
+    target.prepare(candidate_dir, tests)
+    # the first candidate gets the seed a single translation would have had
+    llm = create_model(seed=pick_seed(submission_path, None, None, *([ index ] if index else [])))
+    query_result, tokens = translate(repair, target, tests, candidate_dir, llm)
+    return query_result, (candidate_dir, tokens)
+
+  try:
+    judged, (index, query_result, (candidate_dir, _)), _ = race(BEST_OF_N, run_candidate)
+    print_debug(f"Keeping candidate {index} of {repair.name} ({query_result.result})")
+    shutil.copytree(
+      candidate_dir, output_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(*target.copy_ignore)
+    )
+  finally:
+    shutil.rmtree(candidates_dir, ignore_errors=True)
+  return query_result, sum([ tokens for _, _, (_, tokens) in judged ])
+
+def run_round(repair):
+  # One query - the first translation, or a fix for the latest compilation error or test
+  # failure - and its verdict, along with (roughly) how many tokens it took
+  target, tests, _, outputs, llm, _ = repair.job
+  submission_path, output_dir = outputs[0]
+  feedback = repair.feedback()
+  print_debug(f"Processing {repair.name}")
+  if feedback is None and BEST_OF_N > 1:
+    query_result, tokens = translate_best_of_n(repair, target, tests, submission_path, output_dir)
+  else:
+    # only what the repair needs of them, within the prompt's token budget (see compaction)
+    previous_error = None
+    previous_test_failure = None
+    if feedback == "COMPILER_FAILURE":
+      previous_error = compact_compilation_error(repair.result, target.prompt_with_previous_compilation_error.template, repair.code)
+    elif feedback == "TEST_FAILURE":
+      previous_test_failure = compact_test_failure(repair.result.outputs, target.prompt_with_previous_test_failure.template, repair.code)
+    # the same model throughout, with a seed of its own for each round
+    llm.model_kwargs = dict(llm.model_kwargs, seed=pick_seed(submission_path, previous_error, previous_test_failure))
+    query_result, tokens = translate(repair, target, tests, output_dir, llm, previous_error, previous_test_failure)
+  if query_result.result == "TEST_SUCCESS":
+    # correct, but is it any match for the C program? (see reference)
+    check_performance(repair.name, query_result.matrix, tests.cases)
+    # and does it hold up beyond the tests? (see differential)
+    check_differential(
+      repair.name, tests, lambda cases: target.run_matrix(output_dir, cases, trace=False),
+      target.cache_key(output_dir, tests)
+    )
+  return query_result, tokens
+
+def finish_class(repair):
+  # Only the first member of the class went through the LLM and the tests, the others get
+  # a copy of its translation and count as it did
+  target, tests, benchmark_name, outputs, _, fingerprints = repair.job
+  if repair.outcome == "success":
+    print_info(f"Test success for {repair.name}")
+  elif target.report_failures and repair.result is not None and repair.result.result == "TEST_FAILURE":
+    print_info(f"Test failure for {repair.name}")
+  (submission_path, output_dir), *others = outputs
+  for other_submission_path, other_output_dir in others:
+    shutil.copytree(
+      output_dir, other_output_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(*target.copy_ignore)
+    )
+    create_tests(other_output_dir, tests)
+    print_debug(f"{other_submission_path + benchmark_name + '.c'} is equivalent to {submission_path + benchmark_name + '.c'}, copied its translation")
+    # the scheduler only knows of the first member, the others count as it did
+    tracer.event(
+      "outcome", **tags_for(target, benchmark_name, other_submission_path), outcome=repair.outcome,
+      rounds=repair.rounds, tokens=0, copy_of=f"{repair.tags['student']}/{repair.tags['submission']}"
+    )
+  # the final verdict only, whatever the number of rounds it took, once per member
+  if repair.result is not None:
+    target.totals.record(repair.result.result, len(outputs))
+  # only now that every member has its translation
+  for submission, submission_fingerprint in fingerprints.items():
+    target.checkpoint.record(submission, submission_fingerprint, repair.outcome)
+
+def run_engine(target_names, corpus = SUBMISSIONS):
+  # target_names are TARGETS' keys; every one of them goes through the corpus in the same pass
+  targets = [ TARGETS[name](corpus) for name in target_names ]
+  if len(targets) > 1:
+    # one run per target, so that each can still be told apart (and compared) as before
+    for target in targets:
+      target.store = ResultsStore(run_id=f"{RUN_ID}-{target.name}", target=target.name)
+
+  repairs = []
+  class_count = 0
+  submission_count = 0
+  for benchmark_name, tests, submissions, missing in walk_corpus(corpus):
+    # one translation per equivalence class (and target) rather than per submission
+    for members in equivalence_classes(submissions, lambda member: member[1]):
+      name = members[0][0] + benchmark_name + ".c"
+      for target in targets:
+        repair = prepare_class(target, tests, benchmark_name, members, f"{name} ({target.name})" if len(targets) > 1 else name)
+        if repair is not None:
+          repairs.append(repair)
+      class_count += 1
+    # as they always were: a submission without its C source is a class of its own
+    class_count += missing
+    submission_count += len(submissions) + missing
+
+  # the directory walk is cheap, the translations themselves (LLM + compiler + tests) are
+  # not, so only the latter are spread across the workers, one round at a time (see repair);
+  # the reference programs go one benchmark (per target) at a time, as they used to
+  parameters = create_model(seed=None).model_kwargs
+  for target in targets:
+    target.store.start_run(target.script, MODEL, model_backend.name, parameters, RUN_SEED)
+  workers = len(targets) * (1 if corpus == REFERENCE else WORKERS)
+  scheduler = RepairScheduler(run_round, finish_class, workers=workers)
+  scheduler.run(repairs)
+  for target in targets:
+    target.store.finish_run()
+    target.checkpoint.complete()
+
+  for target in targets:
+    prefix = f"{target.script}: " if len(targets) > 1 else ""
+    print_info(prefix + target.describe_totals())
+    if CHECKPOINT:
+      print_info(f"{prefix}Checkpoint: {target.checkpoint.summary()}")
+  if corpus == SUBMISSIONS:
+    print_info(f"Deduplication: {submission_count} submissions in {class_count} equivalence classes")
+  if "rust" in target_names:
+    print_info(f"Repairs: {scheduler.summary()}")
+  if STREAM_INFERENCE:
+    print_info(f"Streamed inference: {stream_stats.summary()}")
+  elif BATCH_INFERENCE:
+    print_info(f"Inference batches: {inference_batcher.batches}, for {inference_batcher.requests} queries")
+  print_info(f"Model backend: {model_backend.summary()}")
+  print_info(f"Inference client: {client_stats.summary()}")
+  print_info(f"LLM cache hits: {response_cache.hits}, misses: {response_cache.misses}")
+  print_info(f"Verdict cache hits: {verdict_cache.hits}, misses: {verdict_cache.misses}")
+  print_info(f"Performance: {performance_stats.summary()}")
+  if COMPACT_PROMPTS and any(target.prompt_with_previous_compilation_error or target.prompt_with_previous_test_failure for target in targets):
+    print_info(f"Prompt compaction: {compaction_stats.summary()}")
+  if DIFFERENTIAL:
+    print_info(f"Differential testing: {differential_stats.summary()}")
+  if BEST_OF_N > 1:
+    print_info(f"Best of {BEST_OF_N}: {best_of_n_stats.summary()}")
+  if "rust" in target_names:
+    print_info(f"Compilation phases: {compile_stats.summary()}")
+
+################################################################################
+
+if __name__ == "__main__":
+  arguments = sys.argv[1:]
+  corpus = REFERENCE if "--correct" in arguments else SUBMISSIONS
+  target_names = [ argument for argument in arguments if argument != "--correct" ]
+  if not target_names or any(name not in TARGETS for name in target_names):
+    print(f"Usage: python engine.py [--correct] <{'|'.join(TARGETS)}> ...")
+    sys.exit(1)
+  run_engine(list(dict.fromkeys(target_names)), corpus)
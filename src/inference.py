@@ -0,0 +1,295 @@
+################################################################################
+# Text generation, one prompt at a time, batched or streamed
+#
+# Every query goes to the model's backend (see backends): for the hosted API and the local
+# stand-in, that's through the one shared client (see inference_client), for connection
+# reuse, rate limiting and retries.
+#
+# Each perform_query used to send its one prompt on its own, i.e. one HTTP round trip and
+# one generation pass per query. With BATCH_INFERENCE=1, prompts coming from concurrent
+# submissions are queued up instead (see batching) and sent together, as a single
+# text-generation request with a list of inputs; each caller then gets its own completion.
+#
+# A batch is sent with a single set of parameters, so only prompts with the same
+# parameters are sent together - except for the seed, which would otherwise keep every
+# batch at one prompt: a batch uses the seed of its first prompt, and each reply is then
+# recorded and cached (see llm_cache) under the seed it was actually generated with.
+#
+# With STREAM_INFERENCE=1 (which takes precedence), each query is streamed instead, token by
+# token, and the request is dropped as soon as the code block - the one opened with the
+# target's own fence, e.g. ```rust, not the C code echoed back in a ```c one - is closed (or
+# <|end|> comes up in it): everything the model would generate after that is thrown away by
+# perform_query anyway. Only the generated text is asked for, not the prompt followed by it.
+#
+# Measure throughput and latency against the local stand-in endpoint (see standin_server):
+#   python inference.py --benchmark [queries] [concurrency]   # batched vs one per request
+#   python inference.py --benchmark-stream [queries]          # streamed vs whole completions
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import MicroBatcher
+from inference_client import InferenceError, inference_client
+from test_runner import check_cancelled
+from tracing import percentile
+
+BATCH_INFERENCE = os.environ.get("BATCH_INFERENCE") == "1"
+BATCH_INFERENCE_SIZE = int(os.environ.get("BATCH_INFERENCE_SIZE", 8))
+BATCH_INFERENCE_WAIT = float(os.environ.get("BATCH_INFERENCE_WAIT", 0.5))
+STREAM_INFERENCE = os.environ.get("STREAM_INFERENCE") == "1"
+# Where queries are sent; by default, the hosted inference API for the model's repo
+INFERENCE_ENDPOINT = os.environ.get("INFERENCE_ENDPOINT")
+HUB_ENDPOINT = "https://api-inference.huggingface.co/models/"
+
+print_info = lambda arg: print("[INFO] " + str(arg))
+
+################################################################################
+
+class GenerationRequest:
+  def __init__(self, prompt, endpoint, token, parameters, backend = None):
+    self.prompt = prompt
+    self.endpoint = endpoint
+    self.token = token
+    self.parameters = parameters
+    self.backend = backend # None for a plain HTTP request to the endpoint
+
+def generate(request, client = inference_client):
+  # A single prompt, the way langchain's HuggingFaceHub sends it
+  generation = client.post_json(
+    request.endpoint,
+    { "inputs": request.prompt, "parameters": request.parameters, "options": { "wait_for_model": True } },
+    request.token
+  )
+  return generated_text(generation, request.prompt, request.parameters)
+
+def generated_text(generation, prompt, parameters):
+  # generation is [{"generated_text": ...}] or just {"generated_text": ...}, depending on
+  # the server; like langchain's HuggingFaceHub, the prompt itself isn't part of the reply
+  if isinstance(generation, list):
+    generation = generation[0]
+  text = generation["generated_text"]
+  if parameters.get("return_full_text", True):
+    text = text[len(prompt):]
+  return text
+
+def generate_batch(requests):
+  # process_batch for the MicroBatcher: returns one completion per request, in order
+  groups = {}
+  for i, request in enumerate(requests):
+    shared = { name: value for name, value in request.parameters.items() if name != "seed" }
+    groups.setdefault((request.endpoint, request.token, json.dumps(shared, sort_keys=True)), []).append(i)
+
+  completions = [ None ] * len(requests)
+  for (endpoint, token, _), indexes in groups.items():
+    parameters = requests[indexes[0]].parameters
+    generations = inference_client.post_json(
+      endpoint,
+      { "inputs": [ requests[i].prompt for i in indexes ], "parameters": parameters, "options": { "wait_for_model": True } },
+      token
+    )
+    if not isinstance(generations, list) or len(generations) != len(indexes):
+      raise ValueError(f"Expected {len(indexes)} generations, got: {str(generations)[:200]}")
+    for i, generation in zip(indexes, generations):
+      completions[i] = generated_text(generation, requests[i].prompt, parameters)
+      # what the completion was generated with, seed included, for whoever keeps it
+      requests[i].parameters = parameters
+  return completions
+
+def generate_batches(requests):
+  # process_batch for the inference batcher: each backend gets its own requests
+  by_backend = {}
+  for i, request in enumerate(requests):
+    by_backend.setdefault(request.backend, []).append(i)
+  completions = [ None ] * len(requests)
+  for backend, indexes in by_backend.items():
+    batch = [ requests[i] for i in indexes ]
+    for i, completion in zip(indexes, backend.generate_batch(batch) if backend else generate_batch(batch)):
+      completions[i] = completion
+  return completions
+
+inference_batcher = MicroBatcher(generate_batches, BATCH_INFERENCE_SIZE, BATCH_INFERENCE_WAIT)
+
+class StreamStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.streams = 0
+    self.cut_short = 0
+    self.tokens = 0
+
+  def record(self, tokens, cut_short):
+    with self.lock:
+      self.streams += 1
+      self.cut_short += int(cut_short)
+      self.tokens += tokens
+
+  def summary(self):
+    with self.lock:
+      return f"{self.streams} streams, {self.cut_short} cut short at the end of the code, {self.tokens} tokens received"
+
+stream_stats = StreamStats()
+
+def stream_generation(request, client = inference_client):
+  # Yields the generated text token by token (text-generation-inference's server-sent
+  # events); closing the generator hangs up, which stops the generation server-side
+  payload = {
+    "inputs": request.prompt,
+    "parameters": dict(request.parameters, return_full_text=False),
+    "stream": True,
+  }
+  lines = client.stream_lines(request.endpoint, payload, request.token)
+  try:
+    for line in lines:
+      line = line.strip()
+      if not line.startswith("data:"):
+        continue
+      event = json.loads(line[len("data:"):])
+      if "error" in event:
+        raise InferenceError(f"Generation failed: {event['error']}")
+      yield event["token"]["text"]
+  finally:
+    lines.close()
+
+def code_block_closed(text, fence = "```"):
+  # The same cut perform_query makes: the code starts after fence, and ends at the ``` closing
+  # it, or at <|end|>
+  if fence not in text:
+    return False
+  code = text.partition(fence)[2]
+  return "```" in code or "<|end|>" in code
+
+def stream_until_code_closes(request, fence = "```", stats = stream_stats):
+  text = ""
+  tokens = 0
+  cut_short = False
+  stream = request.backend.stream(request) if request.backend else stream_generation(request)
+  try:
+    for token in stream:
+      # hanging up is also how a generation nobody wants anymore is stopped (see best_of_n)
+      check_cancelled()
+      text += token
+      tokens += 1
+      if code_block_closed(text, fence):
+        cut_short = True
+        break
+  finally:
+    stream.close()
+  stats.record(tokens, cut_short)
+  return text
+
+class ClientChain:
+  # Drop-in for LLMChain(prompt=..., llm=...), as far as perform_query (and the response
+  # cache) are concerned, sending one prompt per request to the model's backend
+  def __init__(self, prompt, llm, fence = "```"):
+    self.prompt = prompt
+    self.llm = llm
+    self.fence = fence # what the reply's code block is opened with (see StreamingChain)
+    # the parameters the last reply was generated with, if they're not the llm's
+    self.sent_parameters = None
+
+  def request(self, inputs):
+    backend = self.llm.backend
+    return GenerationRequest(
+      self.prompt.format(**inputs), backend.endpoint(self.llm.repo_id),
+      self.llm.huggingfacehub_api_token, self.llm.model_kwargs, backend
+    )
+
+  def run(self, inputs):
+    return self.llm.backend.generate(self.request(inputs))
+
+class BatchedChain(ClientChain):
+  # Same drop-in, whose run() goes through the inference batcher
+  def run(self, inputs):
+    request = self.request(inputs)
+    reply = inference_batcher.run(request)
+    # a batch is sent with a single seed (see generate_batch)
+    self.sent_parameters = request.parameters
+    return reply
+
+class StreamingChain(ClientChain):
+  # Same drop-in, whose run() streams the completion and stops at the end of the code
+  def run(self, inputs):
+    return stream_until_code_closes(self.request(inputs), self.fence)
+
+def make_chain(prompt, llm, fence = "```", batched = BATCH_INFERENCE, streamed = STREAM_INFERENCE):
+  if streamed:
+    return StreamingChain(prompt, llm, fence)
+  if batched:
+    return BatchedChain(prompt, llm, fence)
+  return ClientChain(prompt, llm, fence)
+
+################################################################################
+
+def benchmark(queries = 64, concurrency = 16):
+  from standin_server import start_standin_server
+  server = start_standin_server()
+  parameters = { "max_new_tokens": 512, "temperature": 0.15, "return_full_text": True }
+
+  def measure(name, send):
+    def query(i):
+      start = time.perf_counter()
+      send(GenerationRequest(
+        f"Translate the following C code to Rust:\nint main() {{ return {i}; }}",
+        server.url, None, dict(parameters, seed=i)
+      ))
+      return time.perf_counter() - start
+
+    passes = server.passes
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      latencies = list(executor.map(query, range(queries)))
+    elapsed = time.perf_counter() - start
+    print_info(
+      f"{name}: {queries / elapsed:.2f} queries/s, latency p50 {percentile(latencies, 0.5):.2f}s, "
+      f"p95 {percentile(latencies, 0.95):.2f}s, {server.passes - passes} generation passes"
+    )
+    return elapsed
+
+  print_info(
+    f"{queries} queries, {concurrency} at a time, stand-in latency "
+    f"{server.latency}s + {server.item_latency}s per prompt"
+  )
+  unbatched = measure("one prompt per request", generate)
+  batcher = MicroBatcher(generate_batch, BATCH_INFERENCE_SIZE, BATCH_INFERENCE_WAIT)
+  batched = measure(
+    f"batched (size {BATCH_INFERENCE_SIZE}, wait {BATCH_INFERENCE_WAIT}s)", batcher.run
+  )
+  print_info(f"Speedup: {unbatched / batched:.2f}x, average batch size {batcher.requests / max(1, batcher.batches):.1f}")
+  server.shutdown()
+
+def benchmark_stream(queries = 16):
+  from standin_server import start_standin_server
+  server = start_standin_server()
+  parameters = { "max_new_tokens": 512, "temperature": 0.15 }
+
+  def whole(request):
+    return "".join(stream_generation(request))
+
+  print_info(f"{queries} queries, stand-in latency {server.latency}s + {server.token_latency}s per token")
+  timings = {}
+  for name, send in (("whole completions", whole), ("streamed, cut at the end of the code", stream_until_code_closes)):
+    tokens = server.tokens_generated
+    latencies = []
+    for i in range(queries):
+      start = time.perf_counter()
+      send(GenerationRequest(
+        f"Translate the following C code to Rust:\nint main() {{ return {i}; }}",
+        server.url, None, dict(parameters, seed=i)
+      ))
+      latencies.append(time.perf_counter() - start)
+    timings[name] = sum(latencies)
+    print_info(
+      f"{name}: latency p50 {percentile(latencies, 0.5):.2f}s, p95 {percentile(latencies, 0.95):.2f}s, "
+      f"{(server.tokens_generated - tokens) / queries:.0f} tokens generated per query"
+    )
+  print_info(f"Speedup: {timings['whole completions'] / timings['streamed, cut at the end of the code']:.2f}x")
+  server.shutdown()
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+    benchmark(*[ int(arg) for arg in sys.argv[2:4] ])
+  elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark-stream":
+    benchmark_stream(*[ int(arg) for arg in sys.argv[2:3] ])
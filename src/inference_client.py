@@ -0,0 +1,283 @@
+################################################################################
+# Shared HTTP client for the inference API
+#
+# Every query used to get a brand new HuggingFaceHub client (and with it a new connection),
+# and a throttled or failed request just raised, taking the submission down with it. All
+# requests now go through this one client instead, shared by the whole sweep:
+# - connections are kept alive and reused, at most INFERENCE_POOL_SIZE idle ones per host;
+# - a token bucket keeps us under INFERENCE_RATE requests per second (bursts of up to
+#   INFERENCE_BURST), so we slow down before the API has to tell us to;
+# - throttling (429), the model still loading (503), other 5xx and dropped connections are
+#   retried with capped exponential backoff and full jitter (honouring Retry-After), up to
+#   INFERENCE_MAX_RETRIES times, after which InferenceUnavailable is raised;
+# - a request made within a cancellable scope (see test_runner.cancellable, e.g. a best-of-N
+#   candidate) is hung up on as soon as the scope is cancelled, and raises Cancelled.
+# How many retries that took, and how long was spent waiting, is kept in client_stats.
+
+import http.client
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+from sweep import WORKERS
+from test_runner import check_cancelled, current_cancellation
+
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", 120))
+INFERENCE_POOL_SIZE = int(os.environ.get("INFERENCE_POOL_SIZE", WORKERS))
+# requests per second, 0 for no limit
+INFERENCE_RATE = float(os.environ.get("INFERENCE_RATE", 0))
+INFERENCE_BURST = int(os.environ.get("INFERENCE_BURST", 4))
+INFERENCE_MAX_RETRIES = int(os.environ.get("INFERENCE_MAX_RETRIES", 8))
+INFERENCE_BACKOFF_BASE = float(os.environ.get("INFERENCE_BACKOFF_BASE", 1.0))
+INFERENCE_BACKOFF_CAP = float(os.environ.get("INFERENCE_BACKOFF_CAP", 60.0))
+
+RETRYABLE_STATUSES = { 429, 500, 502, 503, 504 }
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+
+################################################################################
+
+class InferenceError(Exception):
+  # The API answered, with an error that retrying won't fix (bad token, bad request, ...)
+  pass
+
+class InferenceUnavailable(InferenceError):
+  # Still throttled/failing after every retry
+  pass
+
+class ClientStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.requests = 0
+    self.retries = 0
+    self.throttled = 0
+    self.connections = 0
+    self.rate_limit_wait = 0.0
+    self.backoff_wait = 0.0
+
+  def add(self, counter, amount = 1):
+    with self.lock:
+      setattr(self, counter, getattr(self, counter) + amount)
+
+  def summary(self):
+    with self.lock:
+      return (
+        f"{self.requests} requests over {self.connections} connections, {self.retries} retries "
+        f"({self.throttled} throttled), {self.rate_limit_wait:.2f}s waiting on the rate limiter, "
+        f"{self.backoff_wait:.2f}s backing off"
+      )
+
+client_stats = ClientStats()
+
+class TokenBucket:
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    # Takes a token, waiting for it if needed; returns how long that took
+    if not self.rate:
+      return 0.0
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+      self.updated = now
+      # the token is taken right away (going negative if need be), so that concurrent
+      # callers queue up behind each other rather than all waking up at once
+      self.tokens -= 1
+      wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+    if wait:
+      time.sleep(wait)
+    return wait
+
+class ConnectionPool:
+  def __init__(self, size = INFERENCE_POOL_SIZE, timeout = INFERENCE_TIMEOUT, stats = client_stats):
+    self.size = size
+    self.timeout = timeout
+    self.stats = stats
+    self.idle = {} # (scheme, host, port) -> queue of idle connections
+    self.lock = threading.Lock()
+
+  def acquire(self, url, fresh = False):
+    # Returns (connection, whether it's a reused one)
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port)
+    with self.lock:
+      idle = self.idle.setdefault(key, queue.LifoQueue())
+    if not fresh:
+      try:
+        return idle.get_nowait(), True
+      except queue.Empty:
+        pass
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(parts.hostname, parts.port, timeout=self.timeout)
+    connection.pool_key = key
+    self.stats.add("connections")
+    return connection, False
+
+  def release(self, connection):
+    # Only for connections whose response was read in full, and which weren't closed
+    idle = self.idle[connection.pool_key]
+    if idle.qsize() >= self.size:
+      connection.close()
+    else:
+      idle.put(connection)
+
+class InFlight:
+  # A request being sent or read, as far as a Cancellation is concerned (see test_runner.kill)
+  def __init__(self, connection):
+    self.connection = connection
+
+  def stop(self):
+    # shutdown, rather than close, is what wakes up the thread blocked reading from it
+    if self.connection.sock is not None:
+      try:
+        self.connection.sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+
+@contextmanager
+def hang_up_on_cancel(connection):
+  cancellation = current_cancellation()
+  if cancellation is None:
+    yield
+    return
+  request = InFlight(connection)
+  cancellation.start(request)
+  try:
+    yield
+  finally:
+    cancellation.finish(request)
+
+class InferenceClient:
+  def __init__(
+    self, rate = INFERENCE_RATE, burst = INFERENCE_BURST, max_retries = INFERENCE_MAX_RETRIES,
+    backoff_base = INFERENCE_BACKOFF_BASE, backoff_cap = INFERENCE_BACKOFF_CAP, stats = client_stats
+  ):
+    self.bucket = TokenBucket(rate, burst)
+    self.pool = ConnectionPool(stats=stats)
+    self.max_retries = max_retries
+    self.backoff_base = backoff_base
+    self.backoff_cap = backoff_cap
+    self.stats = stats
+    self.random = random.Random()
+
+  def retry_later(self, retry, problem, retry_after = None):
+    if retry == self.max_retries:
+      return
+    print_debug(f"Inference request failed ({problem}), retrying")
+    self.backoff(retry, retry_after)
+
+  def backoff(self, retry, retry_after = None):
+    delay = self.random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+    if retry_after:
+      try:
+        delay = max(delay, min(self.backoff_cap, float(retry_after)))
+      except ValueError:
+        pass # an HTTP date, rather than seconds; the jittered delay will do
+    self.stats.add("backoff_wait", delay)
+    time.sleep(delay)
+
+  def send(self, url, payload, token = None, accept = "application/json"):
+    # Returns (connection, response) for a successful (2xx) response, which has yet to be read
+    parts = urllib.parse.urlsplit(url)
+    path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+    headers = { "Content-Type": "application/json", "Accept": accept }
+    if token:
+      headers["Authorization"] = f"Bearer {token}"
+    body = json.dumps(payload).encode("utf-8")
+    problem = None
+    for retry in range(self.max_retries + 1):
+      check_cancelled()
+      if retry:
+        self.stats.add("retries")
+      self.stats.add("rate_limit_wait", self.bucket.acquire())
+      self.stats.add("requests")
+      try:
+        connection, response = self.attempt(url, path, body, headers)
+      except (OSError, http.client.HTTPException) as e:
+        # hung up on, rather than dropped
+        check_cancelled()
+        problem = f"{type(e).__name__}: {e}"
+        self.retry_later(retry, problem)
+        continue
+
+      if 200 <= response.status < 300:
+        return connection, response
+      error = response.read().decode("utf-8", errors="replace")
+      self.finish(connection, response)
+      if response.status not in RETRYABLE_STATUSES:
+        raise InferenceError(f"HTTP {response.status} from {url}: {error[:500]}")
+      if response.status == 429:
+        self.stats.add("throttled")
+      problem = f"HTTP {response.status}: {error[:200]}"
+      self.retry_later(retry, problem, response.getheader("Retry-After"))
+    raise InferenceUnavailable(f"Giving up on {url} after {self.max_retries} retries ({problem})")
+
+  def attempt(self, url, path, body, headers):
+    connection, reused = self.pool.acquire(url)
+    try:
+      with hang_up_on_cancel(connection):
+        connection.request("POST", path, body, headers)
+        return connection, connection.getresponse()
+    except (OSError, http.client.HTTPException):
+      connection.close()
+      if not reused:
+        raise
+    # most likely, the server closed that one while it was idle: try again right away (and
+    # without it counting as a retry) on a fresh connection
+    connection, _ = self.pool.acquire(url, fresh=True)
+    try:
+      with hang_up_on_cancel(connection):
+        connection.request("POST", path, body, headers)
+        return connection, connection.getresponse()
+    except (OSError, http.client.HTTPException):
+      connection.close()
+      raise
+
+  def finish(self, connection, response):
+    # the response must have been read in full
+    if response.will_close:
+      connection.close()
+    else:
+      self.pool.release(connection)
+
+  def post_json(self, url, payload, token = None):
+    connection, response = self.send(url, payload, token)
+    try:
+      with hang_up_on_cancel(connection):
+        body = response.read()
+    except (OSError, http.client.HTTPException):
+      connection.close()
+      check_cancelled()
+      raise
+    self.finish(connection, response)
+    reply = json.loads(body)
+    if isinstance(reply, dict) and "error" in reply:
+      raise InferenceError(f"Error from {url}: {reply['error']}")
+    return reply
+
+  def stream_lines(self, url, payload, token = None):
+    # Yields the response line by line; closing the generator early hangs up, and the
+    # connection is never reused
+    connection, response = self.send(url, payload, token, accept="text/event-stream")
+    try:
+      with hang_up_on_cancel(connection):
+        for line in response:
+          yield line.decode("utf-8")
+    except (OSError, http.client.HTTPException):
+      check_cancelled()
+      raise
+    finally:
+      connection.close()
+
+inference_client = InferenceClient()
@@ -0,0 +1,155 @@
+################################################################################
+# On-disk, content-addressed cache for the model's replies
+#
+# Every reply is stored under the hash of everything that could change it: the prompt
+# template, the values it's filled with, the model and its parameters (seed included).
+# Re-running the sweep after fixing something in the harness (or after a crash) then
+# costs no inference time at all for the queries that were already made.
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+LLM_CACHE_DIR = os.environ.get(
+  "LLM_CACHE_DIR", os.path.expanduser("~/.cache/llm-exercise/llm")
+)
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# NO_LLM_CACHE=1 for runs which need fresh samples (the cache isn't read nor written)
+NO_LLM_CACHE = os.environ.get("NO_LLM_CACHE") == "1"
+# With a random seed per query no two runs would ever share a key, so if RUN_SEED is set
+# the seeds are derived from it instead (see pick_seed)
+RUN_SEED = os.environ.get("RUN_SEED")
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+
+################################################################################
+
+def hash_parts(*parts):
+  return hashlib.sha256(
+    json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+  ).hexdigest()
+
+def pick_seed(*parts):
+  # parts identify the query (e.g. the submission and the prompt variant), so that the
+  # same query gets the same seed across runs, while different ones still get different seeds
+  if RUN_SEED is None:
+    return random.randint(0, 1000000)
+  return int(hash_parts(RUN_SEED, *parts), 16) % 1000001
+
+class ResponseCache:
+  def __init__(self, directory = LLM_CACHE_DIR, max_bytes = LLM_CACHE_MAX_BYTES, enabled = not NO_LLM_CACHE):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.enabled = enabled
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    # key -> (size, last use); the last use is also kept on disk as the file's mtime,
+    # so the LRU order survives between runs
+    self.entries = {}
+    self.total_bytes = 0
+    if enabled:
+      self.load_index()
+
+  def load_index(self):
+    os.makedirs(self.directory, exist_ok=True)
+    for shard in os.listdir(self.directory):
+      shard_path = os.path.join(self.directory, shard)
+      if not os.path.isdir(shard_path):
+        continue
+      for name in os.listdir(shard_path):
+        if name.endswith(".tmp"):
+          continue
+        stat = os.stat(os.path.join(shard_path, name))
+        self.entries[name] = (stat.st_size, stat.st_mtime)
+        self.total_bytes += stat.st_size
+
+  def path(self, key):
+    return os.path.join(self.directory, key[:2], key)
+
+  def key(self, chain, inputs, parameters = None):
+    # parameters, if the reply was generated with something else than the llm's (see run)
+    llm = chain.llm
+    parts = [ chain.prompt.template, inputs, llm.repo_id, parameters or llm.model_kwargs ]
+    # replies from the stand-in/replay backends mustn't pass for the real model's
+    if llm.backend.cache_namespace:
+      parts.append(llm.backend.cache_namespace)
+    return hash_parts(*parts)
+
+  def get(self, key):
+    with self.lock:
+      if key not in self.entries:
+        return None
+      now = time.time()
+      size, _ = self.entries[key]
+      self.entries[key] = (size, now)
+    try:
+      with open(self.path(key), "r") as cached:
+        reply = json.load(cached)["reply"]
+      os.utime(self.path(key), (now, now))
+      return reply
+    except (OSError, ValueError, KeyError):
+      # someone else evicted it (or it's corrupted), just treat it as a miss
+      with self.lock:
+        self.forget(key)
+      return None
+
+  def put(self, key, reply):
+    os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+    # write-then-rename, so a crash mid-write never leaves a half-written entry behind
+    temporary_path = f"{self.path(key)}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "w") as cached:
+      json.dump({ "reply": reply }, cached)
+    os.replace(temporary_path, self.path(key))
+    size = os.path.getsize(self.path(key))
+    with self.lock:
+      self.forget(key)
+      self.entries[key] = (size, time.time())
+      self.total_bytes += size
+      self.evict()
+
+  def forget(self, key):
+    # must be called with the lock held
+    if key in self.entries:
+      size, _ = self.entries.pop(key)
+      self.total_bytes -= size
+
+  def evict(self):
+    # must be called with the lock held; least recently used entries go first
+    if self.total_bytes <= self.max_bytes:
+      return
+    for key, _ in sorted(self.entries.items(), key=lambda entry: entry[1][1]):
+      if self.total_bytes <= self.max_bytes:
+        break
+      self.forget(key)
+      try:
+        os.remove(self.path(key))
+      except FileNotFoundError:
+        pass
+
+  def run(self, chain, inputs):
+    # Drop-in replacement for chain.run(inputs)
+    if not self.enabled:
+      return chain.run(inputs)
+    key = self.key(chain, inputs)
+    reply = self.get(key)
+    if reply is not None:
+      with self.lock:
+        self.hits += 1
+      print_debug(f"LLM cache hit ({key[:12]})")
+      return reply
+    reply = chain.run(inputs)
+    with self.lock:
+      self.misses += 1
+    sent_parameters = getattr(chain, "sent_parameters", None)
+    if sent_parameters is not None and sent_parameters != chain.llm.model_kwargs:
+      # batched with another prompt's seed (see inference.generate_batch): it's not the
+      # reply this query asked for, but it is the one for the seed that was sent
+      key = self.key(chain, inputs, sent_parameters)
+    self.put(key, reply)
+    return reply
+
+response_cache = ResponseCache()
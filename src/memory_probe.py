@@ -0,0 +1,138 @@
+################################################################################
+# Memory probe - for a test case's own peak memory
+#
+# The peak that wait4 reports for a process Linux counts from whatever the process had
+# before its exec, i.e. from what it was spawned from: Popen forks (or vforks) our own
+# interpreter, hundreds of MiB of it in a sweep, and a translation which allocates next to
+# nothing then looks as big as we are. So every test case is started through a tiny C
+# program instead, which forks the actual command (its own pre-exec self being next to
+# nothing), reaps it and writes the command's peak, in KiB, to a file descriptor it's
+# handed, before exiting just like the command did - same exit code, same signal. The
+# sandbox's limits still apply to the command, which inherits them from the probe.
+#
+# It's compiled once (with CC, cached in MEMORY_PROBE_DIR by its source's hash); without a
+# compiler, or with MEMORY_PROBE=0, cases are run directly and their memory is unknown
+# (and not scored, see reference).
+
+import hashlib
+import os
+import subprocess
+import threading
+
+MEMORY_PROBE = os.environ.get("MEMORY_PROBE", "1") == "1"
+MEMORY_PROBE_DIR = os.environ.get(
+  "MEMORY_PROBE_DIR", os.path.expanduser("~/.cache/llm-exercise/memory-probe")
+)
+CC = os.environ.get("CC", "gcc")
+
+print_error = lambda arg: print("[ERROR] " + str(arg))
+
+SOURCE = r"""
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+/* memory_probe <report fd> <command> [arguments...] */
+int main(int argc, char **argv) {
+  if (argc < 3)
+    return 127;
+  int report = atoi(argv[1]);
+  fcntl(report, F_SETFD, FD_CLOEXEC);
+  pid_t pid = fork();
+  if (pid < 0) {
+    perror("memory_probe: fork");
+    return 127;
+  }
+  if (pid == 0) {
+    execvp(argv[2], argv + 2);
+    perror("memory_probe: exec");
+    _exit(127);
+  }
+  int status;
+  struct rusage usage;
+  while (wait4(pid, &status, 0, &usage) < 0)
+    if (errno != EINTR)
+      return 127;
+  dprintf(report, "%ld\n", usage.ru_maxrss);
+  if (WIFSIGNALED(status)) {
+    /* dies of the same signal, for the same returncode */
+    struct rlimit none = { 0, 0 };
+    setrlimit(RLIMIT_CORE, &none);
+    sigset_t signals;
+    sigemptyset(&signals);
+    sigaddset(&signals, WTERMSIG(status));
+    sigprocmask(SIG_UNBLOCK, &signals, NULL);
+    signal(WTERMSIG(status), SIG_DFL);
+    raise(WTERMSIG(status));
+  }
+  return WEXITSTATUS(status);
+}
+"""
+
+################################################################################
+
+probe_lock = threading.Lock()
+probe_path = None
+probe_built = False
+
+def build_probe(build_dir = MEMORY_PROBE_DIR):
+  # -> the probe's path, or None if it couldn't be built
+  digest = hashlib.sha256(SOURCE.encode("utf-8")).hexdigest()
+  binary_path = os.path.join(build_dir, digest[:16])
+  if os.path.exists(binary_path):
+    return binary_path
+  os.makedirs(build_dir, exist_ok=True)
+  source_path = f"{binary_path}.{os.getpid()}.c"
+  temporary_path = f"{binary_path}.{os.getpid()}.tmp"
+  with open(source_path, "w") as source:
+    source.write(SOURCE)
+  try:
+    # static if possible, for the smallest pre-exec self there is
+    for flags in ([ "-static" ], []):
+      try:
+        result = subprocess.run(
+          [ CC, "-O2", *flags, "-o", temporary_path, source_path ], capture_output=True, text=True
+        )
+      except FileNotFoundError:
+        print_error(f"No {CC} to build the memory probe with, test cases' memory won't be measured")
+        return None
+      if result.returncode == 0:
+        os.replace(temporary_path, binary_path)
+        return binary_path
+    print_error(f"The memory probe doesn't compile, test cases' memory won't be measured: {result.stderr}")
+    return None
+  finally:
+    os.remove(source_path)
+
+def memory_probe():
+  # -> the probe's path (built the first time), or None if there's none
+  global probe_path, probe_built
+  if not MEMORY_PROBE:
+    return None
+  with probe_lock:
+    if not probe_built:
+      probe_path = build_probe(MEMORY_PROBE_DIR)
+      probe_built = True
+    return probe_path
+
+def probed(command, report_fd):
+  # -> the command, run through the probe (which writes its peak memory to report_fd), or
+  # as it is if there's no probe
+  probe = memory_probe()
+  if probe is None:
+    return command
+  return [ probe, str(report_fd), *command ]
+
+def read_report(report_file):
+  # -> the peak memory the probe reported, in KiB, or None (no probe, or it was killed
+  # along with the command, e.g. on a timeout)
+  report_file.seek(0)
+  try:
+    return int(report_file.read().strip()) or None
+  except ValueError:
+    return None
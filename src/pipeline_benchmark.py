@@ -0,0 +1,214 @@
+################################################################################
+# End-to-end benchmark of the harness itself
+#
+# Runs the c-to-rust and c-to-python sweeps, unchanged - and, with BENCHMARK_PIPELINES=
+# rust,python,engine, both of them in a single pass of the engine (see engine) - over a
+# fixed subset of IntroClass - the first BENCHMARK_STUDENTS students of every benchmark
+# (in sorted order), and their first BENCHMARK_SUBMISSIONS submissions - with a mocked
+# model (the stand-in backend, or BENCHMARK_BACKEND=replay) and without the LLM/verdict
+# caches, so that every run does the very same work. For each pipeline, it records:
+# - throughput, in submissions per minute;
+# - the p50/p95 latency of each stage (round, query, verdict, compile, ...; see tracing);
+# - peak RSS, of the largest process in the pipeline (rustc and the tests included).
+# Those are compared against the stored baseline, anything worse than it by more than
+# BENCHMARK_TOLERANCE being reported as a regression:
+#
+#   python pipeline_benchmark.py                    # exits with 1 if anything regressed
+#   python pipeline_benchmark.py --update-baseline  # stores this run as the new baseline
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tracing import load_spans, percentile, summarize
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+INTROCLASS_DIR = os.environ.get("INTROCLASS_DIR", SRC_DIR + "/../data/IntroClass")
+BENCHMARK_PIPELINES = os.environ.get("BENCHMARK_PIPELINES", "rust,python").split(",")
+BENCHMARK_STUDENTS = int(os.environ.get("BENCHMARK_STUDENTS", 2))
+BENCHMARK_SUBMISSIONS = int(os.environ.get("BENCHMARK_SUBMISSIONS", 1))
+BENCHMARK_REPETITIONS = int(os.environ.get("BENCHMARK_REPETITIONS", 1))
+BENCHMARK_BACKEND = os.environ.get("BENCHMARK_BACKEND", "standin")
+BENCHMARK_TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 0.25))
+# latency differences below this many seconds are noise, whatever their relative size
+BENCHMARK_NOISE_FLOOR = float(os.environ.get("BENCHMARK_NOISE_FLOOR", 0.01))
+BENCHMARK_BASELINE = os.environ.get(
+  "BENCHMARK_BASELINE", os.path.expanduser("~/.cache/llm-exercise/pipeline-baseline.json")
+)
+
+BENCHMARKS = [ "checksum", "digits", "grade", "median", "smallest", "syllables" ]
+PIPELINES = { "rust": [ "c-to-rust.py" ], "python": [ "c-to-python.py" ], "engine": [ "engine.py", "rust", "python" ] }
+# A quick mocked model, so that it's the harness' own costs which show (unless overridden)
+MOCK_ENVIRONMENT = { "STANDIN_LATENCY": "0.05", "STANDIN_ITEM_LATENCY": "0", "STANDIN_TOKEN_LATENCY": "0" }
+
+print_info = lambda arg: print("[INFO] " + str(arg))
+print_error = lambda arg: print("[ERROR] " + str(arg))
+
+################################################################################
+
+def subdirectories(path):
+  return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+def build_subset(root):
+  # Lays out root/src (where the sweeps are run from) and root/data/IntroClass (symlinks to
+  # the subset), just like the repo itself; returns how many submissions that makes
+  count = 0
+  for benchmark in BENCHMARKS:
+    source = os.path.join(INTROCLASS_DIR, benchmark)
+    target = os.path.join(root, "data", "IntroClass", benchmark)
+    os.makedirs(target)
+    if not os.path.isdir(source):
+      continue
+    if os.path.isdir(os.path.join(source, "tests")):
+      os.symlink(os.path.join(source, "tests"), os.path.join(target, "tests"))
+    students = [ name for name in subdirectories(source) if name != "tests" ]
+    for student in students[:BENCHMARK_STUDENTS]:
+      os.makedirs(os.path.join(target, student))
+      for submission in subdirectories(os.path.join(source, student))[:BENCHMARK_SUBMISSIONS]:
+        os.symlink(os.path.join(source, student, submission), os.path.join(target, student, submission))
+        count += 1
+  for directory in ("src", "data/c-to-rust", "data/c-to-python"):
+    os.makedirs(os.path.join(root, directory))
+  return count
+
+def reset_outputs(root):
+  for directory in ("data/c-to-rust", "data/c-to-python"):
+    shutil.rmtree(os.path.join(root, directory))
+    os.makedirs(os.path.join(root, directory))
+
+def run_pipeline(pipeline, root, run):
+  # -> (seconds, peak RSS in MB, spans, return code)
+  trace_path = os.path.join(root, f"trace-{pipeline}-{run}.jsonl")
+  environment = dict(
+    os.environ,
+    MODEL_BACKEND=BENCHMARK_BACKEND, NO_LLM_CACHE="1", NO_VERDICT_CACHE="1", NO_RESULTS_DB="1", TRACE_FILE=trace_path,
+    RUN_SEED=os.environ.get("RUN_SEED", "0"), BATCH_BUILD_DIR=os.path.join(root, "rust-batch")
+  )
+  for name, value in MOCK_ENVIRONMENT.items():
+    environment.setdefault(name, value)
+
+  with open(os.path.join(root, f"log-{pipeline}-{run}.txt"), "w") as log:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+      [ sys.executable, os.path.join(SRC_DIR, PIPELINES[pipeline][0]), *PIPELINES[pipeline][1:] ],
+      cwd=os.path.join(root, "src"), env=environment, stdout=log, stderr=subprocess.STDOUT
+    )
+    # wait4 rather than wait, for the resource usage of the whole (reaped) process tree
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+  process.returncode = os.waitstatus_to_exitcode(status)
+  spans = load_spans(trace_path) if os.path.exists(trace_path) else []
+  return seconds, usage.ru_maxrss / 1024, spans, process.returncode
+
+def measure(pipeline, root, submissions):
+  seconds = 0.0
+  peak_rss = 0.0
+  durations = {}
+  for run in range(BENCHMARK_REPETITIONS):
+    reset_outputs(root)
+    run_seconds, run_rss, spans, returncode = run_pipeline(pipeline, root, run)
+    if returncode != 0:
+      print_error(f"The {pipeline} pipeline exited with {returncode}, see {root}/log-{pipeline}-{run}.txt")
+    seconds += run_seconds
+    peak_rss = max(peak_rss, run_rss)
+    for stage, values in summarize(spans)[0].items():
+      durations.setdefault(stage, []).extend(values)
+  return {
+    "submissions": submissions,
+    "seconds": seconds / BENCHMARK_REPETITIONS,
+    "throughput": submissions * BENCHMARK_REPETITIONS / seconds * 60,
+    "peak_rss_mb": peak_rss,
+    "stages": {
+      stage: { "count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95) }
+      for stage, values in sorted(durations.items())
+    },
+  }
+
+def report(pipeline, result):
+  print_info(
+    f"{pipeline}: {result['submissions']} submissions in {result['seconds']:.2f}s, "
+    f"{result['throughput']:.1f} submissions/min, peak RSS {result['peak_rss_mb']:.1f} MB"
+  )
+  for stage, latency in result["stages"].items():
+    print_info(f"  {stage}: {latency['count']} spans, p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms")
+
+def compare(pipeline, result, baseline, tolerance = BENCHMARK_TOLERANCE):
+  # -> the metrics which regressed
+  checks = [ ("throughput", result["throughput"], baseline["throughput"], True, 0.0) ]
+  checks.append(("peak RSS", result["peak_rss_mb"], baseline["peak_rss_mb"], False, 0.0))
+  for stage, latency in result["stages"].items():
+    if stage in baseline["stages"]:
+      for quantile in ("p50", "p95"):
+        checks.append((
+          f"{stage} {quantile}", latency[quantile], baseline["stages"][stage][quantile], False, BENCHMARK_NOISE_FLOOR
+        ))
+
+  regressions = []
+  for metric, value, reference, higher_is_better, noise_floor in checks:
+    if not reference:
+      continue
+    change = (value - reference) / reference
+    worse = -change if higher_is_better else change
+    regressed = worse > tolerance and abs(value - reference) > noise_floor
+    print_info(f"{pipeline} {metric}: {value:.4g} vs {reference:.4g} ({change:+.1%}){' REGRESSION' if regressed else ''}")
+    if regressed:
+      regressions.append(f"{pipeline} {metric}")
+  return regressions
+
+def subset_description():
+  return {
+    "students": BENCHMARK_STUDENTS, "submissions": BENCHMARK_SUBMISSIONS, "backend": BENCHMARK_BACKEND,
+    "mock": { name: os.environ.get(name, value) for name, value in MOCK_ENVIRONMENT.items() },
+  }
+
+def run(update_baseline, root):
+  submissions = build_subset(root)
+  if submissions == 0:
+    print_error(f"No submissions found under {INTROCLASS_DIR}")
+    return 1
+  print_info(f"{submissions} submissions, {BENCHMARK_REPETITIONS} repetitions, working in {root}")
+
+  results = {}
+  for pipeline in BENCHMARK_PIPELINES:
+    results[pipeline] = measure(pipeline, root, submissions)
+    report(pipeline, results[pipeline])
+
+  if update_baseline:
+    os.makedirs(os.path.dirname(BENCHMARK_BASELINE), exist_ok=True)
+    with open(BENCHMARK_BASELINE, "w") as baseline_file:
+      json.dump({ "subset": subset_description(), "results": results }, baseline_file, indent=2)
+    print_info(f"Baseline stored in {BENCHMARK_BASELINE}")
+    return 0
+
+  if not os.path.exists(BENCHMARK_BASELINE):
+    print_info(f"No baseline in {BENCHMARK_BASELINE} yet (see --update-baseline)")
+    return 0
+  with open(BENCHMARK_BASELINE, "r") as baseline_file:
+    baseline = json.load(baseline_file)
+  if baseline["subset"] != subset_description():
+    print_error(f"The baseline was measured on another subset/model: {baseline['subset']}")
+    return 1
+  regressions = []
+  for pipeline, result in results.items():
+    if pipeline in baseline["results"]:
+      regressions += compare(pipeline, result, baseline["results"][pipeline])
+  if regressions:
+    print_error(f"Regressions: {', '.join(regressions)}")
+    return 1
+  print_info("No regressions")
+  return 0
+
+def main(update_baseline):
+  root = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+  status = run(update_baseline, root)
+  # kept around when something went wrong, for the logs and traces
+  if status == 0:
+    shutil.rmtree(root)
+  return status
+
+if __name__ == "__main__":
+  sys.exit(main("--update-baseline" in sys.argv[1:]))
@@ -0,0 +1,218 @@
+################################################################################
+# The reference programs, for how long a test case should take, and what a translation
+# should cost
+#
+# Every benchmark comes with its own correct C program (<benchmark>/tests/<benchmark>.c).
+# It's compiled once (gcc, cached by the source's hash in REFERENCE_BUILD_DIR) and run
+# on each of the benchmark's test cases, REFERENCE_RUNS times, which tells how long a
+# correct program takes on each of them and how much memory it needs at most - kept next
+# to the binary, so that it's only measured once per binary and test suite.
+#
+# That's used twice:
+# - a translation gets TIMEOUT_FACTOR times the reference's runtime, plus TIMEOUT_SLACK
+#   (for its own startup - an interpreter's, say), rather than the same fixed TEST_TIMEOUT
+#   for every case: a stuck translation is found out in about a second, rather than five
+#   per case. ADAPTIVE_TIMEOUTS=0 goes back to the fixed one;
+# - a translation which passes every test is scored against it (see score): once its
+#   runtime is over SLOWDOWN_THRESHOLD times the reference's, plus STARTUP_ALLOWANCE per
+#   case, it's a performance regression - correct, but no replacement for the C program.
+#   PERFORMANCE_CHECK=0 to not score anything.
+#
+# The reference is timed on its own, one case after the other, and the translations with
+# every core busy: on cases which take a millisecond or two, that alone makes a translation
+# look several times slower than it is. So runtimes under RUNTIME_NOISE_FLOOR (per case)
+# are taken as that, on both sides, before they're compared. Peak memory is the program's
+# own (see memory_probe), and only compared where both sides have one.
+
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import threading
+
+from memory_probe import memory_probe
+from test_runner import TEST_TIMEOUT, TIMEOUT, Cancellation, run_case
+from tracing import tracer
+
+ADAPTIVE_TIMEOUTS = os.environ.get("ADAPTIVE_TIMEOUTS", "1") == "1"
+PERFORMANCE_CHECK = os.environ.get("PERFORMANCE_CHECK", "1") == "1"
+REFERENCE_BUILD_DIR = os.environ.get(
+  "REFERENCE_BUILD_DIR", os.path.expanduser("~/.cache/llm-exercise/reference")
+)
+REFERENCE_RUNS = int(os.environ.get("REFERENCE_RUNS", 3))
+TIMEOUT_FACTOR = float(os.environ.get("TIMEOUT_FACTOR", 10))
+TIMEOUT_SLACK = float(os.environ.get("TIMEOUT_SLACK", 1.0))
+SLOWDOWN_THRESHOLD = float(os.environ.get("SLOWDOWN_THRESHOLD", 10))
+# in seconds per case: starting an interpreter (or even prlimit) is no fault of the translation
+STARTUP_ALLOWANCE = float(os.environ.get("STARTUP_ALLOWANCE", 0.05))
+# in seconds per case, what's too short to be timed reliably under load
+RUNTIME_NOISE_FLOOR = float(os.environ.get("RUNTIME_NOISE_FLOOR", 0.02))
+CC = os.environ.get("CC", "gcc")
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+print_error = lambda arg: print("[ERROR] " + str(arg))
+
+################################################################################
+
+def reference_source(benchmark):
+  # benchmark is the benchmark's directory, with a trailing slash
+  return benchmark + "tests/" + os.path.basename(os.path.normpath(benchmark)) + ".c"
+
+def compile_reference(source_path, build_dir = REFERENCE_BUILD_DIR):
+  # -> the binary's path, or None if it couldn't be built
+  try:
+    with open(source_path, "rb") as source:
+      digest = hashlib.sha256(source.read()).hexdigest()
+  except FileNotFoundError:
+    return None
+  binary_path = os.path.join(build_dir, digest[:16])
+  if os.path.exists(binary_path):
+    return binary_path
+  os.makedirs(build_dir, exist_ok=True)
+  temporary_path = f"{binary_path}.{os.getpid()}.tmp"
+  try:
+    result = subprocess.run(
+      [ CC, "-O2", "-o", temporary_path, source_path, "-lm" ], capture_output=True, text=True
+    )
+  except FileNotFoundError:
+    print_error(f"No {CC} to build the reference program with")
+    return None
+  if result.returncode != 0:
+    print_error(f"The reference program {source_path} doesn't compile: {result.stderr}")
+    return None
+  os.replace(temporary_path, binary_path)
+  return binary_path
+
+def measure_reference(binary_path, cases, runs = REFERENCE_RUNS):
+  # -> case name -> (the slowest of its runs, in seconds, and its peak memory, in KiB),
+  # or None for the cases which timed out
+  measurements = {}
+  for _ in range(runs):
+    for case in cases:
+      result = run_case([ binary_path ], case, os.path.dirname(binary_path), False, TEST_TIMEOUT, Cancellation())
+      if result.status == TIMEOUT:
+        measurements[case.name] = None
+      elif case.name not in measurements:
+        measurements[case.name] = (result.runtime, result.memory)
+      elif measurements[case.name] is not None:
+        runtime, memory = measurements[case.name]
+        measurements[case.name] = (max(runtime, result.runtime), max(memory or 0, result.memory or 0) or None)
+  return measurements
+
+def load_measurements(binary_path, index):
+  # -> the reference's measurements on the index's cases, measured only the first time
+  # (and again once there's a memory probe, for the memory)
+  probed = "probed" if memory_probe() is not None else "unprobed"
+  measurements_path = f"{binary_path}.{index.hash[:16]}.{probed}.json"
+  try:
+    with open(measurements_path, "r") as measurements_file:
+      return json.load(measurements_file)
+  except (FileNotFoundError, ValueError):
+    pass
+  measurements = measure_reference(binary_path, index.cases)
+  temporary_path = f"{measurements_path}.{os.getpid()}.tmp"
+  with open(temporary_path, "w") as measurements_file:
+    json.dump(measurements, measurements_file)
+  os.replace(temporary_path, measurements_path)
+  return measurements
+
+def timeout_for(reference_runtime):
+  return min(TEST_TIMEOUT, TIMEOUT_SLACK + TIMEOUT_FACTOR * reference_runtime)
+
+def attach_reference(index, benchmark):
+  # Sets the timeout and reference runtime/memory of each of the index's cases (see
+  # test_index); those the reference program couldn't be measured on keep the fixed
+  # timeout, and aren't scored
+  if not ADAPTIVE_TIMEOUTS and not PERFORMANCE_CHECK:
+    return
+  binary_path = compile_reference(reference_source(benchmark))
+  if binary_path is None:
+    return
+  measurements = load_measurements(binary_path, index)
+  for case in index.cases:
+    if measurements.get(case.name) is None:
+      continue
+    case.reference_runtime, case.reference_memory = measurements[case.name]
+    if ADAPTIVE_TIMEOUTS:
+      case.timeout = timeout_for(case.reference_runtime)
+  print_debug(f"Timeouts for {benchmark}: up to {max([ case.timeout or TEST_TIMEOUT for case in index.cases ], default=0):.2f}s")
+
+################################################################################
+
+class Performance:
+  def __init__(self, slowdown, worst_case, worst_slowdown, memory_ratio, regression):
+    self.slowdown = slowdown # the translation's runtime over the reference's, on all cases
+    self.worst_case = worst_case # the case it's the slowest on, relative to the reference
+    self.worst_slowdown = worst_slowdown
+    self.memory_ratio = memory_ratio # peak memory over the reference's, or None if unknown
+    self.regression = regression
+
+  def describe(self):
+    memory = f", {self.memory_ratio:.1f}x the memory" if self.memory_ratio is not None else ""
+    verdict = ", a performance regression" if self.regression else ""
+    return f"{self.slowdown:.1f}x the reference's runtime (up to {self.worst_slowdown:.1f}x, on {self.worst_case}){memory}{verdict}"
+
+def score(matrix, cases, threshold = SLOWDOWN_THRESHOLD, allowance = STARTUP_ALLOWANCE, floor = RUNTIME_NOISE_FLOOR):
+  # matrix is a passing TestReport's (see test_runner.TestReport.matrix) - cached verdicts
+  # included - and cases its test index's -> a Performance, or None without a reference
+  references = { case.name: case for case in cases if case.reference_runtime }
+  rows = [ row for row in matrix if row["name"] in references and row.get("runtime") ]
+  if not rows:
+    return None
+  runtimes = { row["name"]: max(row["runtime"], floor) for row in rows }
+  reference_runtimes = { row["name"]: max(references[row["name"]].reference_runtime, floor) for row in rows }
+  runtime = sum(runtimes.values())
+  reference_runtime = sum(reference_runtimes.values())
+  worst = max(runtimes, key=lambda name: runtimes[name] / reference_runtimes[name])
+  # the cases both peaks are known on (none, for a warm interpreter's, see warm_runner)
+  measured = [ row for row in rows if row.get("memory") and references[row["name"]].reference_memory ]
+  memory_ratio = (
+    max([ row["memory"] for row in measured ]) / max([ references[row["name"]].reference_memory for row in measured ])
+    if measured else None
+  )
+  return Performance(
+    runtime / reference_runtime, worst, runtimes[worst] / reference_runtimes[worst],
+    memory_ratio, runtime > threshold * reference_runtime + allowance * len(rows)
+  )
+
+class PerformanceStats:
+  # How the translations that pass fare against the reference programs - printed at the
+  # end of a sweep
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.slowdowns = []
+    self.regressions = 0
+
+  def record(self, performance):
+    with self.lock:
+      self.slowdowns.append(performance.slowdown)
+      self.regressions += performance.regression
+
+  def summary(self):
+    with self.lock:
+      if not self.slowdowns:
+        return "no translation scored"
+      return (
+        f"{len(self.slowdowns)} translations scored, median slowdown {statistics.median(self.slowdowns):.1f}x, "
+        f"{self.regressions} performance regressions (over {SLOWDOWN_THRESHOLD:g}x)"
+      )
+
+performance_stats = PerformanceStats()
+
+def check_performance(name, matrix, cases):
+  # For a translation which passed every test -> its Performance (None if there's no
+  # reference to compare it to), which is also recorded as a "performance" event
+  if not PERFORMANCE_CHECK:
+    return None
+  performance = score(matrix, cases)
+  if performance is None:
+    return None
+  print_debug(f"Performance of {name}: {performance.describe()}")
+  performance_stats.record(performance)
+  tracer.event(
+    "performance", slowdown=performance.slowdown, worst_case=performance.worst_case,
+    worst_slowdown=performance.worst_slowdown, memory_ratio=performance.memory_ratio,
+    regression=performance.regression
+  )
+  return performance
@@ -0,0 +1,217 @@
+################################################################################
+# Budgeted repair loop
+#
+# A submission used to be retried by process_submission calling itself, with at most one
+# compilation-repair round and one test-repair round, however long those took. Each
+# submission is now a small state machine instead - TRANSLATE, then REPAIR (as long as it
+# fails and has budget left), then DONE - with its own budget: a maximum number of repair
+# rounds, of tokens (prompts and replies, estimated) and of time, counting only its own
+# rounds (not the time spent queued behind everybody else's, see RepairScheduler).
+#
+# Rounds are handed out by a single scheduler for the whole sweep: every first translation
+# goes first, then the repair rounds, most promising first. How promising a repair is comes
+# from how close the submission got (the share of tests it passes, how many compilation
+# errors it has) and from how often repairing that kind of failure has worked so far in
+# the sweep; a sweep-wide deadline stops handing out repair rounds altogether, so a handful
+# of hopeless submissions can't hold everything else up.
+
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+from inference_client import InferenceUnavailable
+from sweep import WORKERS
+from test_runner import CANCELLED, PASS
+from tracing import span, tracer
+
+REPAIR_MAX_ROUNDS = int(os.environ.get("REPAIR_MAX_ROUNDS", 2))
+# 0 means no limit, for these and REPAIR_SWEEP_DEADLINE (seconds, the deadlines)
+REPAIR_MAX_TOKENS = int(os.environ.get("REPAIR_MAX_TOKENS", 8192))
+REPAIR_DEADLINE = float(os.environ.get("REPAIR_DEADLINE", 300))
+REPAIR_SWEEP_DEADLINE = float(os.environ.get("REPAIR_SWEEP_DEADLINE", 0))
+
+TRANSLATE = "TRANSLATE"
+REPAIR = "REPAIR"
+DONE = "DONE"
+
+# rustc's, that is: "error[E0308]: mismatched types", "error: expected one of ..."
+COMPILER_ERROR = re.compile(r"^error(\[E\d+\])?: (?!aborting due to)", re.MULTILINE)
+
+print_error = lambda arg: print("[ERROR] " + str(arg))
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+
+################################################################################
+
+def estimate_tokens(*texts):
+  # ~4 characters per token, which is about right for code; only used for budgeting
+  return sum(len(str(text)) for text in texts if text) // 4
+
+class RepairBudget:
+  def __init__(self, max_rounds = REPAIR_MAX_ROUNDS, max_tokens = REPAIR_MAX_TOKENS, deadline = REPAIR_DEADLINE):
+    self.max_rounds = max_rounds
+    self.max_tokens = max_tokens
+    self.deadline = deadline
+
+class Repair:
+  # One submission's way through the loop; job is whatever the script needs to run a round,
+  # and tags what its spans are tagged with (see tracing.submission_tags)
+  def __init__(self, name, code, job, budget = None, tags = None):
+    self.name = name
+    self.code = code # the C source, read once
+    self.job = job
+    self.budget = budget or RepairBudget()
+    self.tags = tags or {}
+    self.state = TRANSLATE
+    self.result = None # the latest QueryResult
+    self.rounds = 0 # repair rounds, the first translation aside
+    self.tokens = 0
+    self.elapsed = 0.0 # seconds spent in its own rounds
+    # why it's DONE: "success", "rounds", "tokens", "deadline", "sweep deadline",
+    # "inference unavailable" or "error"
+    self.outcome = None
+
+  def attempt(self):
+    # Which attempt the next round is: 0 for the first translation, then 1, 2, ... for the repairs
+    return self.rounds + (self.state == REPAIR)
+
+  def feedback(self):
+    # What the next query should be told about: "COMPILER_FAILURE", "TEST_FAILURE" or None
+    return self.result.result if self.state == REPAIR else None
+
+  def exhausted(self):
+    if self.rounds >= self.budget.max_rounds:
+      return "rounds"
+    if self.budget.max_tokens and self.tokens >= self.budget.max_tokens:
+      return "tokens"
+    if self.budget.deadline and self.elapsed >= self.budget.deadline:
+      return "deadline"
+    return None
+
+  def advance(self, result, tokens, elapsed = 0.0):
+    if self.state == REPAIR:
+      self.rounds += 1
+    self.result = result
+    self.tokens += tokens
+    self.elapsed += elapsed
+    if result.result == "TEST_SUCCESS":
+      self.finish("success")
+    elif self.exhausted():
+      self.finish(self.exhausted())
+    else:
+      self.state = REPAIR
+
+  def finish(self, outcome):
+    self.state = DONE
+    self.outcome = outcome
+
+def closeness(result):
+  # How far from passing a failed attempt is, between 0 (nowhere near) and 1
+  if result.result == "TEST_FAILURE" and result.matrix:
+    ran = [ row for row in result.matrix if row["status"] != CANCELLED ]
+    return (1 + sum(row["status"] == PASS for row in ran)) / (2 + len(ran))
+  if result.result == "COMPILER_FAILURE":
+    return 1 / (1 + len(COMPILER_ERROR.findall(getattr(result, "error", None) or "")))
+  return 0.5
+
+class RepairScheduler:
+  def __init__(self, run_round, on_done, workers = WORKERS, sweep_deadline = REPAIR_SWEEP_DEADLINE):
+    # run_round(repair) makes one query (repair.feedback() says which) and returns its
+    # QueryResult along with how many tokens it took; on_done(repair) is called once per
+    # submission, when it's DONE
+    self.run_round = run_round
+    self.on_done = on_done
+    self.workers = workers
+    self.sweep_deadline = sweep_deadline
+    self.condition = threading.Condition()
+    self.queue = [] # (-priority, insertion order, repair)
+    self.order = itertools.count()
+    self.in_flight = 0
+    self.started = None
+    # feedback kind -> [repairs which ended up passing, repairs tried]
+    self.repairs = { "COMPILER_FAILURE": [ 0, 0 ], "TEST_FAILURE": [ 0, 0 ] }
+    self.outcomes = {}
+
+  def priority(self, repair):
+    if repair.state == TRANSLATE:
+      return 2.0
+    successes, attempts = self.repairs[repair.feedback()]
+    return (successes + 1) / (attempts + 2) * closeness(repair.result)
+
+  def push(self, repair):
+    # must be called with the lock held
+    heapq.heappush(self.queue, (-self.priority(repair), next(self.order), repair))
+    self.condition.notify()
+
+  def next_repair(self):
+    with self.condition:
+      while not self.queue:
+        if self.in_flight == 0:
+          return None
+        self.condition.wait()
+      _, _, repair = heapq.heappop(self.queue)
+      self.in_flight += 1
+      return repair
+
+  def step(self, repair):
+    if repair.state == REPAIR and self.sweep_deadline and time.monotonic() - self.started >= self.sweep_deadline:
+      return repair.finish("sweep deadline")
+    feedback = repair.feedback()
+    started = time.monotonic()
+    try:
+      with tracer.context(**repair.tags, attempt=repair.attempt()), span("round", feedback=feedback) as record:
+        result, tokens = self.run_round(repair)
+        record["verdict"] = result.result
+    except InferenceUnavailable as e:
+      # the client already retried (and backed off) as much as it was allowed to
+      print_error(f"Inference unavailable for {repair.name}, giving up on it: {str(e)}")
+      return repair.finish("inference unavailable")
+    except Exception as e:
+      print_error(f"An error occurred for {repair.name}: {str(e)}")
+      return repair.finish("error")
+    repair.advance(result, tokens, time.monotonic() - started)
+    if feedback is not None:
+      with self.condition:
+        self.repairs[feedback][0] += int(result.result == "TEST_SUCCESS")
+        self.repairs[feedback][1] += 1
+
+  def work(self):
+    while True:
+      repair = self.next_repair()
+      if repair is None:
+        return
+      self.step(repair)
+      if repair.state == DONE:
+        print_debug(f"Done with {repair.name} after {repair.rounds} repair rounds ({repair.outcome})")
+        tracer.event("outcome", **repair.tags, outcome=repair.outcome, rounds=repair.rounds, tokens=repair.tokens)
+        try:
+          self.on_done(repair)
+        except Exception as e:
+          print_error(f"An error occurred for {repair.name}: {str(e)}")
+      with self.condition:
+        self.in_flight -= 1
+        if repair.state == DONE:
+          self.outcomes[repair.outcome] = self.outcomes.get(repair.outcome, 0) + 1
+        else:
+          self.push(repair)
+        self.condition.notify_all()
+
+  def run(self, repairs):
+    self.started = time.monotonic()
+    with self.condition:
+      for repair in repairs:
+        self.push(repair)
+    threads = [ threading.Thread(target=self.work) for _ in range(max(1, self.workers)) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+  def summary(self):
+    with self.condition:
+      return ", ".join(
+        [ f"{outcome}: {count}" for outcome, count in sorted(self.outcomes.items()) ]
+        + [ f"{kind.lower()} repairs: {successes}/{attempts} passed" for kind, (successes, attempts) in self.repairs.items() ]
+      )
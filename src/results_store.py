@@ -0,0 +1,268 @@
+################################################################################
+# Queryable store for every attempt's results
+#
+# Each query's QueryResult used to be printed and thrown away, leaving only the totals.
+# Every attempt now ends up as a row of a SQLite database (RESULTS_DB), shared by every
+# run: which run it's from (RUN_ID, a fresh one per run unless set), the submission, the
+# attempt number and prompt variant, the model's parameters and seed, how long the query
+# and the verdict took, the verdict itself, the compiler error/test outputs that came with
+# it, and the rustc error codes found in it. What each submission ended up as (see the
+# "outcome" events in tracing) gets a row of its own, and so does how a passing translation
+# fares against the reference program (the "performance" events, see reference), and how
+# a best-of-N race went (the "best of n" events, see best_of_n).
+#
+# Both are indexed for the questions we keep asking, e.g.
+#
+#   python results_store.py runs
+#   python results_store.py pass-rates [run id]    # per benchmark
+#   python results_store.py error-codes [run id]   # the most common rustc error codes
+#   python results_store.py performance [run id]   # slowdowns and regressions, per benchmark
+#   python results_store.py pass-at-k [run id]     # best-of-N races, per benchmark
+#
+# and anything else is one `sqlite3 $RESULTS_DB` away. NO_RESULTS_DB=1 to store nothing.
+
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+from tracing import tracer
+
+RESULTS_DB = os.environ.get(
+  "RESULTS_DB", os.path.expanduser("~/.cache/llm-exercise/results.sqlite")
+)
+NO_RESULTS_DB = os.environ.get("NO_RESULTS_DB") == "1"
+RUN_ID = os.environ.get("RUN_ID") or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+# what the query was told about (see repair.Repair.feedback) -> which prompt it got
+PROMPT_VARIANTS = { None: "translation", "COMPILER_FAILURE": "compilation error", "TEST_FAILURE": "test failure" }
+# rustc's "error[E0308]: mismatched types"
+ERROR_CODE = re.compile(r"^error\[(E\d+)\]", re.MULTILINE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  run_id TEXT PRIMARY KEY, script TEXT, model TEXT, backend TEXT, parameters TEXT,
+  run_seed TEXT, started REAL, finished REAL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+  id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, benchmark TEXT, student TEXT, submission TEXT,
+  attempt INTEGER, prompt_variant TEXT, seed INTEGER, parameters TEXT, started REAL,
+  query_seconds REAL, verdict_seconds REAL, tokens INTEGER, verdict TEXT, error TEXT,
+  expected_output TEXT, actual_output TEXT, tests_passed INTEGER, tests_run INTEGER
+);
+CREATE INDEX IF NOT EXISTS attempts_by_run ON attempts (run_id, benchmark, verdict);
+CREATE INDEX IF NOT EXISTS attempts_by_benchmark ON attempts (benchmark, verdict);
+CREATE TABLE IF NOT EXISTS error_codes (
+  attempt_id INTEGER NOT NULL, run_id TEXT NOT NULL, benchmark TEXT, code TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS error_codes_by_code ON error_codes (code);
+CREATE INDEX IF NOT EXISTS error_codes_by_run ON error_codes (run_id, code);
+CREATE TABLE IF NOT EXISTS outcomes (
+  run_id TEXT NOT NULL, benchmark TEXT, student TEXT, submission TEXT, outcome TEXT,
+  rounds INTEGER, tokens INTEGER, copy_of TEXT
+);
+CREATE INDEX IF NOT EXISTS outcomes_by_benchmark ON outcomes (benchmark, outcome);
+CREATE INDEX IF NOT EXISTS outcomes_by_run ON outcomes (run_id, benchmark, outcome);
+CREATE TABLE IF NOT EXISTS performance (
+  run_id TEXT NOT NULL, benchmark TEXT, student TEXT, submission TEXT, attempt INTEGER,
+  slowdown REAL, worst_case TEXT, worst_slowdown REAL, memory_ratio REAL, regression INTEGER
+);
+CREATE INDEX IF NOT EXISTS performance_by_run ON performance (run_id, benchmark, regression);
+CREATE TABLE IF NOT EXISTS best_of_n (
+  run_id TEXT NOT NULL, benchmark TEXT, student TEXT, submission TEXT, candidates INTEGER,
+  judged INTEGER, cancelled INTEGER, passed INTEGER, first_success REAL, first_success_rank INTEGER
+);
+CREATE INDEX IF NOT EXISTS best_of_n_by_run ON best_of_n (run_id, benchmark);
+"""
+
+print_info = lambda arg: print("[INFO] " + str(arg))
+
+################################################################################
+
+class ResultsStore:
+  def __init__(self, path = RESULTS_DB, run_id = RUN_ID, enabled = not NO_RESULTS_DB, target = None):
+    self.path = path
+    self.run_id = run_id
+    self.enabled = enabled
+    # with several targets in one process (see engine), each one has a store (and run) of
+    # its own, which only keeps its own outcomes
+    self.target = target
+    self.lock = threading.Lock()
+    self.connection = None
+    self.attempts = 0
+
+  def connect(self):
+    # must be called with the lock held; the database is only created once it's needed
+    if self.connection is None:
+      os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+      self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+      # several runs (e.g. c-to-rust and c-to-python) can write to it at once
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute("PRAGMA synchronous=NORMAL")
+      self.connection.executescript(SCHEMA)
+    return self.connection
+
+  def write(self, statements):
+    # statements is a function of the connection, run in a single transaction
+    if not self.enabled:
+      return None
+    with self.lock:
+      connection = self.connect()
+      with connection:
+        return statements(connection)
+
+  def start_run(self, script, model, backend, parameters, run_seed = None):
+    self.write(lambda connection: connection.execute(
+      "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+      (self.run_id, script, model, backend, json.dumps(parameters, sort_keys=True), run_seed, time.time())
+    ))
+    if self.enabled:
+      tracer.sinks.append(self.on_record)
+
+  def finish_run(self):
+    self.write(lambda connection: connection.execute(
+      "UPDATE runs SET finished = ? WHERE run_id = ?", (time.time(), self.run_id)
+    ))
+    if self.enabled:
+      print_info(f"Results: {self.attempts} attempts stored in {self.path}, as run {self.run_id}")
+
+  def record_attempt(
+    self, tags, attempt, feedback, parameters, result, query_seconds, verdict_seconds, tokens = None
+  ):
+    # tags identify the submission (see tracing.submission_tags), result is a QueryResult
+    prompt_variant = PROMPT_VARIANTS[feedback]
+    error = getattr(result, "error", None)
+    expected_output, actual_output = result.outputs or (None, None)
+    matrix = result.matrix or []
+    row = (
+      self.run_id, tags.get("benchmark"), tags.get("student"), tags.get("submission"), attempt,
+      prompt_variant, parameters.get("seed"), json.dumps(parameters, sort_keys=True),
+      time.time() - query_seconds - verdict_seconds, query_seconds, verdict_seconds, tokens,
+      result.result, error, expected_output, actual_output,
+      sum(case["status"] == "PASS" for case in matrix), sum(case["status"] != "CANCELLED" for case in matrix)
+    )
+
+    def insert(connection):
+      cursor = connection.execute(
+        "INSERT INTO attempts VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+      )
+      connection.executemany(
+        "INSERT INTO error_codes VALUES (?, ?, ?, ?)",
+        [ (cursor.lastrowid, self.run_id, tags.get("benchmark"), code) for code in ERROR_CODE.findall(error or "") ]
+      )
+      self.attempts += 1
+    self.write(insert)
+
+  def on_record(self, record):
+    # a tracer sink: only the outcomes, performance scores and best-of-N races are kept,
+    # the spans themselves are in TRACE_FILE
+    if self.target is not None and record.get("target") != self.target:
+      return
+    if record["stage"] == "performance":
+      self.write(lambda connection: connection.execute(
+        "INSERT INTO performance VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+          self.run_id, record.get("benchmark"), record.get("student"), record.get("submission"),
+          record.get("attempt"), record["slowdown"], record["worst_case"], record["worst_slowdown"],
+          record["memory_ratio"], record["regression"]
+        )
+      ))
+    if record["stage"] == "best of n":
+      self.write(lambda connection: connection.execute(
+        "INSERT INTO best_of_n VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+          self.run_id, record.get("benchmark"), record.get("student"), record.get("submission"),
+          record["candidates"], record["judged"], record["cancelled"], record["passed"],
+          record["first_success"], record["first_success_rank"]
+        )
+      ))
+    if record["stage"] != "outcome":
+      return
+    self.write(lambda connection: connection.execute(
+      "INSERT INTO outcomes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+      (
+        self.run_id, record.get("benchmark"), record.get("student"), record.get("submission"),
+        record["outcome"], record.get("rounds"), record.get("tokens"), record.get("copy_of")
+      )
+    ))
+
+  def query(self, statement, parameters = ()):
+    with self.lock:
+      return self.connect().execute(statement, parameters).fetchall()
+
+results_store = ResultsStore()
+
+################################################################################
+
+def print_runs(store):
+  for run_id, script, model, backend, started, finished, attempts in store.query(
+    "SELECT runs.run_id, script, model, backend, started, finished, "
+    "(SELECT COUNT(*) FROM attempts WHERE attempts.run_id = runs.run_id) FROM runs ORDER BY started"
+  ):
+    duration = f"{finished - started:.0f}s" if finished else "unfinished"
+    print(f"{run_id}: {script}, {model} ({backend}), {attempts} attempts, {duration}")
+
+def print_pass_rates(store, run_id = None):
+  # per script too, since c-to-rust and c-to-python runs share the database
+  where, parameters = ("WHERE run_id = ?", (run_id,)) if run_id else ("", ())
+  for script, benchmark, successes, total in store.query(
+    "SELECT script, benchmark, SUM(outcome = 'success'), COUNT(*) FROM outcomes JOIN runs USING (run_id) "
+    f"{where} GROUP BY script, benchmark ORDER BY script, benchmark",
+    parameters
+  ):
+    print(f"{script} {benchmark}: {successes}/{total} ({successes / total:.1%})")
+
+def print_error_codes(store, run_id = None, limit = 20):
+  where, parameters = ("WHERE run_id = ?", (run_id,)) if run_id else ("", ())
+  for code, count in store.query(
+    f"SELECT code, COUNT(*) FROM error_codes {where} GROUP BY code ORDER BY COUNT(*) DESC LIMIT ?",
+    parameters + (limit,)
+  ):
+    print(f"{code}: {count}")
+
+def print_performance(store, run_id = None):
+  where, parameters = ("WHERE run_id = ?", (run_id,)) if run_id else ("", ())
+  for script, benchmark, scored, slowdown, worst_slowdown, regressions in store.query(
+    "SELECT script, benchmark, COUNT(*), AVG(slowdown), MAX(worst_slowdown), SUM(regression) "
+    f"FROM performance JOIN runs USING (run_id) {where} GROUP BY script, benchmark ORDER BY script, benchmark",
+    parameters
+  ):
+    print(
+      f"{script} {benchmark}: {scored} scored, {slowdown:.1f}x on average (up to {worst_slowdown:.1f}x "
+      f"on a single case), {regressions} performance regressions"
+    )
+
+def print_pass_at_k(store, run_id = None):
+  # pass@k being the share of submissions with a passing candidate among the first k judged
+  where, parameters = ("WHERE run_id = ?", (run_id,)) if run_id else ("", ())
+  races = {}
+  for script, benchmark, candidates, rank, first_success in store.query(
+    "SELECT script, benchmark, candidates, first_success_rank, first_success "
+    f"FROM best_of_n JOIN runs USING (run_id) {where} ORDER BY script, benchmark",
+    parameters
+  ):
+    races.setdefault((script, benchmark), []).append((candidates, rank, first_success))
+  for (script, benchmark), rows in races.items():
+    pass_at_k = ", ".join([
+      f"pass@{k} {sum(rank is not None and rank <= k for _, rank, _ in rows) / len(rows):.2f}"
+      for k in range(1, max(candidates for candidates, _, _ in rows) + 1)
+    ])
+    first_successes = [ first_success for _, _, first_success in rows if first_success is not None ]
+    first_success = f", first success after {statistics.median(first_successes):.2f}s (median)" if first_successes else ""
+    print(f"{script} {benchmark}: {len(rows)} races, {pass_at_k}{first_success}")
+
+COMMANDS = {
+  "runs": print_runs, "pass-rates": print_pass_rates, "error-codes": print_error_codes,
+  "performance": print_performance, "pass-at-k": print_pass_at_k,
+}
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+    print(f"Usage: python results_store.py {'|'.join(COMMANDS)} [run id]")
+    sys.exit(1)
+  COMMANDS[sys.argv[1]](results_store, *sys.argv[2:3])
@@ -0,0 +1,283 @@
+################################################################################
+# Everything needed to turn a translated main.rs into ./main
+#
+# The harness never used Cargo (it's `rustc src/main.rs` all the way), so `cargo init`
+# per submission was just spawning a process and leaving a stray .git behind each time;
+# the scaffold below only creates what compiling and testing actually need.
+#
+# With BATCH_COMPILE=1, translations waiting to be compiled are grouped up (see batching)
+# and built by a single `cargo build`, as the [[bin]]s of one package, rather than paying
+# for a whole rustc process per translation; the diagnostics are then split back per bin.
+#
+# Either way, compiling happens in two phases: a check-only pass (metadata, no codegen)
+# first, which is all the repair prompt needs when the code doesn't compile, and the
+# actual build only for code which passed it. Set TWO_PHASE_COMPILE=0 to skip the check.
+#
+# Diagnostics are asked for as json: the result's stderr is still what rustc would have
+# printed, and its `diagnostics` what the repair prompt needs of each (see compaction).
+
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from batching import MicroBatcher
+from verdict_cache import toolchain_version
+
+# CARGO=1 for translations which need crates: each output directory gets a Cargo.toml,
+# with CARGO_DEPENDENCIES (TOML lines, e.g. 'rand = "0.8"') as its dependencies
+CARGO_MODE = os.environ.get("CARGO") == "1"
+CARGO_DEPENDENCIES = os.environ.get("CARGO_DEPENDENCIES", "")
+
+TWO_PHASE_COMPILE = os.environ.get("TWO_PHASE_COMPILE", "1") == "1"
+
+BATCH_COMPILE = os.environ.get("BATCH_COMPILE") == "1"
+BATCH_COMPILE_SIZE = int(os.environ.get("BATCH_COMPILE_SIZE", 16))
+BATCH_COMPILE_WAIT = float(os.environ.get("BATCH_COMPILE_WAIT", 2.0))
+BATCH_BUILD_DIR = os.environ.get(
+  "BATCH_BUILD_DIR", os.path.expanduser("~/.cache/llm-exercise/rust-batch")
+)
+
+CARGO_MANIFEST = """[package]
+name = "translation"
+version = "0.1.0"
+edition = "2021"
+
+[[bin]]
+name = "main"
+path = "src/main.rs"
+
+[dependencies]
+{dependencies}
+"""
+
+# edition 2015 is what plain `rustc src/main.rs` compiles with
+BATCH_MANIFEST = """[package]
+name = "batch"
+version = "0.1.0"
+edition = "2015"
+autobins = false
+
+{bins}
+[dependencies]
+{dependencies}
+"""
+
+################################################################################
+
+class CompileStats:
+  # How long each phase took, overall - printed at the end of a sweep, to see what the
+  # check-only pass is saving
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.runs = { "check": 0, "build": 0 }
+    self.seconds = { "check": 0.0, "build": 0.0 }
+    self.skipped_builds = 0
+
+  def record(self, phase, seconds, runs = 1):
+    with self.lock:
+      self.runs[phase] += runs
+      self.seconds[phase] += seconds
+
+  def skip_builds(self, amount = 1):
+    with self.lock:
+      self.skipped_builds += amount
+
+  def summary(self):
+    with self.lock:
+      return ", ".join(
+        [ f"{phase}: {self.runs[phase]} runs, {self.seconds[phase]:.2f}s" for phase in ("check", "build") ]
+        + [ f"builds skipped after a failed check: {self.skipped_builds}" ]
+      )
+
+compile_stats = CompileStats()
+
+def timed_run(command, cwd):
+  start = time.perf_counter()
+  result = subprocess.run(command, capture_output=True, text=True, cwd=cwd)
+  return result, time.perf_counter() - start
+
+def scaffold_rust(rust_dir, cargo = CARGO_MODE):
+  # Idempotent, so it can just be called every time a submission is (re)processed
+  os.makedirs(rust_dir + "/src", exist_ok=True)
+  if cargo:
+    with open(rust_dir + "/Cargo.toml", "w") as manifest:
+      manifest.write(CARGO_MANIFEST.format(dependencies=CARGO_DEPENDENCIES))
+
+def rust_toolchain(cargo = CARGO_MODE):
+  # What, besides the source itself, decides whether/how a translation compiles
+  # (used to key the verdict cache)
+  toolchain = toolchain_version(["rustc", "--version", "--verbose"])
+  if cargo:
+    toolchain += toolchain_version(["cargo", "--version"]) + CARGO_DEPENDENCIES
+  return toolchain
+
+def describe_child(child):
+  # e.g. "help: a local variable with a similar name exists: `a`"
+  suggestions = [ span["suggested_replacement"] for span in child.get("spans", []) if span.get("suggested_replacement") ]
+  suggestion = f": `{suggestions[0]}`" if suggestions else ""
+  return f"{child['level']}: {child['message']}{suggestion}"
+
+def summarize_diagnostic(message, strip_prefix = ""):
+  # One of rustc's json diagnostics -> its level, code and message, where its primary span
+  # points (and the source line there), and its first notes/helps
+  primary = next((span for span in message.get("spans", []) if span.get("is_primary")), None)
+  return {
+    "level": message.get("level"),
+    "code": (message.get("code") or {}).get("code"),
+    "message": message.get("message"),
+    "file": primary["file_name"].replace(strip_prefix, "") if primary else None,
+    "line": primary["line_start"] if primary else None,
+    "column": primary["column_start"] if primary else None,
+    "text": primary["text"][0]["text"] if primary and primary.get("text") else None,
+    "label": primary.get("label") if primary else None,
+    "notes": [ describe_child(child) for child in message.get("children", []) ][:2],
+  }
+
+def parse_rustc_messages(stderr):
+  # `rustc --error-format=json`'s stderr -> what rustc would have printed without it, and
+  # the diagnostics' summaries
+  rendered = []
+  diagnostics = []
+  for line in stderr.splitlines(keepends=True):
+    try:
+      message = json.loads(line)
+    except ValueError:
+      rendered.append(line) # not a diagnostic, e.g. a linker error
+      continue
+    if not isinstance(message, dict) or "message" not in message:
+      continue
+    rendered.append(message.get("rendered") or "")
+    diagnostics.append(summarize_diagnostic(message))
+  return "".join(rendered), diagnostics
+
+def from_cargo(result, messages, artifacts):
+  # For the cargo commands: what they found, as if it came from plain rustc
+  result.diagnostics = [ summarize_diagnostic(message) for message in messages.get("main", []) ]
+  result.stderr = "".join([ message.get("rendered") or "" for message in messages.get("main", []) ]) + result.stderr
+  return result
+
+def compile_rust(rust_dir, cargo = CARGO_MODE):
+  # Returns the finished process (returncode/stderr/diagnostics), with ./main in rust_dir on
+  # success, and how long each phase took as its `phases` attribute
+  if BATCH_COMPILE:
+    return batch_compiler.run(rust_dir)
+  if cargo:
+    check_command = ["cargo", "check", "--quiet", "--message-format=json"]
+    build_command = ["cargo", "build", "--quiet", "--message-format=json"]
+    parse = lambda result: from_cargo(result, *parse_cargo_messages(result.stdout))
+  else:
+    check_command = ["rustc", "--error-format=json", "--emit=metadata=" + os.devnull, "src/main.rs"]
+    build_command = ["rustc", "--error-format=json", "src/main.rs"]
+    def parse(result):
+      result.stderr, result.diagnostics = parse_rustc_messages(result.stderr)
+      return result
+
+  phases = {}
+  if TWO_PHASE_COMPILE:
+    check_result, phases["check"] = timed_run(check_command, rust_dir)
+    compile_stats.record("check", phases["check"])
+    if check_result.returncode != 0:
+      compile_stats.skip_builds()
+      check_result.phases = phases
+      return parse(check_result)
+
+  compilation_result, phases["build"] = timed_run(build_command, rust_dir)
+  compile_stats.record("build", phases["build"])
+  if cargo and compilation_result.returncode == 0:
+    # the tests run ./main, just like for plain rustc
+    shutil.copy2(rust_dir + "/target/debug/main", rust_dir + "/main")
+  compilation_result.phases = phases
+  return parse(compilation_result)
+
+def parse_cargo_messages(stdout):
+  # Splits `cargo ... --message-format=json` output per target: the diagnostics (rustc's
+  # json ones), and the targets which were built successfully (with their executable, if any)
+  messages = {}
+  artifacts = {}
+  for line in stdout.splitlines():
+    try:
+      message = json.loads(line)
+    except ValueError:
+      continue
+    name = message.get("target", {}).get("name")
+    if message.get("reason") == "compiler-message":
+      messages.setdefault(name, []).append(message["message"])
+    elif message.get("reason") == "compiler-artifact":
+      artifacts[name] = message.get("executable")
+  return messages, artifacts
+
+def batch_build_dir():
+  # One package per process (removed when it exits): a batch is built by a single thread
+  # (batch_compiler's), but concurrent runs would otherwise overwrite each other's manifest
+  # and binaries
+  return f"{BATCH_BUILD_DIR}/{os.getpid()}"
+
+def build_batch(rust_dirs):
+  # Each translation becomes bin t<i> of the batch package; the package (and its target/)
+  # is reused across batches, so the dependencies (if any) are only built once per run
+  build_dir = batch_build_dir()
+  if not os.path.isdir(build_dir):
+    os.makedirs(build_dir)
+    atexit.register(shutil.rmtree, build_dir, ignore_errors=True)
+  names = [ f"t{i}" for i in range(len(rust_dirs)) ]
+  # cargo resolves the ..s in the engine's paths (SRC_DIR + "/../data/..."), so the paths
+  # given to it are resolved already, for its diagnostics' paths to be stripped below
+  real_dirs = [ os.path.realpath(rust_dir) for rust_dir in rust_dirs ]
+  bins = "".join(
+    f'[[bin]]\nname = "{name}"\npath = {json.dumps(real_dir + "/src/main.rs")}\n\n'
+    for name, real_dir in zip(names, real_dirs)
+  )
+  with open(build_dir + "/Cargo.toml", "w") as manifest:
+    manifest.write(BATCH_MANIFEST.format(bins=bins, dependencies=CARGO_DEPENDENCIES if CARGO_MODE else ""))
+
+  # --keep-going, so that one translation's errors don't stop the others from being built
+  messages = {}
+  to_build = names
+  check_phase = 0.0
+  build_stderr = ""
+  if TWO_PHASE_COMPILE:
+    check, check_phase = timed_run(
+      ["cargo", "check", "--keep-going", "--message-format=json"], build_dir
+    )
+    compile_stats.record("check", check_phase, len(names))
+    messages, checked = parse_cargo_messages(check.stdout)
+    to_build = [ name for name in names if name in checked ]
+    compile_stats.skip_builds(len(names) - len(to_build))
+    build_stderr = check.stderr
+
+  build_phase = 0.0
+  executables = {}
+  if to_build:
+    build, build_phase = timed_run(
+      ["cargo", "build", "--keep-going", "--message-format=json"] + [ f"--bin={name}" for name in to_build ],
+      build_dir
+    )
+    compile_stats.record("build", build_phase, len(to_build))
+    # the check's diagnostics are replayed by the build, no need to keep both
+    build_messages, executables = parse_cargo_messages(build.stdout)
+    messages.update(build_messages)
+    build_stderr = build.stderr
+
+  results = []
+  for name, rust_dir, real_dir in zip(names, rust_dirs, real_dirs):
+    # rustc's paths are absolute here, they're made to look like `rustc src/main.rs`'s again
+    stderr = "".join([ message.get("rendered") or "" for message in messages.get(name, []) ]).replace(real_dir + "/", "")
+    if executables.get(name):
+      shutil.copy2(executables[name], rust_dir + "/main")
+      returncode = 0
+    else:
+      returncode = 1
+      # no diagnostics of its own means cargo itself failed (e.g. a dependency didn't build)
+      stderr = stderr or build_stderr
+    result = subprocess.CompletedProcess(["rustc", "src/main.rs"], returncode, "", stderr)
+    # the batch's phases are shared by all of its translations
+    result.phases = { "check": check_phase, "build": build_phase if name in to_build else 0.0 }
+    result.diagnostics = [ summarize_diagnostic(message, real_dir + "/") for message in messages.get(name, []) ]
+    results.append(result)
+  return results
+
+batch_compiler = MicroBatcher(build_batch, BATCH_COMPILE_SIZE, BATCH_COMPILE_WAIT)
@@ -0,0 +1,86 @@
+################################################################################
+# Resource limits for the translated programs
+#
+# A translation is untrusted code: all it used to be held to was a wall-clock timeout, so
+# one that allocated without end, printed without end or forked without end could take the
+# whole machine down with it. Every test case now runs under rlimits:
+# - CPU time, a little over its timeout (SIGXCPU, then SIGKILL), so a busy loop is a TIMEOUT
+#   even if the wall-clock one doesn't get to fire;
+# - address space, SANDBOX_MEMORY_MB;
+# - output, SANDBOX_OUTPUT_BYTES (stdout and stderr go to files, which RLIMIT_FSIZE caps);
+# - processes, SANDBOX_PROCESSES, off (0) by default: RLIMIT_NPROC counts every process and
+#   thread of the user the case runs as, not just the case's own, so it has to be set
+#   above however many of those there already are (or the case can't even start).
+# They're set by prlimit(1), when it's there: setting them from a preexec_fn instead
+# means subprocess can't use vfork anymore, which doubles what starting these (tiny)
+# programs costs. SANDBOX=0 to run them as they are. How long the timeout itself is
+# comes from the reference program (see reference).
+
+import math
+import os
+import resource
+import shutil
+import signal
+
+SANDBOX = os.environ.get("SANDBOX", "1") == "1"
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", 512))
+SANDBOX_OUTPUT_BYTES = int(os.environ.get("SANDBOX_OUTPUT_BYTES", 1024 * 1024))
+SANDBOX_PROCESSES = int(os.environ.get("SANDBOX_PROCESSES", 0))
+
+PRLIMIT = shutil.which("prlimit")
+PRLIMIT_OPTIONS = {
+  resource.RLIMIT_CPU: "--cpu", resource.RLIMIT_AS: "--as",
+  resource.RLIMIT_FSIZE: "--fsize", resource.RLIMIT_NPROC: "--nproc",
+}
+
+################################################################################
+
+def limits(timeout):
+  # -> [ (resource, (soft limit, hard limit)) ], never above the hard limits we were given
+  cpu_seconds = math.ceil(timeout) + 1
+  chosen = [
+    (resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1)),
+    (resource.RLIMIT_AS, (SANDBOX_MEMORY_MB * 1024 * 1024,) * 2),
+    (resource.RLIMIT_FSIZE, (SANDBOX_OUTPUT_BYTES,) * 2),
+  ]
+  if SANDBOX_PROCESSES:
+    chosen.append((resource.RLIMIT_NPROC, (SANDBOX_PROCESSES,) * 2))
+  clamped = []
+  for limit, (soft, hard) in chosen:
+    _, current_hard = resource.getrlimit(limit)
+    if current_hard != resource.RLIM_INFINITY:
+      soft, hard = min(soft, current_hard), min(hard, current_hard)
+    clamped.append((limit, (soft, hard)))
+  return clamped
+
+def sandbox_settings():
+  # -> what the limits are made of, besides each case's timeout (see verdict_cache)
+  return {
+    "sandbox": SANDBOX, "memory_mb": SANDBOX_MEMORY_MB, "output_bytes": SANDBOX_OUTPUT_BYTES,
+    "processes": SANDBOX_PROCESSES,
+  }
+
+def apply_limits(timeout):
+  # In the child, right before it runs the translation
+  for limit, values in limits(timeout):
+    resource.setrlimit(limit, values)
+
+def sandboxed(command, timeout):
+  # -> (command, preexec_fn), for subprocess.Popen
+  if not SANDBOX:
+    return command, None
+  if PRLIMIT:
+    options = [ f"{PRLIMIT_OPTIONS[limit]}={soft}:{hard}" for limit, (soft, hard) in limits(timeout) ]
+    return [ PRLIMIT, *options, "--", *command ], None
+  return command, lambda: apply_limits(timeout)
+
+def describe_exit(returncode):
+  # e.g. "exit code 101", "SIGSEGV", "SIGXFSZ (output limit)"
+  if returncode is None or returncode >= 0:
+    return f"exit code {returncode}"
+  try:
+    name = signal.Signals(-returncode).name
+  except ValueError:
+    return f"signal {-returncode}"
+  reasons = { "SIGXCPU": "CPU time limit", "SIGXFSZ": "output limit", "SIGKILL": "killed" }
+  return f"{name} ({reasons[name]})" if name in reasons else name
@@ -0,0 +1,170 @@
+################################################################################
+# Local stand-in for the text-generation endpoint
+#
+# Speaks just enough of the Hugging Face inference API - a POST of {"inputs", "parameters"},
+# answered with one [{"generated_text": ...}] per input, or a stream of server-sent token
+# events with "stream": true - for the inference client to be run and measured without
+# network access nor an API token.
+#
+# Generation is simulated: every request is one pass of the "model", taking LATENCY seconds
+# plus ITEM_LATENCY per input (or TOKEN_LATENCY per token, when streaming), and passes
+# never overlap (like a single GPU would), so sending prompts together is what makes it go
+# faster, not sending them concurrently. The reply is a canned, fenced, do-nothing program
+# in whatever language was asked for, followed by chatter up to max_new_tokens - just like
+# the real model, which rarely stops right after the code - unless it was given replies
+# recorded by an earlier run (see backends), for the prompts they were recorded for.
+# With STANDIN_THROTTLE set, that
+# share of the requests is turned down with a 429 instead, like a rate-limited API would.
+#
+#   python standin_server.py [port] [recording]
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STANDIN_LATENCY = float(os.environ.get("STANDIN_LATENCY", 0.5))
+STANDIN_ITEM_LATENCY = float(os.environ.get("STANDIN_ITEM_LATENCY", 0.02))
+STANDIN_TOKEN_LATENCY = float(os.environ.get("STANDIN_TOKEN_LATENCY", 0.01))
+STANDIN_THROTTLE = float(os.environ.get("STANDIN_THROTTLE", 0))
+
+CANNED_REPLIES = {
+  "Rust": "```rust\nfn main() {}\n```",
+  "Python": "```python\nif __name__ == \"__main__\":\n    pass\n```",
+}
+CHATTER = "\nThis program does exactly what the C one does, in a more idiomatic way."
+CHARS_PER_TOKEN = 4
+
+print_info = lambda arg: print("[INFO] " + str(arg))
+
+################################################################################
+
+def canned_reply(prompt):
+  for language, reply in CANNED_REPLIES.items():
+    if language in prompt:
+      return reply
+  return "```\n```"
+
+def canned_generation(prompt, max_new_tokens, replies = {}):
+  if prompt in replies:
+    return replies[prompt]
+  text = canned_reply(prompt)
+  while len(text) < max_new_tokens * CHARS_PER_TOKEN:
+    text += CHATTER
+  return text[:max_new_tokens * CHARS_PER_TOKEN]
+
+class StandinHandler(BaseHTTPRequestHandler):
+  # HTTP/1.1, so that clients can keep their connection alive between requests
+  protocol_version = "HTTP/1.1"
+
+  def do_POST(self):
+    try:
+      request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+    except ValueError:
+      return self.respond(400, { "error": "invalid json" })
+    if random.random() < self.server.throttle:
+      self.server.throttled += 1
+      return self.respond(429, { "error": "Rate limit reached" }, { "Retry-After": "1" })
+    inputs = request.get("inputs")
+    parameters = request.get("parameters") or {}
+    batched = isinstance(inputs, list)
+    prompts = inputs if batched else [ inputs ]
+    max_new_tokens = parameters.get("max_new_tokens", 512)
+    if request.get("stream") and not batched:
+      return self.stream(inputs, canned_generation(inputs, max_new_tokens, self.server.replies), parameters)
+
+    with self.server.generation_lock:
+      time.sleep(self.server.latency + self.server.item_latency * len(prompts))
+      self.server.passes += 1
+      self.server.prompts += len(prompts)
+
+    generations = []
+    for prompt in prompts:
+      text = canned_generation(prompt, max_new_tokens, self.server.replies)
+      if parameters.get("return_full_text", True):
+        text = prompt + text
+      generations.append([ { "generated_text": text } ])
+    self.respond(200, generations if batched else generations[0])
+
+  def stream(self, prompt, text, parameters):
+    # One event per token, the last one with the whole generated_text; a client which hangs
+    # up early (see inference.stream_until_code_closes) frees the "model" right away
+    self.send_response(200)
+    self.send_header("Content-Type", "text/event-stream")
+    self.send_header("Connection", "close")
+    self.end_headers()
+    self.close_connection = True
+    tokens = [ text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN) ]
+    with self.server.generation_lock:
+      self.server.passes += 1
+      self.server.prompts += 1
+      time.sleep(self.server.latency)
+      for i, token in enumerate(tokens):
+        time.sleep(self.server.token_latency)
+        event = { "token": { "id": i, "text": token, "special": False }, "generated_text": None }
+        if i == len(tokens) - 1:
+          event["generated_text"] = (prompt if parameters.get("return_full_text", False) else "") + text
+        try:
+          self.wfile.write(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+          self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+          self.server.tokens_generated += i
+          return
+      self.server.tokens_generated += len(tokens)
+
+  def respond(self, status, body, headers = {}):
+    payload = json.dumps(body).encode("utf-8")
+    self.send_response(status)
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  def log_message(self, format, *args):
+    pass
+
+class StandinServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(
+    self, port = 0, latency = STANDIN_LATENCY, item_latency = STANDIN_ITEM_LATENCY,
+    token_latency = STANDIN_TOKEN_LATENCY, throttle = STANDIN_THROTTLE, replies = None
+  ):
+    super().__init__(("127.0.0.1", port), StandinHandler)
+    self.replies = replies or {} # prompt -> recorded reply
+    self.throttle = throttle
+    self.throttled = 0
+    self.latency = latency
+    self.item_latency = item_latency
+    self.token_latency = token_latency
+    self.tokens_generated = 0 # streamed ones only
+    self.generation_lock = threading.Lock()
+    self.passes = 0
+    self.prompts = 0
+
+  @property
+  def url(self):
+    return f"http://127.0.0.1:{self.server_address[1]}/"
+
+def start_standin_server(
+  port = 0, latency = STANDIN_LATENCY, item_latency = STANDIN_ITEM_LATENCY, token_latency = STANDIN_TOKEN_LATENCY,
+  throttle = STANDIN_THROTTLE, replies = None
+):
+  # Serves from a background thread; port=0 picks a free one (see .url)
+  server = StandinServer(port, latency, item_latency, token_latency, throttle, replies)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+if __name__ == "__main__":
+  replies = {}
+  if len(sys.argv) > 2:
+    from backends import load_recording
+    replies = { prompt: reply for prompt, _, reply in load_recording(sys.argv[2]) }
+  server = StandinServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8080, replies=replies)
+  print_info(f"Stand-in endpoint listening on {server.url}")
+  server.serve_forever()
@@ -0,0 +1,40 @@
+################################################################################
+# Concurrent sweep over the IntroClass submissions, shared by the c-to-* scripts
+
+import os
+import threading
+
+# How many submissions can be in flight at once - set WORKERS=1 for the old, serial behaviour
+# Threads are enough here: a worker spends its time either waiting on the inference API
+# or on child processes (rustc, the tests themselves), and neither holds the GIL
+WORKERS = int(os.environ.get("WORKERS", os.cpu_count() or 1))
+
+################################################################################
+
+COUNTERS = {
+  "COMPILER_FAILURE": "compilation_failures",
+  "TEST_FAILURE": "test_failures",
+  "TEST_SUCCESS": "test_successes",
+}
+
+# The totals used to be module-level globals, bumped with `+= 1` from whatever was running;
+# with several workers that's a race, so they now live behind a lock
+class Totals:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.compilation_failures = 0
+    self.test_failures = 0
+    self.test_successes = 0
+
+  def increment(self, counter, amount = 1):
+    # counter is one of "compilation_failures", "test_failures" or "test_successes"
+    with self.lock:
+      setattr(self, counter, getattr(self, counter) + amount)
+
+  def record(self, result, amount = 1):
+    # result is a QueryResult's result string
+    self.increment(COUNTERS[result], amount)
+
+  def snapshot(self):
+    with self.lock:
+      return self.compilation_failures, self.test_failures, self.test_successes
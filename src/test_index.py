@@ -0,0 +1,55 @@
+################################################################################
+# Per-benchmark test index
+#
+# Every submission of a benchmark is tested against the very same blackbox/whitebox
+# tests, so they're read into memory once (per benchmark) and shared by all submissions
+# and workers, instead of being copied to (and re-read from) every output directory.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from reference import attach_reference
+from test_runner import load_cases
+
+# LINK_TESTS=1 still gives every output directory its own tests/ folder, made of hardlinks
+LINK_TESTS = os.environ.get("LINK_TESTS") == "1"
+
+################################################################################
+
+class TestIndex:
+  def __init__(self, tests_dir, test_types):
+    self.tests_dir = tests_dir
+    self.cases = load_cases(tests_dir, test_types)
+    digest = hashlib.sha256()
+    for case in self.cases:
+      digest.update(json.dumps([ case.name, case.input_data, case.expected_output ]).encode("utf-8"))
+    self.hash = digest.hexdigest()
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+def get_test_index(benchmark, test_types):
+  # benchmark is the benchmark's directory (with a trailing slash, like everywhere else)
+  tests_dir = benchmark + "tests"
+  with indexes_lock:
+    if tests_dir not in indexes:
+      indexes[tests_dir] = TestIndex(tests_dir, test_types)
+      attach_reference(indexes[tests_dir], benchmark)
+    return indexes[tests_dir]
+
+def link_tests(index, output_dir):
+  for directory, _, files in os.walk(index.tests_dir):
+    target_directory = os.path.join(output_dir, "tests", os.path.relpath(directory, index.tests_dir))
+    os.makedirs(target_directory, exist_ok=True)
+    for name in files:
+      target = os.path.join(target_directory, name)
+      if os.path.exists(target):
+        continue
+      try:
+        os.link(os.path.join(directory, name), target)
+      except OSError:
+        # e.g. the output directory lives on another filesystem
+        shutil.copy2(os.path.join(directory, name), target)
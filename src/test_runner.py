@@ -0,0 +1,283 @@
+################################################################################
+# Parallel test runner - every test case of a translation is run, on all cores
+#
+# Instead of stopping at the first mismatch, each case gets its own verdict (and runtime,
+# and peak memory), which gives the repair loop (and whoever's reading the logs) a lot more signal.
+
+import io
+import locale
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from memory_probe import probed, read_report
+from sandbox import describe_exit, sandboxed
+from tracing import tracer
+
+TEST_WORKERS = int(os.environ.get("TEST_WORKERS", os.cpu_count() or 1))
+# FAIL_FAST=1 to stop as soon as one of the cases fails (the old behaviour, but cheaper)
+FAIL_FAST = os.environ.get("FAIL_FAST") == "1"
+# the fallback, for the cases the reference program couldn't be timed on (see reference)
+TEST_TIMEOUT = 5
+
+PASS = "PASS"
+FAIL = "FAIL"
+TIMEOUT = "TIMEOUT"
+CRASH = "CRASH"
+CANCELLED = "CANCELLED" # with fail-fast (or a cancelled scope), for the cases which never got to finish
+
+################################################################################
+
+class TestCase:
+  def __init__(self, name, input_data, expected_output):
+    self.name = name # e.g. "blackbox/1"
+    self.input_data = input_data
+    self.expected_output = expected_output
+    self.timeout = None # in seconds, from the reference program's runtime (see reference)
+    # how the reference program fares on it (see reference), if it could be measured
+    self.reference_runtime = None
+    self.reference_memory = None
+
+class CaseResult:
+  def __init__(
+    self, name, status, runtime = 0.0, expected_output = None, actual_output = None, returncode = None, stderr = None,
+    memory = None
+  ):
+    self.name = name
+    self.status = status
+    self.runtime = runtime # in seconds
+    self.expected_output = expected_output
+    self.actual_output = actual_output
+    self.returncode = returncode
+    self.stderr = stderr
+    self.memory = memory # peak resident set size, in KiB
+
+  def as_row(self):
+    return {
+      "name": self.name, "status": self.status, "runtime": self.runtime, "memory": self.memory,
+      "returncode": self.returncode
+    }
+
+  def feedback_output(self):
+    # What the model gets told its translation printed: for a timeout or a crash, what it
+    # printed isn't the whole story
+    if self.status == TIMEOUT:
+      return f"{self.actual_output}\n(timed out: killed after {self.runtime:.1f}s)"
+    if self.status == CRASH:
+      # the end of stderr, where a panic's message or a traceback's error is
+      stderr = (self.stderr or "").strip()[-500:]
+      details = f"\n{stderr}" if stderr else ""
+      return f"{self.actual_output}\n(crashed: {describe_exit(self.returncode)}){details}"
+    return self.actual_output
+
+class TestReport:
+  def __init__(self, results):
+    self.results = results # in the same order as the cases that were given
+
+  def passed(self):
+    return all(result.status == PASS for result in self.results)
+
+  def first_failure(self):
+    for result in self.results:
+      if result.status not in (PASS, CANCELLED):
+        return result
+    return None
+
+  def counts(self):
+    counts = {}
+    for result in self.results:
+      counts[result.status] = counts.get(result.status, 0) + 1
+    return counts
+
+  def matrix(self):
+    # json-friendly, so it can be cached/stored alongside the verdict
+    return [ result.as_row() for result in self.results ]
+
+def load_cases(tests_dir, test_types):
+  # The tests are just simple .in files, with the expected output being in the corresponding .out file
+  cases = []
+  for test_type in test_types:
+    for test in sorted(os.listdir(f"{tests_dir}/{test_type}")):
+      if not test.endswith(".in"):
+        continue
+      test_name = test[:-3]
+      with open(f"{tests_dir}/{test_type}/{test}", "r") as test_file:
+        input_data = test_file.read()
+      with open(f"{tests_dir}/{test_type}/{test_name}.out", "r") as expected_output:
+        cases.append(TestCase(f"{test_type}/{test_name}", input_data, expected_output.read()))
+  return cases
+
+def kill(process):
+  # each case runs in its own session, so that anything it spawned goes down with it
+  # (otherwise a grandchild holding on to stdout keeps communicate() waiting forever).
+  # Whatever else is registered with a Cancellation says how it's stopped (e.g. a request
+  # to the inference API, see inference_client)
+  if hasattr(process, "stop"):
+    process.stop()
+    return
+  try:
+    os.killpg(process.pid, signal.SIGKILL)
+  except ProcessLookupError:
+    pass
+
+class Cancelled(Exception):
+  # What whatever's run within a cancelled scope (see cancellable) gives up with
+  pass
+
+scope = threading.local()
+
+def current_cancellation():
+  return getattr(scope, "cancellation", None)
+
+class Cancellation:
+  # Shared between the cases of a single run, so that (with fail-fast) the first failure
+  # can kill whatever's still running and keep the rest from starting. One created within
+  # a cancellable scope is also cancelled along with the scope's
+  def __init__(self, parent = None):
+    self.event = threading.Event()
+    self.lock = threading.Lock()
+    self.running = set()
+    self.children = []
+    parent = parent or current_cancellation()
+    if parent is not None:
+      parent.adopt(self)
+
+  def adopt(self, child):
+    with self.lock:
+      self.children.append(child)
+      cancelled = self.event.is_set()
+    if cancelled:
+      child.cancel()
+
+  def start(self, process):
+    with self.lock:
+      if self.event.is_set():
+        kill(process)
+      self.running.add(process)
+
+  def finish(self, process):
+    with self.lock:
+      self.running.discard(process)
+
+  def cancel(self):
+    with self.lock:
+      self.event.set()
+      for process in self.running:
+        kill(process)
+      children = list(self.children)
+    for child in children:
+      child.cancel()
+
+  def cancelled(self):
+    return self.event.is_set()
+
+@contextmanager
+def cancellable(cancellation):
+  # Everything this thread starts in the meantime - test runs, streamed generations (see
+  # inference) - stops as soon as cancellation is cancelled
+  previous = current_cancellation()
+  scope.cancellation = cancellation
+  try:
+    yield cancellation
+  finally:
+    scope.cancellation = previous
+
+def check_cancelled():
+  # Raises Cancelled if this thread's scope has been cancelled, e.g. between two stages
+  cancellation = current_cancellation()
+  if cancellation is not None and cancellation.cancelled():
+    raise Cancelled()
+
+def classify(case, actual_output, returncode, cancellation):
+  # Only stdout matters for passing, as it always did; the return code just tells a
+  # wrong answer apart from a program that blew up
+  if actual_output == case.expected_output:
+    return PASS
+  if cancellation.event.is_set() and returncode == -signal.SIGKILL:
+    # killed by another case's failure, rather than failing on its own
+    return CANCELLED
+  if returncode == -signal.SIGXCPU:
+    # out of CPU time (see sandbox), which is a timeout by another name
+    return TIMEOUT
+  if returncode != 0:
+    return CRASH
+  return FAIL
+
+def read_output(output_file, text):
+  output_file.seek(0)
+  if text:
+    # decoded just like subprocess.run(..., text=True) would, universal newlines included
+    return io.TextIOWrapper(output_file, errors="replace").read()
+  return output_file.read().decode("utf-8", errors="replace")
+
+def run_case(command, case, cwd, text, timeout, cancellation):
+  if cancellation.event.is_set():
+    return CaseResult(case.name, CANCELLED, expected_output=case.expected_output)
+
+  timeout = case.timeout or timeout
+  input_data = case.input_data.encode(locale.getpreferredencoding(False) if text else "utf-8")
+  # files rather than pipes for the outputs, so that the sandbox can cap their size (and
+  # for the input, so that nothing but the process itself needs waiting on, and for the
+  # peak memory, see memory_probe)
+  with tempfile.TemporaryFile() as stdin_file, tempfile.TemporaryFile() as stdout_file, \
+      tempfile.TemporaryFile() as stderr_file, tempfile.TemporaryFile() as report_file:
+    stdin_file.write(input_data)
+    stdin_file.seek(0)
+    command, preexec_fn = sandboxed(probed(command, report_file.fileno()), timeout)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+      command, cwd=cwd, stdin=stdin_file, stdout=stdout_file, stderr=stderr_file,
+      start_new_session=True, preexec_fn=preexec_fn, pass_fds=(report_file.fileno(),)
+    )
+    cancellation.start(process)
+    timed_out = threading.Event()
+    timer = threading.Timer(timeout, lambda: (timed_out.set(), kill(process)))
+    timer.start()
+    try:
+      process.wait()
+    finally:
+      timer.cancel()
+      cancellation.finish(process)
+    runtime = time.perf_counter() - start
+    status = TIMEOUT if timed_out.is_set() and process.returncode == -signal.SIGKILL else None
+    actual_output = read_output(stdout_file, text)
+    stderr = read_output(stderr_file, text)
+    memory = read_report(report_file)
+
+  if status is None:
+    status = classify(case, actual_output, process.returncode, cancellation)
+  return CaseResult(
+    case.name, status, runtime, case.expected_output, actual_output, process.returncode, stderr, memory
+  )
+
+def traced(report):
+  # every case as a span of its own - emitted from the calling thread, so that they're
+  # tagged with its submission and attempt (see tracing)
+  for result in report.results:
+    tracer.record("test_case", result.runtime, case=result.name, status=result.status)
+  return report
+
+def run_test_matrix(
+  command, cases, cwd, text = False, fail_fast = FAIL_FAST, timeout = TEST_TIMEOUT, workers = TEST_WORKERS, trace = True
+):
+  # trace=False for runs of many more cases than a test suite's (see differential), which
+  # would drown the trace
+  cancellation = Cancellation()
+
+  def run(case):
+    result = run_case(command, case, cwd, text, timeout, cancellation)
+    if fail_fast and result.status not in (PASS, CANCELLED):
+      cancellation.cancel()
+    return result
+
+  if workers <= 1 or len(cases) <= 1:
+    report = TestReport([ run(case) for case in cases ])
+  else:
+    with ThreadPoolExecutor(max_workers=min(workers, len(cases))) as executor:
+      report = TestReport(list(executor.map(run, cases)))
+  return traced(report) if trace else report
@@ -0,0 +1,171 @@
+################################################################################
+# Per-stage timing spans
+#
+# With TRACE_FILE set, every span - a stage ("round", "query", "verdict" and within it
+# "compile", "tests", "test_case") and how long it took - is appended to it as a json line, along with the tags
+# of the context it ran in: benchmark, student, submission and attempt (the repair round, 0
+# being the first translation). What each submission ended up as is recorded as an
+# "outcome" event. Without TRACE_FILE, spans cost next to nothing.
+#
+# The pipeline benchmark (see pipeline_benchmark) reads them, and so does
+#
+#   python tracing.py <trace file>
+#
+# which prints each stage's latency histogram, and how many submissions got which outcome -
+# for each target on its own, when the engine did several in one pass (see engine).
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_FILE = os.environ.get("TRACE_FILE")
+
+# the histograms' buckets, by upper bound (in seconds)
+HISTOGRAM_BUCKETS = [ 0.001, 0.01, 0.1, 1.0, 10.0, 100.0, float("inf") ]
+
+################################################################################
+
+def percentile(values, fraction):
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Tracer:
+  def __init__(self, path = TRACE_FILE):
+    self.path = path
+    self.lock = threading.Lock()
+    self.file = None
+    self.local = threading.local()
+    # functions which get every record as well, e.g. results_store's
+    self.sinks = []
+
+  def emit(self, record):
+    for sink in self.sinks:
+      sink(record)
+    if self.path is None:
+      return
+    line = json.dumps(record, default=str)
+    with self.lock:
+      if self.file is None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # line-buffered, so that a crash loses at most the span being written
+        self.file = open(self.path, "a", buffering=1)
+      self.file.write(line + "\n")
+
+  def tags(self):
+    return getattr(self.local, "tags", {})
+
+  @contextmanager
+  def context(self, **tags):
+    # Adds tags to everything this thread emits in the meantime
+    previous = self.tags()
+    self.local.tags = { **previous, **tags }
+    try:
+      yield
+    finally:
+      self.local.tags = previous
+
+  @contextmanager
+  def span(self, stage, **tags):
+    # Yields the record itself, so that tags only known at the end (e.g. a verdict) can
+    # still be added to it
+    record = { "stage": stage, "start": time.time(), **self.tags(), **tags }
+    started = time.perf_counter()
+    try:
+      yield record
+    except BaseException as e:
+      record.setdefault("error", type(e).__name__)
+      raise
+    finally:
+      record["duration"] = time.perf_counter() - started
+      self.emit(record)
+
+  def record(self, stage, duration, **tags):
+    # A span for something that was timed elsewhere, e.g. a test case (see test_runner)
+    self.emit({ "stage": stage, "start": time.time() - duration, "duration": duration, **self.tags(), **tags })
+
+  def event(self, stage, **tags):
+    self.emit({ "stage": stage, "start": time.time(), **self.tags(), **tags })
+
+def submission_tags(benchmark, submission_path):
+  # .../<benchmark>/<student>/<submission>/ -> the tags for everything done for it
+  student, submission = os.path.normpath(submission_path).split(os.sep)[-2:]
+  return { "benchmark": benchmark, "student": student, "submission": submission }
+
+def load_spans(path):
+  spans = []
+  with open(path, "r") as trace:
+    for line in trace:
+      try:
+        spans.append(json.loads(line))
+      except ValueError:
+        continue
+  return spans
+
+def histogram(values, buckets = HISTOGRAM_BUCKETS):
+  # -> [ (upper bound, count) ], one per bucket
+  counts = [ 0 ] * len(buckets)
+  for value in values:
+    counts[next(i for i, bound in enumerate(buckets) if value <= bound)] += 1
+  return list(zip(buckets, counts))
+
+def format_seconds(seconds):
+  if seconds == float("inf"):
+    return "inf"
+  return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.0f} s"
+
+def summarize(spans):
+  # -> (stage -> durations, outcome -> count, benchmark -> outcome -> count)
+  durations = {}
+  outcomes = {}
+  per_benchmark = {}
+  for record in spans:
+    if record["stage"] == "outcome":
+      outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+      benchmark = per_benchmark.setdefault(record.get("benchmark"), {})
+      benchmark[record["outcome"]] = benchmark.get(record["outcome"], 0) + 1
+    elif "duration" in record:
+      durations.setdefault(record["stage"], []).append(record["duration"])
+  return durations, outcomes, per_benchmark
+
+def print_summary(spans):
+  # a run of several targets is summed up per target (its spans' "target" tag); what
+  # isn't any one target's, e.g. the reference programs' builds, goes on its own
+  by_target = {}
+  for record in spans:
+    by_target.setdefault(record.get("target"), []).append(record)
+  if len([ target for target in by_target if target is not None ]) <= 1:
+    print_target_summary(spans)
+    return
+  for target, records in sorted(by_target.items(), key=lambda item: (item[0] is None, str(item[0]))):
+    print(f"== {target if target is not None else 'shared'} ==")
+    print_target_summary(records)
+
+def print_target_summary(spans):
+  durations, outcomes, per_benchmark = summarize(spans)
+  for stage, values in sorted(durations.items()):
+    print(
+      f"{stage}: {len(values)} spans, {sum(values):.2f}s in total, p50 {format_seconds(percentile(values, 0.5))}, "
+      f"p95 {format_seconds(percentile(values, 0.95))}, max {format_seconds(max(values))}"
+    )
+    widest = max(count for _, count in histogram(values))
+    for bound, count in histogram(values):
+      if count:
+        print(f"  <= {format_seconds(bound):>7} {count:>6} {'#' * max(1, round(40 * count / widest))}")
+  # one outcome per submission (equivalent ones included, see dedup), however many
+  # rounds or retries it took
+  print(f"Outcomes: {', '.join(f'{outcome}: {count}' for outcome, count in sorted(outcomes.items())) or 'none'}")
+  for benchmark, counts in sorted(per_benchmark.items(), key=lambda item: str(item[0])):
+    total = sum(counts.values())
+    print(f"  {benchmark}: {counts.get('success', 0)}/{total} successful ({', '.join(f'{outcome}: {count}' for outcome, count in sorted(counts.items()))})")
+
+tracer = Tracer()
+span = tracer.span
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print("Usage: python tracing.py <trace file> [more trace files]")
+    sys.exit(1)
+  print_summary([ record for path in sys.argv[1:] for record in load_spans(path) ])
@@ -0,0 +1,126 @@
+################################################################################
+# Verdict (and binary) cache for translated programs
+#
+# The model quite often spits out byte-identical code, be it across seeds or across
+# repair rounds; compiling and testing it again would just give us the same verdict.
+# Entries are keyed on the hash of the translated source, the toolchain's version, the
+# test suite and what it's run under (each case's timeout, the sandbox's limits), and
+# keep both the final QueryResult and the compiled binary.
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+from memory_probe import memory_probe
+from sandbox import sandbox_settings
+from test_runner import TEST_TIMEOUT
+
+VERDICT_CACHE_DIR = os.environ.get(
+  "VERDICT_CACHE_DIR", os.path.expanduser("~/.cache/llm-exercise/verdicts")
+)
+NO_VERDICT_CACHE = os.environ.get("NO_VERDICT_CACHE") == "1"
+
+print_debug = lambda arg: print("[DEBUG] " + str(arg))
+
+################################################################################
+
+toolchain_versions = {}
+toolchain_lock = threading.Lock()
+
+def toolchain_version(command):
+  # e.g. toolchain_version(["rustc", "--version", "--verbose"]); only asked once per run
+  with toolchain_lock:
+    if tuple(command) not in toolchain_versions:
+      toolchain_versions[tuple(command)] = subprocess.run(
+        command, capture_output=True, text=True
+      ).stdout
+    return toolchain_versions[tuple(command)]
+
+def hash_file(path, digest):
+  with open(path, "rb") as f:
+    digest.update(f.read())
+
+def verdict_key(source_path, toolchain, tests):
+  # tests is the benchmark's test_index.TestIndex: its cases, and the timeout each one is
+  # actually run with (see reference), which can turn a pass into a TIMEOUT as well; and
+  # whether the cached matrix's memory was measured at all
+  digest = hashlib.sha256()
+  hash_file(source_path, digest)
+  digest.update(toolchain.encode("utf-8"))
+  digest.update(tests.hash.encode("utf-8"))
+  timeouts = [ case.timeout or TEST_TIMEOUT for case in tests.cases ]
+  digest.update(json.dumps([ timeouts, sandbox_settings(), memory_probe() is not None ], sort_keys=True).encode("utf-8"))
+  return digest.hexdigest()
+
+def as_text(value):
+  # the rust sweep keeps the actual output as raw bytes, which json can't store
+  if isinstance(value, bytes):
+    return value.decode("utf-8", errors="replace")
+  return value
+
+class VerdictCache:
+  def __init__(self, directory = VERDICT_CACHE_DIR, enabled = not NO_VERDICT_CACHE):
+    self.directory = directory
+    self.enabled = enabled
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def lookup(self, key, binary_path = None):
+    entry = os.path.join(self.directory, key)
+    try:
+      with open(os.path.join(entry, "verdict.json"), "r") as f:
+        verdict = json.load(f)
+    except (OSError, ValueError):
+      return None
+    if binary_path is not None and os.path.exists(os.path.join(entry, "main")):
+      # later stages (and whoever looks at the output directory) expect the binary to be there
+      shutil.copy2(os.path.join(entry, "main"), binary_path)
+    return verdict
+
+  def store(self, key, verdict, binary_path = None):
+    entry = os.path.join(self.directory, key)
+    if os.path.isdir(entry):
+      return
+    # everything is written to a scratch directory first, and then renamed into place,
+    # so that concurrent workers never see half an entry
+    scratch = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(scratch, exist_ok=True)
+    with open(os.path.join(scratch, "verdict.json"), "w") as f:
+      json.dump(verdict, f)
+    if binary_path is not None and os.path.exists(binary_path):
+      shutil.copy2(binary_path, os.path.join(scratch, "main"))
+    try:
+      os.rename(scratch, entry)
+    except OSError:
+      # someone else got there first, with the very same verdict
+      shutil.rmtree(scratch, ignore_errors=True)
+
+  def run(self, key, evaluate, make_result, binary_path = None):
+    # evaluate() compiles/tests the code and returns a QueryResult; make_result(**fields)
+    # rebuilds one from the cache. Returns the result and whether it came from the cache.
+    if not self.enabled:
+      return evaluate(), False
+    verdict = self.lookup(key, binary_path)
+    if verdict is not None:
+      with self.lock:
+        self.hits += 1
+      print_debug(f"Verdict cache hit ({key[:12]}): {verdict['result']}")
+      return make_result(**verdict), True
+
+    result = evaluate()
+    with self.lock:
+      self.misses += 1
+    fields = dict(vars(result))
+    if fields.get("outputs") is not None:
+      fields["outputs"] = [ as_text(output) for output in fields["outputs"] ]
+    # a failed compilation may leave a stale binary around, which must not be cached
+    if result.result == "COMPILER_FAILURE":
+      binary_path = None
+    self.store(key, fields, binary_path)
+    return result, False
+
+verdict_cache = VerdictCache()
@@ -0,0 +1,335 @@
+################################################################################
+# Warm-interpreter test runner for the Python translations
+#
+# Starting a fresh `python src/main.py` for every test case means paying the interpreter's
+# startup for each one, which is way more than what these tiny programs take to run.
+# Instead, a pool of long-lived server processes (shared by the whole sweep) compiles each
+# main.py once and then forks a child per test case: the child gets its own
+# stdin/stdout/stderr and working directory, runs the code as __main__ and exits, so
+# every case is still isolated from the others (and from the server itself). The server
+# tells which child it forked before waiting on it, so that a case can be killed like any
+# other subprocess (fail-fast, a best-of-N race being won, see test_runner.Cancellation).
+#
+# Benchmark it against the plain subprocess path with:
+#   python warm_runner.py --benchmark <python_dir> [repetitions]
+
+import atexit
+import builtins
+import io
+import json
+import locale
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from sandbox import SANDBOX, apply_limits
+from test_runner import (
+  CANCELLED, FAIL_FAST, PASS, TEST_TIMEOUT, TEST_WORKERS, TIMEOUT,
+  CaseResult, Cancellation, TestReport, classify, load_cases, run_test_matrix, traced
+)
+
+# WARM_INTERPRETER=0 goes back to one `python src/main.py` per test case
+WARM_INTERPRETER = os.environ.get("WARM_INTERPRETER", "1") == "1"
+# Same interpreter as the subprocess path, so that both give the very same verdicts
+PYTHON = "python"
+# The child has its own alarm; the server only steps in if the child somehow survives it
+GRACE_PERIOD = 0.5
+# How many compiled translations each server keeps around
+COMPILED_CACHE_SIZE = 16
+
+################################################################################
+# Server side - everything here runs in the warm interpreter, which must stay single-threaded
+# (it forks)
+
+def exit_code_of(system_exit):
+  # mimics what the interpreter does with an uncaught SystemExit
+  code = system_exit.code
+  if code is None:
+    return 0
+  if isinstance(code, int):
+    return code & 0xff
+  print(code, file=sys.stderr)
+  return 1
+
+def run_as_main(code, script, timeout):
+  # We're in the forked child, with fds 0/1/2 already pointing at this case's files
+  signal.signal(signal.SIGALRM, signal.SIG_DFL)
+  signal.setitimer(signal.ITIMER_REAL, timeout)
+  if SANDBOX:
+    apply_limits(timeout)
+  sys.stdin = open(0, "r", closefd=False)
+  sys.stdout = open(1, "w", closefd=False)
+  sys.stderr = open(2, "w", closefd=False)
+  sys.argv = [ script ]
+  sys.path[0] = os.path.dirname(os.path.abspath(script))
+  module = types.ModuleType("__main__")
+  module.__file__ = script
+  module.__builtins__ = builtins
+  sys.modules["__main__"] = module
+
+  exit_code = 0
+  try:
+    exec(code, module.__dict__)
+  except SystemExit as e:
+    exit_code = exit_code_of(e)
+  except BaseException:
+    traceback.print_exc()
+    exit_code = 1
+  for stream in (sys.stdout, sys.stderr):
+    try:
+      stream.flush()
+    except Exception:
+      pass
+  os._exit(exit_code)
+
+def run_forked(code, script, cwd, input_data, timeout, started):
+  # started(pid) is called once the child is forked, before it's waited on
+  stdin_file = tempfile.TemporaryFile()
+  stdout_file = tempfile.TemporaryFile()
+  stderr_file = tempfile.TemporaryFile()
+  stdin_file.write(input_data.encode(locale.getpreferredencoding(False)))
+  stdin_file.seek(0)
+
+  start = time.perf_counter()
+  pid = os.fork()
+  if pid == 0:
+    # a process group of its own, like a subprocess case (see test_runner.kill), so that
+    # killing it takes down anything it spawned
+    os.setpgid(0, 0)
+    os.chdir(cwd)
+    os.dup2(stdin_file.fileno(), 0)
+    os.dup2(stdout_file.fileno(), 1)
+    os.dup2(stderr_file.fileno(), 2)
+    run_as_main(code, script, timeout)
+
+  killed = []
+  def give_up(signum, frame):
+    killed.append(True)
+    os.kill(pid, signal.SIGKILL)
+  signal.signal(signal.SIGALRM, give_up)
+  signal.setitimer(signal.ITIMER_REAL, timeout + GRACE_PERIOD)
+  try:
+    # here too, so that the group's there by the time anyone can be told to kill it
+    os.setpgid(pid, pid)
+  except OSError:
+    pass
+  started(pid)
+  _, status = os.waitpid(pid, 0)
+  signal.setitimer(signal.ITIMER_REAL, 0)
+  runtime = time.perf_counter() - start
+
+  returncode = os.waitstatus_to_exitcode(status)
+  outputs = {}
+  for name, stream in (("stdout", stdout_file), ("stderr", stderr_file)):
+    stream.seek(0)
+    # decoded just like subprocess.run(..., text=True) would, universal newlines included
+    outputs[name] = io.TextIOWrapper(stream, errors="replace").read()
+  stdin_file.close()
+  return {
+    "stdout": outputs["stdout"],
+    "stderr": outputs["stderr"],
+    "returncode": returncode,
+    "timed_out": bool(killed) or returncode == -signal.SIGALRM,
+    "runtime": runtime,
+    # a fork of the server starts out with all of the server's memory, and its peak can't
+    # be told apart from that (see memory_probe), so it's left unknown, and unscored
+    "memory": None,
+  }
+
+def compile_script(script, cwd, compiled):
+  # compiled maps a script's source to its code object (or to the error it fails with), so
+  # each translation is only compiled once, and a rewritten main.py is never run stale
+  with open(os.path.join(cwd, script), "rb") as f:
+    source = f.read()
+  if source not in compiled:
+    if len(compiled) >= COMPILED_CACHE_SIZE:
+      compiled.pop(next(iter(compiled)))
+    try:
+      compiled[source] = compile(source, script, "exec")
+    except Exception:
+      # e.g. a SyntaxError; `python src/main.py` would fail on every single case, and so do we
+      compiled[source] = traceback.format_exc()
+  return compiled[source]
+
+def serve():
+  # Requests/responses are json lines over our own stdin/stdout; those are moved to other
+  # fds first, so that nothing a child prints can end up in the protocol
+  requests = os.fdopen(os.dup(0), "r")
+  responses = os.fdopen(os.dup(1), "w")
+  compiled = {}
+
+  def started(pid):
+    responses.write(json.dumps({ "pid": pid }) + "\n")
+    responses.flush()
+
+  for line in requests:
+    request = json.loads(line)
+    try:
+      code = compile_script(request["script"], request["cwd"], compiled)
+    except OSError as e:
+      code = str(e)
+    if isinstance(code, str):
+      response = { "stdout": "", "stderr": code, "returncode": 1, "timed_out": False, "runtime": 0.0, "memory": None }
+    else:
+      response = run_forked(code, request["script"], request["cwd"], request["input"], request["timeout"], started)
+    responses.write(json.dumps(response) + "\n")
+    responses.flush()
+
+################################################################################
+# Client side
+
+class ForkedChild:
+  # What test_runner.Cancellation needs of a process to kill it
+  def __init__(self, pid):
+    self.pid = pid
+
+class WarmInterpreter:
+  def __init__(self):
+    self.process = subprocess.Popen(
+      [ PYTHON, os.path.abspath(__file__), "--serve" ],
+      text=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+  def run(self, script, cwd, input_data, timeout, cancellation = None):
+    request = { "script": script, "cwd": os.path.abspath(cwd), "input": input_data, "timeout": timeout }
+    self.process.stdin.write(json.dumps(request) + "\n")
+    self.process.stdin.flush()
+    child = None
+    try:
+      while True:
+        response = json.loads(self.process.stdout.readline())
+        if "pid" not in response:
+          return response
+        # the child's been forked: from now on, cancelling the run kills it
+        child = ForkedChild(response["pid"])
+        if cancellation is not None:
+          cancellation.start(child)
+    finally:
+      if child is not None and cancellation is not None:
+        cancellation.finish(child)
+
+  def close(self):
+    self.process.stdin.close()
+    self.process.wait()
+
+  def discard(self):
+    # for a server that died (or is past saving): nothing's left behind, zombie or pipes
+    self.process.kill()
+    self.process.wait()
+    for stream in (self.process.stdin, self.process.stdout):
+      try:
+        stream.close()
+      except OSError:
+        pass
+
+class InterpreterPool:
+  # At most `size` warm interpreters, started on demand and kept around for the whole run;
+  # each one only handles a single case at a time
+  def __init__(self, size = TEST_WORKERS):
+    self.size = size
+    self.lock = threading.Lock()
+    self.idle = queue.Queue()
+    self.interpreters = []
+
+  def acquire(self):
+    while True:
+      with self.lock:
+        if self.idle.empty() and len(self.interpreters) < self.size:
+          self.interpreters.append(WarmInterpreter())
+          return self.interpreters[-1]
+      interpreter = self.idle.get()
+      if interpreter is not None:
+        return interpreter
+      # None is a dead interpreter's slot (see run), free for a new one
+
+  def release(self, interpreter):
+    self.idle.put(interpreter)
+
+  def run(self, script, cwd, input_data, timeout, cancellation = None):
+    interpreter = self.acquire()
+    try:
+      response = interpreter.run(script, cwd, input_data, timeout, cancellation)
+    except (OSError, ValueError):
+      # the server itself died (which a translation shouldn't be able to do): it's reaped,
+      # its slot goes to whoever's waiting for one (who starts a new one in its place), and
+      # the case is treated as a crash
+      with self.lock:
+        self.interpreters.remove(interpreter)
+      interpreter.discard()
+      self.release(None)
+      return {
+        "stdout": "", "stderr": "warm interpreter died", "returncode": -1, "timed_out": False, "runtime": 0.0,
+        "memory": None
+      }
+    self.release(interpreter)
+    return response
+
+  def close(self):
+    with self.lock:
+      for interpreter in self.interpreters:
+        interpreter.close()
+      self.interpreters = []
+
+interpreter_pool = InterpreterPool()
+atexit.register(interpreter_pool.close)
+
+def run_warm_test_matrix(
+  script, cases, cwd, fail_fast = FAIL_FAST, timeout = TEST_TIMEOUT, workers = TEST_WORKERS, trace = True
+):
+  # Same contract as test_runner.run_test_matrix, for `python <script>` run from cwd
+  cancellation = Cancellation()
+
+  def run(case):
+    if cancellation.event.is_set():
+      return CaseResult(case.name, CANCELLED, expected_output=case.expected_output)
+    response = interpreter_pool.run(script, cwd, case.input_data, case.timeout or timeout, cancellation)
+    if response["timed_out"]:
+      status = TIMEOUT
+    else:
+      status = classify(case, response["stdout"], response["returncode"], cancellation)
+    if fail_fast and status not in (PASS, CANCELLED):
+      cancellation.cancel()
+    return CaseResult(
+      case.name, status, response["runtime"], case.expected_output, response["stdout"], response["returncode"],
+      response["stderr"], response["memory"]
+    )
+
+  if workers <= 1 or len(cases) <= 1:
+    report = TestReport([ run(case) for case in cases ])
+  else:
+    with ThreadPoolExecutor(max_workers=min(workers, len(cases))) as executor:
+      report = TestReport(list(executor.map(run, cases)))
+  return traced(report) if trace else report
+
+def benchmark(python_dir, test_types, repetitions = 5):
+  cases = load_cases(python_dir + "/tests", test_types)
+  timings = {}
+  reports = {}
+  for name, run in (
+    ("subprocess", lambda: run_test_matrix([ PYTHON, "src/main.py" ], cases, cwd=python_dir, text=True)),
+    ("warm", lambda: run_warm_test_matrix("src/main.py", cases, cwd=python_dir)),
+  ):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+      reports[name] = run()
+    timings[name] = (time.perf_counter() - start) / repetitions
+
+  same = [ r.status for r in reports["subprocess"].results ] == [ r.status for r in reports["warm"].results ]
+  print(f"[INFO] {len(cases)} test cases, {repetitions} repetitions")
+  for name, timing in timings.items():
+    print(f"[INFO] {name}: {timing * 1000:.1f} ms per run ({timing * 1000 / max(1, len(cases)):.2f} ms per case)")
+  print(f"[INFO] Speedup: {timings['subprocess'] / timings['warm']:.2f}x, identical verdicts: {same}")
+
+if __name__ == "__main__":
+  if sys.argv[1] == "--serve":
+    serve()
+  elif sys.argv[1] == "--benchmark":
+    benchmark(sys.argv[2], [ "blackbox", "whitebox" ], int(sys.argv[3]) if len(sys.argv) > 3 else 5)
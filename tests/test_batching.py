@@ -0,0 +1,54 @@
+################################################################################
+# Micro-batching
+
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+def run_concurrently(batcher, requests):
+  results = [ None ] * len(requests)
+
+  def run(i):
+    try:
+      results[i] = batcher.run(requests[i])
+    except Exception as e:
+      results[i] = e
+
+  threads = [ threading.Thread(target=run, args=(i,)) for i in range(len(requests)) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return results
+
+def test_full_batches_go_at_once_and_everyone_gets_their_own_result():
+  batches = []
+
+  def process_batch(requests):
+    batches.append(list(requests))
+    return [ request * 10 for request in requests ]
+
+  # the wait is way past what the test takes: only full batches can have been sent
+  batcher = MicroBatcher(process_batch, 2, 60)
+  assert run_concurrently(batcher, [ 1, 2, 3, 4 ]) == [ 10, 20, 30, 40 ]
+  assert sorted(len(batch) for batch in batches) == [ 2, 2 ]
+  assert (batcher.batches, batcher.requests) == (2, 4)
+
+def test_a_lone_request_is_sent_after_the_wait():
+  batcher = MicroBatcher(lambda requests: [ "done" for _ in requests ], 8, 0.1)
+  started = time.monotonic()
+  assert batcher.run("only") == "done"
+  assert 0.1 <= time.monotonic() - started < 2
+
+def test_a_failed_batch_fails_all_of_its_requests():
+  def process_batch(requests):
+    raise ValueError("down")
+
+  batcher = MicroBatcher(process_batch, 2, 60)
+  results = run_concurrently(batcher, [ 1, 2 ])
+  assert all(isinstance(result, ValueError) for result in results)
+  with pytest.raises(ValueError):
+    MicroBatcher(process_batch, 1, 60).run(3)
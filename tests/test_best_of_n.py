@@ -0,0 +1,84 @@
+################################################################################
+# Best-of-N races
+
+import http.server
+import threading
+import time
+
+import pytest
+
+from best_of_n import race
+from inference_client import InferenceClient
+from test_runner import Cancelled
+
+class Result:
+  def __init__(self, result, matrix = None):
+    self.result = result
+    self.matrix = matrix
+    self.error = None
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+  # a generation taking its time, i.e. whatever the server's delay is
+  def do_POST(self):
+    self.rfile.read(int(self.headers["Content-Length"]))
+    time.sleep(self.server.delay)
+    body = b'[{"generated_text": "late"}]'
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+@pytest.fixture
+def slow_server():
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+  server.daemon_threads = True
+  server.delay = 5
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  yield f"http://127.0.0.1:{server.server_address[1]}/"
+  server.shutdown()
+
+def test_first_success_wins_and_the_rest_is_hung_up_on(slow_server):
+  client = InferenceClient(max_retries=0)
+  given_up = []
+
+  def run_candidate(index):
+    if index == 0:
+      time.sleep(0.2)
+      return Result("TEST_SUCCESS"), "winner"
+    try:
+      # a plain, non-streamed generation
+      client.post_json(slow_server, { "inputs": "" })
+    except Cancelled:
+      given_up.append(index)
+      raise
+    return Result("TEST_FAILURE"), "too late"
+
+  started = time.perf_counter()
+  judged, kept, first_success = race(3, run_candidate, workers=3)
+  assert time.perf_counter() - started < 2
+  assert kept[0] == 0 and kept[2] == "winner" and first_success < 2
+  assert [ index for index, _, _ in judged ] == [ 0 ]
+  deadline = time.monotonic() + 2
+  while len(given_up) < 2 and time.monotonic() < deadline:
+    time.sleep(0.05)
+  assert sorted(given_up) == [ 1, 2 ]
+
+def test_closest_is_kept_when_none_passes():
+  matrices = { 0: [ "PASS", "FAIL" ], 1: [ "PASS", "PASS", "PASS", "FAIL" ], 2: [ "FAIL", "FAIL" ] }
+
+  def run_candidate(index):
+    return Result("TEST_FAILURE", [ { "status": status } for status in matrices[index] ]), index
+
+  judged, kept, first_success = race(3, run_candidate, workers=1)
+  assert len(judged) == 3 and kept[0] == 1 and first_success is None
+
+def test_no_candidate_at_all_is_the_schedulers_problem():
+  def run_candidate(index):
+    raise ValueError("no model")
+
+  with pytest.raises(ValueError):
+    race(2, run_candidate)
@@ -0,0 +1,70 @@
+################################################################################
+# Checkpointed and incremental sweeps
+
+import pytest
+
+from checkpoint import Checkpoint
+
+def run(directory, mode, done, complete = False):
+  # a sweep which gets done (submission -> (fingerprint, outcome)), and maybe to the end
+  checkpoint = Checkpoint("sweep", mode, str(directory))
+  for submission, (fingerprint, outcome) in done.items():
+    checkpoint.record(submission, fingerprint, outcome)
+  if complete:
+    checkpoint.complete()
+  return checkpoint
+
+def test_resume_skips_what_the_interrupted_run_did(tmp_path):
+  run(tmp_path, "resume", { "a": ("1", "success"), "b": ("1", "rounds") })
+  checkpoint = Checkpoint("sweep", "resume", str(tmp_path))
+  assert checkpoint.is_done({ "a": "1" })
+  # fingerprints aside
+  assert checkpoint.is_done({ "b": "changed" })
+  assert not checkpoint.is_done({ "c": "1" })
+  # an equivalence class is only skipped as a whole
+  assert not checkpoint.is_done({ "a": "1", "c": "1" })
+  assert checkpoint.skipped == 2
+
+def test_resume_starts_over_after_a_complete_run(tmp_path):
+  run(tmp_path, "resume", { "a": ("1", "success") }, complete=True)
+  checkpoint = Checkpoint("sweep", "resume", str(tmp_path))
+  assert not checkpoint.is_done({ "a": "1" })
+  checkpoint.record("b", "1", "success")
+  assert Checkpoint("sweep", "resume", str(tmp_path)).is_done({ "b": "1" })
+
+def test_incremental_redoes_what_changed(tmp_path):
+  run(tmp_path, "incremental", { "a": ("1", "success"), "b": ("1", "success") }, complete=True)
+  run(tmp_path, "incremental", { "b": ("2", "rounds") }, complete=True)
+  checkpoint = Checkpoint("sweep", "incremental", str(tmp_path))
+  assert checkpoint.is_done({ "a": "1" })
+  assert not checkpoint.is_done({ "a": "2" })
+  # the latest fingerprint it was done with is what counts
+  assert checkpoint.is_done({ "b": "2" })
+  assert not checkpoint.is_done({ "b": "1" })
+
+def test_unsettled_outcomes_are_never_done(tmp_path):
+  run(tmp_path, "resume", { "a": ("1", "inference unavailable"), "b": ("1", "error"), "c": ("1", "sweep deadline") })
+  checkpoint = Checkpoint("sweep", "resume", str(tmp_path))
+  assert not any(checkpoint.is_done({ submission: "1" }) for submission in "abc")
+
+def test_a_line_cut_short_is_ignored(tmp_path):
+  run(tmp_path, "resume", { "a": ("1", "success") })
+  with open(tmp_path / "sweep.jsonl", "a") as checkpoint_file:
+    checkpoint_file.write('{"submission": "b", "fingerp')
+  assert Checkpoint("sweep", "resume", str(tmp_path)).is_done({ "a": "1" })
+
+def test_appending_after_a_line_cut_short(tmp_path):
+  run(tmp_path, "resume", { "a": ("1", "success") })
+  with open(tmp_path / "sweep.jsonl", "a") as checkpoint_file:
+    checkpoint_file.write('{"submission": "b", "fingerp')
+  run(tmp_path, "resume", { "c": ("1", "success") })
+  checkpoint = Checkpoint("sweep", "resume", str(tmp_path))
+  assert checkpoint.is_done({ "a": "1", "c": "1" })
+  assert not checkpoint.is_done({ "b": "1" })
+
+def test_off(tmp_path):
+  checkpoint = run(tmp_path, "", { "a": ("1", "success") }, complete=True)
+  assert not checkpoint.is_done({ "a": "1" })
+  assert not (tmp_path / "sweep.jsonl").exists()
+  with pytest.raises(ValueError):
+    Checkpoint("sweep", "sometimes", str(tmp_path))
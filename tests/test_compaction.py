@@ -0,0 +1,77 @@
+################################################################################
+# Compact repair prompts
+
+from compaction import (
+  compact_compilation_error, compact_diagnostics, compact_rendered, compact_test_failure, cut_line,
+  first_divergence
+)
+
+def diagnostic(message, code = None, level = "error", line = 1, file = "src/main.rs"):
+  return {
+    "level": level, "code": code, "message": message, "file": file, "line": line, "column": 5,
+    "text": "    let x: i32 = \"a\";", "label": "expected `i32`", "notes": []
+  }
+
+class Result:
+  def __init__(self, error, diagnostics = None):
+    self.result = "COMPILER_FAILURE"
+    self.error = error
+    self.diagnostics = diagnostics
+
+def test_errors_only_each_once():
+  blocks = compact_diagnostics([
+    diagnostic("mismatched types", "E0308", line=1),
+    diagnostic("unused variable: `y`", level="warning"),
+    diagnostic("mismatched types", "E0308", line=7),
+    diagnostic("mismatched types", "E0308", line=9),
+    diagnostic("cannot find value `z` in this scope", "E0425"),
+    diagnostic("aborting due to 4 previous errors", file=None),
+  ])
+  assert len(blocks) == 2
+  assert blocks[0].startswith("error[E0308]: mismatched types\n  --> src/main.rs:1:5")
+  assert blocks[0].endswith("(and 2 more times, elsewhere)")
+  assert blocks[1].startswith("error[E0425]: cannot find value `z`")
+
+def test_rendered_errors_each_once():
+  stderr = (
+    "warning: unused variable\n --> src/main.rs:2:9\n\n"
+    "error[E0308]: mismatched types\n --> src/main.rs:3:5\n\n"
+    "error[E0308]: mismatched types\n --> src/main.rs:3:5\n\n"
+    "error: aborting due to 2 previous errors\n"
+  )
+  assert compact_rendered(stderr) == [ "error[E0308]: mismatched types\n --> src/main.rs:3:5" ]
+
+def test_compilation_error_held_to_the_budget(monkeypatch):
+  monkeypatch.setattr("compaction.PROMPT_TOKEN_BUDGET", 0)
+  monkeypatch.setattr("compaction.MIN_FEEDBACK_TOKENS", 60)
+  diagnostics = [ diagnostic(f"error number {i}", f"E{i:04}") for i in range(20) ]
+  compacted = compact_compilation_error(Result("(raw)", diagnostics), "", "")
+  assert "error number 0" in compacted
+  assert "error number 19" not in compacted
+  assert compacted.rstrip().endswith("more errors)")
+
+def test_compaction_off(monkeypatch):
+  monkeypatch.setattr("compaction.COMPACT_PROMPTS", False)
+  assert compact_compilation_error(Result("the whole stderr"), "", "") == "the whole stderr"
+  assert compact_test_failure(("a", "b"), "", "") == ("a", "b")
+
+def test_first_divergence():
+  assert first_divergence("1\n2\n", "1\n2") is None
+  expected_window, actual_window, number, expected_count, actual_count = first_divergence("1\n2\n3\n4\n", "1\n2\nx\n")
+  assert (expected_window, actual_window, number, expected_count, actual_count) == ([ "2", "3" ], [ "2", "x" ], 2, 4, 3)
+  # an output that's too short diverges where it ends
+  assert first_divergence("1\n2\n", "1\n")[:3] == ([ "1", "2" ], [ "1" ], 1)
+
+def test_long_lines_are_cut_around_the_difference():
+  line = "a" * 1000 + "b" + "a" * 1000
+  cut = cut_line(line, 1000, width=20)
+  assert cut.startswith("...") and cut.endswith("...") and "b" in cut and len(cut) == 26
+  assert cut_line("short", 3) == "short"
+
+def test_test_failure_keeps_the_exit_note():
+  expected = "".join(f"line {i}\n" for i in range(100))
+  actual = expected.replace("line 50", "line fifty") + "\n(crashed: SIGSEGV)"
+  compacted_expected, compacted_actual = compact_test_failure((expected, actual), "", "")
+  assert compacted_expected == "line 49\nline 50"
+  assert compacted_actual.startswith("line 49\nline fifty\n(the first difference is on line 51")
+  assert compacted_actual.endswith("\n(crashed: SIGSEGV)")
@@ -0,0 +1,44 @@
+################################################################################
+# Equivalent submissions
+
+from dedup import c_tokens, equivalence_classes, source_key
+
+PROGRAM = """#include <stdio.h>
+int main(void) {
+  int a, b; // two numbers
+  scanf("%d %d", &a, &b);
+  printf("%d\\n", a + b);
+  return 0;
+}
+"""
+
+def test_comments_and_whitespace_dont_matter():
+  reformatted = """#include   <stdio.h>
+/* sums them up */
+int main(void){int a,b;
+scanf("%d %d",&a,&b);printf("%d\\n",a+b);
+    return 0;}
+"""
+  assert source_key(PROGRAM) == source_key(reformatted)
+
+def test_literals_and_code_do():
+  assert source_key(PROGRAM) != source_key(PROGRAM.replace('"%d %d"', '"%d  %d"'))
+  assert source_key(PROGRAM) != source_key(PROGRAM.replace("a + b", "a - b"))
+  assert source_key(PROGRAM) != source_key(PROGRAM.replace("#include <stdio.h>", "#include <stdlib.h>"))
+
+def test_tokens():
+  assert list(c_tokens("x<<=1; // no\ny = 'a' /* nor this */ + \"b c\";")) == [
+    "x", "<<=", "1", ";", "y", "=", "'a'", "+", '"b c"', ";"
+  ]
+  # a directive is a single token, up to its end of line (continuations included)
+  assert list(c_tokens("#define  MAX(a, b) \\\n  ((a) > (b))\nint x;")) == [
+    "#define MAX(a, b) \\ ((a) > (b))", "int", "x", ";"
+  ]
+  # comment markers within a literal are the literal's
+  assert list(c_tokens('puts("// not a comment");')) == [ "puts", "(", '"// not a comment"', ")", ";" ]
+
+def test_equivalence_classes():
+  members = [ ("a", PROGRAM), ("b", PROGRAM.replace("  ", "\t")), ("c", PROGRAM.replace("+", "*")) ]
+  classes = equivalence_classes(members, lambda member: member[1])
+  assert [ [ name for name, _ in members ] for members in classes ] == [ [ "a", "b" ], [ "c" ] ]
+  assert len(equivalence_classes(members, lambda member: member[1], dedup=False)) == 3
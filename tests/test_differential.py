@@ -0,0 +1,71 @@
+################################################################################
+# Differential testing
+#
+# (test_runner's TestCase and TestReport are used through the module, or pytest takes them for tests)
+
+import threading
+import time
+
+from differential import DifferentialStats, DifferentialSuite, check_differential, run_differential
+import test_runner
+from test_runner import CANCELLED, FAIL, PASS, CaseResult
+from verdict_cache import VerdictCache
+
+def suite(count):
+  return DifferentialSuite([ test_runner.TestCase(f"differential/{i}", f"{i}\n", f"{i}\n") for i in range(count) ])
+
+def matrix(wrong = (), calls = None):
+  # a translation which gets the inputs in wrong wrong, as run_matrix would run it
+  def run_matrix(cases):
+    if calls is not None:
+      calls.append(len(cases))
+    return test_runner.TestReport([
+      CaseResult(case.name, FAIL if case.input_data in wrong else PASS, 0.0, case.expected_output, "x\n")
+      for case in cases
+    ])
+  return run_matrix
+
+def test_the_first_batch_with_a_divergence_is_the_last():
+  calls = []
+  divergences, tested = run_differential(suite(10), matrix({ "4\n", "5\n", "6\n" }, calls), batch=3, report=2)
+  assert calls == [ 3, 3 ] and tested == 6
+  assert [ divergence.name for divergence in divergences ] == [ "differential/4", "differential/5" ]
+
+def test_cancelled_inputs_arent_counted():
+  def run_matrix(cases):
+    return test_runner.TestReport([ CaseResult(case.name, CANCELLED) for case in cases ])
+  assert run_differential(suite(4), run_matrix, batch=10) == ([], 0)
+
+def test_the_same_translation_isnt_run_twice(tmp_path, monkeypatch):
+  monkeypatch.setattr("differential.DIFFERENTIAL", True)
+  monkeypatch.setattr("differential.verdict_cache", VerdictCache(str(tmp_path)))
+  the_suite = suite(5)
+  monkeypatch.setattr("differential.get_differential_suite", lambda index: the_suite)
+  stats = DifferentialStats()
+  monkeypatch.setattr("differential.differential_stats", stats)
+  calls = []
+  first = check_differential("s", None, matrix({ "2\n" }, calls), "key")
+  again = check_differential("s", None, matrix({ "2\n" }, calls), "key")
+  assert len(calls) == 1
+  assert [ (divergence.name, divergence.status) for divergence in again ] == [ (divergence.name, divergence.status) for divergence in first ]
+  # another translation is, though
+  check_differential("t", None, matrix((), calls), "another key")
+  assert len(calls) == 2
+  assert (stats.translations, stats.cached, stats.divergent, stats.inputs) == (3, 1, 2, 10)
+
+def test_throughput_is_over_wall_clock_time():
+  stats = DifferentialStats()
+
+  def run():
+    with stats.timing():
+      time.sleep(0.2)
+    stats.record(100, False)
+
+  threads = [ threading.Thread(target=run) for _ in range(4) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  # four at once take 0.2s, not 0.8s
+  assert 0.2 <= stats.seconds < 0.5
+  assert stats.inputs == 400
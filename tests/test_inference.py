@@ -0,0 +1,39 @@
+################################################################################
+# Streamed generation, cut at the end of the code
+
+from inference import GenerationRequest, StreamStats, code_block_closed, stream_until_code_closes
+
+class TokenBackend:
+  # A backend streaming the given tokens, and keeping track of how many were asked for
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.sent = 0
+
+  def stream(self, request):
+    for token in self.tokens:
+      self.sent += 1
+      yield token
+
+def stream(tokens, fence):
+  backend = TokenBackend(tokens)
+  text = stream_until_code_closes(GenerationRequest("", None, None, {}, backend), fence, StreamStats())
+  return text, backend.sent
+
+def test_code_block_closed():
+  assert not code_block_closed("Here it is:\n```rust\nfn main() {}\n", "```rust")
+  assert code_block_closed("```rust\nfn main() {}\n```", "```rust")
+  assert code_block_closed("```rust\nfn main() {}<|end|>", "```rust")
+  # the C code echoed back first isn't the translation
+  assert not code_block_closed("```c\nint main() {}\n```\nIn Rust:\n", "```rust")
+  assert not code_block_closed("<|end|> ```c\n```", "```python")
+
+def test_stream_stops_after_the_targets_own_block():
+  tokens = [ "```c\n", "int main() {}\n", "```\n", "```rust\n", "fn main() {}\n", "```", "\nThat's it.", " Bye." ]
+  text, sent = stream(tokens, "```rust")
+  assert text == "".join(tokens[:6]) and sent == 6
+  # which perform_query then gets the code out of
+  assert text.partition("```rust")[2].partition("```")[0] == "\nfn main() {}\n"
+
+def test_stream_without_a_closing_fence_runs_to_the_end():
+  tokens = [ "```python\n", "print(1)\n" ]
+  assert stream(tokens, "```python") == ("".join(tokens), 2)
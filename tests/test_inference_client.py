@@ -0,0 +1,70 @@
+################################################################################
+# Shared HTTP client for the inference API
+
+import http.server
+import threading
+
+import pytest
+
+from inference_client import ClientStats, InferenceClient, InferenceError, InferenceUnavailable
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+  # answers with the server's statuses, one per request, then 200s
+  protocol_version = "HTTP/1.1"
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers["Content-Length"]))
+    with self.server.lock:
+      self.server.requests += 1
+      status = self.server.statuses.pop(0) if self.server.statuses else 200
+    body = b'[{"generated_text": "ok"}]' if status == 200 else b"not now"
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+@pytest.fixture
+def server():
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+  server.lock = threading.Lock()
+  server.statuses = []
+  server.requests = 0
+  server.url = f"http://127.0.0.1:{server.server_address[1]}/model"
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield server
+  server.shutdown()
+  server.server_close()
+
+def client(max_retries = 3):
+  return InferenceClient(max_retries=max_retries, backoff_base=0.001, backoff_cap=0.01, stats=ClientStats())
+
+def test_a_503_is_retried(server):
+  server.statuses = [ 503, 429 ]
+  inference = client()
+  assert inference.post_json(server.url, { "inputs": "x" }) == [ { "generated_text": "ok" } ]
+  assert server.requests == 3
+  assert (inference.stats.retries, inference.stats.throttled) == (2, 1)
+
+def test_unavailable_after_every_retry(server):
+  server.statuses = [ 503 ] * 10
+  with pytest.raises(InferenceUnavailable):
+    client(max_retries=2).post_json(server.url, { "inputs": "x" })
+  assert server.requests == 3
+
+def test_a_bad_request_isnt_retried(server):
+  server.statuses = [ 400 ]
+  with pytest.raises(InferenceError) as raised:
+    client().post_json(server.url, { "inputs": "x" })
+  assert not isinstance(raised.value, InferenceUnavailable)
+  assert server.requests == 1
+
+def test_connections_are_reused(server):
+  inference = client()
+  for _ in range(3):
+    inference.post_json(server.url, { "inputs": "x" })
+  assert (inference.stats.requests, inference.stats.connections) == (3, 1)
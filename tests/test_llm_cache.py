@@ -0,0 +1,58 @@
+################################################################################
+# On-disk cache for the model's replies
+
+import os
+import time
+
+from llm_cache import ResponseCache
+
+class Backend:
+  def __init__(self, cache_namespace = None):
+    self.cache_namespace = cache_namespace
+
+class Model:
+  def __init__(self, model_kwargs, backend = None):
+    self.repo_id = "some/model"
+    self.model_kwargs = model_kwargs
+    self.backend = backend or Backend()
+
+class Prompt:
+  template = "Translate {code}"
+
+class Chain:
+  # what ResponseCache.run needs of an inference.ClientChain
+  def __init__(self, seed = 1, backend = None):
+    self.prompt = Prompt()
+    self.llm = Model({ "seed": seed }, backend)
+    self.calls = 0
+
+  def run(self, inputs):
+    self.calls += 1
+    return f"reply {self.calls} to {inputs['code']}"
+
+def test_a_query_is_only_made_once(tmp_path):
+  cache = ResponseCache(str(tmp_path), enabled=True)
+  chain = Chain()
+  assert cache.run(chain, { "code": "a" }) == "reply 1 to a"
+  assert cache.run(chain, { "code": "a" }) == "reply 1 to a"
+  assert cache.run(chain, { "code": "b" }) == "reply 2 to b"
+  assert (chain.calls, cache.hits, cache.misses) == (2, 1, 2)
+  # and the next run finds it on disk
+  assert ResponseCache(str(tmp_path), enabled=True).run(Chain(), { "code": "a" }) == "reply 1 to a"
+
+def test_other_parameters_or_backends_dont_share_replies(tmp_path):
+  cache = ResponseCache(str(tmp_path), enabled=True)
+  key = cache.key(Chain(seed=1), { "code": "a" })
+  assert cache.key(Chain(seed=2), { "code": "a" }) != key
+  assert cache.key(Chain(seed=1, backend=Backend("standin")), { "code": "a" }) != key
+
+def test_the_least_recently_used_go_first(tmp_path):
+  cache = ResponseCache(str(tmp_path), enabled=True)
+  for name in ("old", "used", "new"):
+    cache.put(name, "x" * 100)
+    time.sleep(0.01)
+  cache.get("used")
+  cache.max_bytes = 2 * os.path.getsize(cache.path("new"))
+  cache.put("newest", "x" * 100)
+  assert set(cache.entries) == { "used", "newest" }
+  assert not os.path.exists(cache.path("old")) and not os.path.exists(cache.path("new"))
@@ -0,0 +1,62 @@
+################################################################################
+# Scoring against the reference programs, and the memory they're scored on
+#
+# (test_runner's TestCase is used through the module, or pytest takes it for a test)
+
+import shutil
+
+import pytest
+
+import memory_probe
+import test_runner
+from reference import score
+
+def cases(*references):
+  # (runtime, memory) of the reference on each case
+  made = []
+  for i, (runtime, memory) in enumerate(references):
+    case = test_runner.TestCase(f"blackbox/{i}", "", "")
+    case.reference_runtime, case.reference_memory = runtime, memory
+    made.append(case)
+  return made
+
+def row(i, runtime, memory = None):
+  return { "name": f"blackbox/{i}", "status": test_runner.PASS, "runtime": runtime, "memory": memory }
+
+def test_runtimes_below_the_noise_floor_are_the_same():
+  # a millisecond for the reference, on its own, four under load for the translation
+  performance = score([ row(0, 0.004), row(1, 0.003) ], cases((0.001, None), (0.001, None)), floor=0.02)
+  assert performance.slowdown == 1.0 and performance.worst_slowdown == 1.0
+  assert not performance.regression and performance.memory_ratio is None
+
+def test_a_slowdown_above_the_floor_is_a_regression():
+  performance = score(
+    [ row(0, 0.01), row(1, 2.0) ], cases((0.001, None), (0.1, None)), threshold=10, allowance=0, floor=0.02
+  )
+  assert performance.worst_case == "blackbox/1" and performance.worst_slowdown == pytest.approx(20)
+  assert performance.regression
+
+def test_memory_is_only_compared_where_both_are_known():
+  performance = score(
+    [ row(0, 0.1, 4000), row(1, 0.1, None), row(2, 0.1, 90000) ],
+    cases((0.1, 1000), (0.1, 2000), (0.1, None)), floor=0.02
+  )
+  assert performance.memory_ratio == 4.0
+
+@pytest.mark.skipif(shutil.which(memory_probe.CC) is None, reason="no C compiler for the memory probe")
+def test_the_probe_reports_the_programs_own_peak(tmp_path, monkeypatch):
+  monkeypatch.setattr(memory_probe, "MEMORY_PROBE_DIR", str(tmp_path))
+  monkeypatch.setattr(memory_probe, "probe_built", False)
+  monkeypatch.setattr(memory_probe, "probe_path", None)
+  case = test_runner.TestCase("blackbox/1", "", "")
+
+  def run(command):
+    return test_runner.run_case(command, case, str(tmp_path), False, 5, test_runner.Cancellation())
+
+  small, large = run([ "true" ]), run([ "python3", "-c", "block = bytearray(64 * 1024 * 1024)" ])
+  # nothing like the pytest process it was started from, which has all of this in it
+  assert small.memory < 16 * 1024
+  assert large.memory > 64 * 1024
+  # and the command still exits just like it would have without the probe
+  assert run([ "sh", "-c", "exit 3" ]).returncode == 3
+  assert run([ "sh", "-c", "kill -SEGV $$" ]).returncode == -11
@@ -0,0 +1,148 @@
+################################################################################
+# Repair loop: a submission's state machine, its budget, and the scheduler's accounting
+
+import threading
+
+from inference_client import InferenceUnavailable
+from repair import DONE, REPAIR, TRANSLATE, Repair, RepairBudget, RepairScheduler, closeness
+
+class Result:
+  # What the loop needs of a QueryResult (see engine)
+  def __init__(self, result, matrix = None, error = None):
+    self.result = result
+    self.matrix = matrix
+    self.error = error
+
+def repair(name = "s", max_rounds = 2, max_tokens = 0, deadline = 0):
+  return Repair(name, "int main() {}", None, RepairBudget(max_rounds, max_tokens, deadline))
+
+def test_first_translation_passing_is_done():
+  submission = repair()
+  assert submission.state == TRANSLATE and submission.attempt() == 0 and submission.feedback() is None
+  submission.advance(Result("TEST_SUCCESS"), 10)
+  assert (submission.state, submission.outcome, submission.rounds, submission.tokens) == (DONE, "success", 0, 10)
+
+def test_failures_are_repaired_until_the_rounds_run_out():
+  submission = repair(max_rounds=2)
+  submission.advance(Result("COMPILER_FAILURE"), 1)
+  assert submission.state == REPAIR and submission.feedback() == "COMPILER_FAILURE" and submission.attempt() == 1
+  submission.advance(Result("TEST_FAILURE"), 1)
+  assert submission.state == REPAIR and submission.feedback() == "TEST_FAILURE" and submission.attempt() == 2
+  submission.advance(Result("TEST_FAILURE"), 1)
+  assert (submission.state, submission.outcome, submission.rounds) == (DONE, "rounds", 2)
+
+def test_a_repair_can_still_pass_on_its_last_round():
+  submission = repair(max_rounds=1)
+  submission.advance(Result("TEST_FAILURE"), 1)
+  submission.advance(Result("TEST_SUCCESS"), 1)
+  assert (submission.outcome, submission.rounds) == ("success", 1)
+
+def test_no_repair_rounds_at_all():
+  submission = repair(max_rounds=0)
+  submission.advance(Result("TEST_FAILURE"), 1)
+  assert (submission.state, submission.outcome) == (DONE, "rounds")
+
+def test_token_budget():
+  submission = repair(max_rounds=10, max_tokens=100)
+  submission.advance(Result("TEST_FAILURE"), 60)
+  assert submission.state == REPAIR
+  submission.advance(Result("TEST_FAILURE"), 60)
+  assert (submission.outcome, submission.tokens) == ("tokens", 120)
+
+def test_deadline():
+  submission = repair(max_rounds=10, deadline=5)
+  submission.advance(Result("TEST_FAILURE"), 1, 3)
+  assert submission.state == REPAIR
+  submission.advance(Result("TEST_FAILURE"), 1, 3)
+  assert (submission.outcome, submission.elapsed) == ("deadline", 6)
+
+def test_deadline_counts_only_its_own_rounds(monkeypatch):
+  # however long the first translations of everybody else take, a submission's repairs
+  # only spend its own time
+  clock = [ 0.0 ]
+  monkeypatch.setattr("repair.time.monotonic", lambda: clock[0])
+  submissions = [ repair(name, max_rounds=2, deadline=5) for name in "abcd" ]
+
+  def run_round(submission):
+    clock[0] += 2
+    return Result("TEST_FAILURE"), 1
+
+  scheduler = RepairScheduler(run_round, lambda submission: None, workers=1)
+  scheduler.run(submissions)
+  assert scheduler.outcomes == { "rounds": 4 }
+  assert all(submission.elapsed == 6 for submission in submissions)
+
+def test_closeness():
+  matrix = [ { "status": "PASS" }, { "status": "PASS" }, { "status": "FAIL" }, { "status": "CANCELLED" } ]
+  assert closeness(Result("TEST_FAILURE", matrix)) == 3 / 5
+  assert closeness(Result("COMPILER_FAILURE", error="error[E0308]: a\nerror: b\nerror: aborting due to 2 previous errors")) == 1 / 3
+  assert closeness(Result("COMPILER_FAILURE", error="error: a")) > closeness(Result("COMPILER_FAILURE", error="error: a\nerror: b"))
+
+def run_scheduler(submissions, verdicts, workers = 2, sweep_deadline = 0):
+  # verdicts is name -> [ the result of each round, in order ], or an exception to raise
+  lock = threading.Lock()
+  rounds = []
+  done = []
+
+  def run_round(submission):
+    with lock:
+      rounds.append((submission.name, submission.feedback()))
+    verdict = verdicts[submission.name][submission.attempt()]
+    if isinstance(verdict, Exception):
+      raise verdict
+    return Result(verdict), 5
+
+  scheduler = RepairScheduler(run_round, done.append, workers=workers, sweep_deadline=sweep_deadline)
+  scheduler.run(submissions)
+  return scheduler, rounds, done
+
+def test_scheduler_accounting():
+  submissions = [ repair("a"), repair("b"), repair("c"), repair("d") ]
+  scheduler, rounds, done = run_scheduler(submissions, {
+    "a": [ "TEST_SUCCESS" ],
+    "b": [ "COMPILER_FAILURE", "TEST_SUCCESS" ],
+    "c": [ "TEST_FAILURE", "TEST_FAILURE", "TEST_FAILURE" ],
+    "d": [ "COMPILER_FAILURE", "TEST_FAILURE", "TEST_SUCCESS" ],
+  })
+  # every submission is done exactly once
+  assert sorted([ submission.name for submission in done ]) == [ "a", "b", "c", "d" ]
+  assert all(submission.state == DONE for submission in submissions)
+  assert scheduler.outcomes == { "success": 3, "rounds": 1 }
+  assert scheduler.repairs == { "COMPILER_FAILURE": [ 1, 2 ], "TEST_FAILURE": [ 1, 3 ] }
+  assert len(rounds) == 1 + 2 + 3 + 3
+  assert [ submission.tokens for submission in submissions ] == [ 5, 10, 15, 15 ]
+
+def test_first_translations_go_before_repairs():
+  submissions = [ repair(name) for name in "abc" ]
+  _, rounds, _ = run_scheduler(
+    submissions, { name: [ "TEST_FAILURE", "TEST_SUCCESS" ] for name in "abc" }, workers=1
+  )
+  assert [ feedback for _, feedback in rounds ] == [ None ] * 3 + [ "TEST_FAILURE" ] * 3
+
+def test_scheduler_gives_up_on_unavailable_inference_and_errors():
+  submissions = [ repair("a"), repair("b"), repair("c") ]
+  scheduler, _, done = run_scheduler(submissions, {
+    "a": [ InferenceUnavailable("down") ],
+    "b": [ "TEST_FAILURE", RuntimeError("harness") ],
+    "c": [ "TEST_SUCCESS" ],
+  })
+  assert len(done) == 3
+  assert { submission.name: submission.outcome for submission in submissions } == {
+    "a": "inference unavailable", "b": "error", "c": "success"
+  }
+  # a round which didn't come back isn't a repair tried
+  assert scheduler.repairs["TEST_FAILURE"] == [ 0, 0 ]
+
+def test_sweep_deadline_stops_repairs(monkeypatch):
+  monkeypatch.setattr("repair.time.monotonic", lambda: 0)
+  submissions = [ repair("a"), repair("b") ]
+
+  def run_round(submission):
+    # the sweep's deadline is past as soon as the first translations are in
+    monkeypatch.setattr("repair.time.monotonic", lambda: 100)
+    return Result("TEST_FAILURE"), 1
+
+  scheduler = RepairScheduler(run_round, lambda submission: None, workers=1, sweep_deadline=10)
+  scheduler.run(submissions)
+  assert scheduler.outcomes == { "sweep deadline": 2 }
+  assert all(submission.rounds == 0 for submission in submissions)
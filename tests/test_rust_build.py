@@ -0,0 +1,29 @@
+################################################################################
+# Batched compilation
+
+import os
+import shutil
+
+import pytest
+
+from rust_build import build_batch
+
+pytestmark = pytest.mark.skipif(shutil.which("cargo") is None, reason="needs cargo")
+
+def translation(directory, code):
+  os.makedirs(directory + "/src")
+  with open(directory + "/src/main.rs", "w") as main:
+    main.write(code)
+  return directory
+
+def test_batch_paths_look_like_rustc_src_main_rs(tmp_path, monkeypatch):
+  monkeypatch.setattr("rust_build.BATCH_BUILD_DIR", str(tmp_path / "batch"))
+  os.makedirs(tmp_path / "src")
+  # the engine's output directories go through src/.. (see engine.Target)
+  broken = translation(str(tmp_path / "src/../data/broken"), 'fn main() { let x: i32 = "a"; }\n')
+  fine = translation(str(tmp_path / "src/../data/fine"), 'fn main() { println!("hi"); }\n')
+  broken_result, fine_result = build_batch([ broken, fine ])
+  assert broken_result.returncode == 1
+  assert " --> src/main.rs:1:" in broken_result.stderr and str(tmp_path) not in broken_result.stderr
+  assert broken_result.diagnostics[0]["file"] == "src/main.rs"
+  assert fine_result.returncode == 0 and os.path.exists(fine + "/main")
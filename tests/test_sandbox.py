@@ -0,0 +1,60 @@
+################################################################################
+# Resource limits for the translated programs
+#
+# (test_runner's TestCase is used through the module, or pytest takes it for a test)
+
+import resource
+import signal
+
+import pytest
+
+import sandbox
+import test_runner
+from sandbox import describe_exit, limits
+from test_runner import CRASH, PASS, TIMEOUT
+
+@pytest.fixture(params=[ "prlimit", "preexec_fn" ])
+def sandboxed(request, monkeypatch):
+  # both ways the limits can be set
+  monkeypatch.setattr(sandbox, "SANDBOX", True)
+  if request.param == "preexec_fn":
+    monkeypatch.setattr(sandbox, "PRLIMIT", None)
+  elif sandbox.PRLIMIT is None:
+    pytest.skip("no prlimit")
+  return monkeypatch
+
+def run(command, tmp_path, timeout = 5):
+  case = test_runner.TestCase("blackbox/1", "", "ok\n")
+  case.timeout = timeout
+  return test_runner.run_case(command, case, str(tmp_path), False, timeout, test_runner.Cancellation())
+
+def test_output_is_capped(sandboxed, tmp_path):
+  sandboxed.setattr(sandbox, "SANDBOX_OUTPUT_BYTES", 4096)
+  result = run([ "yes" ], tmp_path)
+  assert result.status == CRASH and result.returncode == -signal.SIGXFSZ
+  assert len(result.actual_output) == 4096
+
+def test_memory_is_capped(sandboxed, tmp_path):
+  sandboxed.setattr(sandbox, "SANDBOX_MEMORY_MB", 256)
+  result = run([ "python3", "-c", "block = bytearray(512 * 1024 * 1024)" ], tmp_path)
+  assert result.status == CRASH and "MemoryError" in result.stderr
+
+def test_a_busy_loop_is_a_timeout_even_without_the_wall_clock(sandboxed, tmp_path):
+  # the CPU limit is the timeout's, rounded up, plus a second
+  result = run([ "sh", "-c", "while :; do :; done" ], tmp_path, timeout=0.2)
+  assert result.status == TIMEOUT
+
+def test_a_program_within_its_limits_runs_as_usual(sandboxed, tmp_path):
+  assert run([ "sh", "-c", "echo ok" ], tmp_path).status == PASS
+
+def test_limits_never_go_above_the_hard_ones(monkeypatch):
+  monkeypatch.setattr(sandbox, "SANDBOX_OUTPUT_BYTES", 1 << 40)
+  _, hard = resource.getrlimit(resource.RLIMIT_FSIZE)
+  chosen = dict(limits(1))[resource.RLIMIT_FSIZE]
+  assert hard == resource.RLIM_INFINITY or chosen == (hard, hard)
+  assert dict(limits(1.5))[resource.RLIMIT_CPU] == (3, 4)
+
+def test_describe_exit():
+  assert describe_exit(101) == "exit code 101"
+  assert describe_exit(-signal.SIGXFSZ) == "SIGXFSZ (output limit)"
+  assert describe_exit(-signal.SIGSEGV) == "SIGSEGV"
@@ -0,0 +1,27 @@
+################################################################################
+# Run totals
+
+import threading
+
+from sweep import Totals
+
+def test_record():
+  totals = Totals()
+  totals.record("COMPILER_FAILURE")
+  totals.record("TEST_FAILURE", 3)
+  totals.record("TEST_SUCCESS", 2)
+  assert totals.snapshot() == (1, 3, 2)
+
+def test_concurrent_records_all_count():
+  totals = Totals()
+
+  def record():
+    for _ in range(1000):
+      totals.record("TEST_SUCCESS")
+
+  threads = [ threading.Thread(target=record) for _ in range(8) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert totals.snapshot() == (0, 0, 8000)
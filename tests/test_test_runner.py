@@ -0,0 +1,40 @@
+################################################################################
+# Parallel test runner
+#
+# (TestCase and TestReport are used through the module, or pytest takes them for tests)
+
+import time
+
+import test_runner
+from test_runner import CANCELLED, CRASH, FAIL, PASS, TIMEOUT
+
+# a program that does whatever its input says
+PROGRAM = [ "sh", "-c", "read what; case $what in pass) echo ok;; fail) echo no;; crash) kill -SEGV $$;; *) sleep 10;; esac" ]
+
+def case(what, timeout = None):
+  made = test_runner.TestCase(f"blackbox/{what}", what + "\n", "ok\n")
+  made.timeout = timeout
+  return made
+
+def test_every_case_gets_its_own_verdict_in_order(tmp_path):
+  cases = [ case("fail"), case("pass"), case("crash"), case("hang", timeout=0.5) ]
+  report = test_runner.run_test_matrix(PROGRAM, cases, str(tmp_path), workers=4, trace=False)
+  assert [ result.status for result in report.results ] == [ FAIL, PASS, CRASH, TIMEOUT ]
+  assert report.first_failure().name == "blackbox/fail"
+  assert report.counts() == { FAIL: 1, PASS: 1, CRASH: 1, TIMEOUT: 1 }
+  assert [ row["name"] for row in report.matrix() ] == [ each.name for each in cases ]
+
+def test_fail_fast_cancels_whatever_is_still_running(tmp_path):
+  cases = [ case("hang", timeout=5), case("hang", timeout=5), case("fail") ]
+  started = time.monotonic()
+  report = test_runner.run_test_matrix(PROGRAM, cases, str(tmp_path), fail_fast=True, workers=3, trace=False)
+  assert time.monotonic() - started < 3
+  assert [ result.status for result in report.results ] == [ CANCELLED, CANCELLED, FAIL ]
+  assert not report.passed()
+
+def test_the_feedback_says_how_a_case_went_wrong(tmp_path):
+  crashed, timed_out = test_runner.run_test_matrix(
+    PROGRAM, [ case("crash"), case("hang", timeout=0.5) ], str(tmp_path), workers=2, trace=False
+  ).results
+  assert crashed.feedback_output() == "\n(crashed: SIGSEGV)"
+  assert timed_out.feedback_output().startswith("\n(timed out: killed after 0.5s)")
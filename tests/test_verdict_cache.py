@@ -0,0 +1,73 @@
+################################################################################
+# Verdict (and binary) cache
+#
+# (test_runner's TestCase is used through the module, or pytest takes it for a test)
+
+import test_runner
+from verdict_cache import VerdictCache, verdict_key
+
+class Index:
+  # what verdict_key needs of a test_index.TestIndex
+  def __init__(self, cases):
+    self.cases = cases
+    self.hash = "tests"
+
+class Result:
+  def __init__(self, result, outputs = None):
+    self.result = result
+    self.outputs = outputs
+
+def evaluated(calls, result, binary_path = None):
+  def evaluate():
+    calls.append(result)
+    if binary_path is not None:
+      binary_path.write_bytes(b"binary")
+    return Result(result, [ b"raw\n" ])
+  return evaluate
+
+def test_hit_on_the_same_source_and_miss_on_another(tmp_path):
+  source = tmp_path / "main.rs"
+  source.write_text("fn main() {}\n")
+  index = Index([ test_runner.TestCase("blackbox/1", "", "") ])
+  cache = VerdictCache(str(tmp_path / "cache"), enabled=True)
+  calls = []
+
+  first, cached = cache.run(verdict_key(str(source), "rustc 1.0", index), evaluated(calls, "TEST_SUCCESS"), Result)
+  assert (first.result, cached) == ("TEST_SUCCESS", False)
+  again, cached = cache.run(verdict_key(str(source), "rustc 1.0", index), evaluated(calls, "TEST_SUCCESS"), Result)
+  # raw bytes (the rust sweep's) come back as text
+  assert (again.result, again.outputs, cached) == ("TEST_SUCCESS", [ "raw\n" ], True)
+
+  source.write_text("fn main() { panic!() }\n")
+  changed, cached = cache.run(verdict_key(str(source), "rustc 1.0", index), evaluated(calls, "TEST_FAILURE"), Result)
+  assert (changed.result, cached) == ("TEST_FAILURE", False)
+  assert calls == [ "TEST_SUCCESS", "TEST_FAILURE" ]
+  assert (cache.hits, cache.misses) == (1, 2)
+
+def test_the_key_changes_with_the_timeouts_and_the_toolchain(tmp_path):
+  source = tmp_path / "main.rs"
+  source.write_text("fn main() {}\n")
+  case = test_runner.TestCase("blackbox/1", "", "")
+  index = Index([ case ])
+  before = verdict_key(str(source), "rustc 1.0", index)
+  assert verdict_key(str(source), "rustc 1.1", index) != before
+  case.timeout = 0.5
+  assert verdict_key(str(source), "rustc 1.0", index) != before
+
+def test_the_binary_comes_back_but_not_a_failed_compilations(tmp_path):
+  source = tmp_path / "main.rs"
+  source.write_text("fn main() {}\n")
+  key = verdict_key(str(source), "rustc 1.0", Index([]))
+  cache = VerdictCache(str(tmp_path / "cache"), enabled=True)
+  binary = tmp_path / "main"
+  cache.run(key, evaluated([], "TEST_SUCCESS", binary), Result, str(binary))
+  binary.unlink()
+  cache.run(key, evaluated([], "TEST_SUCCESS"), Result, str(binary))
+  assert binary.read_bytes() == b"binary"
+
+  source.write_text("fn main() {\n")
+  key = verdict_key(str(source), "rustc 1.0", Index([]))
+  cache.run(key, evaluated([], "COMPILER_FAILURE", binary), Result, str(binary))
+  binary.unlink()
+  cache.run(key, evaluated([], "COMPILER_FAILURE"), Result, str(binary))
+  assert not binary.exists()
@@ -0,0 +1,44 @@
+################################################################################
+# Warm-interpreter test runner
+#
+# (test_runner's TestCase is used through the module, or pytest takes it for a test)
+
+import test_runner
+from test_runner import CRASH, FAIL, PASS, TIMEOUT, run_test_matrix
+from warm_runner import PYTHON, run_warm_test_matrix
+
+PROGRAM = """import sys, time
+what = input()
+if what == "pass":
+  print("ok")
+elif what == "fail":
+  print("no")
+elif what == "exit":
+  print("ok", end="")
+  sys.exit(3)
+elif what == "raise":
+  raise ValueError("no")
+else:
+  time.sleep(10)
+"""
+
+def test_same_verdicts_as_a_subprocess_per_case(tmp_path):
+  (tmp_path / "main.py").write_text(PROGRAM)
+  cases = []
+  for what in ("pass", "fail", "exit", "raise", "hang"):
+    cases.append(test_runner.TestCase(f"blackbox/{what}", what + "\n", "ok\n"))
+    cases[-1].timeout = 1
+  cold = run_test_matrix([ PYTHON, "main.py" ], cases, str(tmp_path), text=True, workers=5, trace=False)
+  warm = run_warm_test_matrix("main.py", cases, str(tmp_path), workers=5, trace=False)
+  assert [ result.status for result in warm.results ] == [ PASS, FAIL, CRASH, CRASH, TIMEOUT ]
+  assert [ result.status for result in warm.results ] == [ result.status for result in cold.results ]
+  for warm_result, cold_result in zip(warm.results[:4], cold.results[:4]):
+    assert (warm_result.actual_output, warm_result.returncode) == (cold_result.actual_output, cold_result.returncode)
+  assert "ValueError: no" in warm.results[3].stderr
+
+def test_a_rewritten_script_is_never_run_stale(tmp_path):
+  case = test_runner.TestCase("blackbox/1", "\n", "ok\n")
+  (tmp_path / "main.py").write_text("input()\nprint('no')\n")
+  assert run_warm_test_matrix("main.py", [ case ], str(tmp_path), trace=False).results[0].status == FAIL
+  (tmp_path / "main.py").write_text("input()\nprint('ok')\n")
+  assert run_warm_test_matrix("main.py", [ case ], str(tmp_path), trace=False).results[0].status == PASS